@@ -5,6 +5,7 @@
 
 import threading
 import sys
+import os
 
 import time
 import socket
@@ -13,10 +14,13 @@ import signal
 import pygame
 
 from communication import communication, connect_to_server, message
+from communication.inbox import Inbox
+from maze.movement import merge_state_deltas
 
 from scenes.login_scene import LoginScene
 from scenes.menu_scene import MenuScene
 from scenes.game_scene import GameScene
+from scenes.spectator_scene import SpectatorScene
 from scenes.scene import SceneManager
 
 from exceptions.my_exceptions import CommunicationError
@@ -36,15 +40,24 @@ pygame.init()
 RUNNING = True
 
 PORT = 65432
-SERVER_ADDRESS = connect_to_server.check_server_status()
-if not SERVER_ADDRESS:
-    print("Server is not running")
+try:
+    SERVER_ADDRESS = connect_to_server.server_from_environment(PORT)
+except ValueError as error:
+    print(error)
     sys.exit(1)
 
+if SERVER_ADDRESS is None:
+    SERVER_IP = connect_to_server.check_server_status()
+    if not SERVER_IP:
+        print("Server is not running")
+        sys.exit(1)
+    SERVER_ADDRESS = (SERVER_IP, PORT)
+
 client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client.connect((SERVER_ADDRESS, PORT))
+client.connect(SERVER_ADDRESS)
 
 config.client = client
+config.inbox = Inbox(coalesce={"game_state_delta": merge_state_deltas})
 
 screen_info = pygame.display.Info()
 config.window_width = screen_info.current_w // 2
@@ -58,6 +71,8 @@ config.scene_manager = SceneManager()
 config.scene_manager.add_scene("LoginScene", LoginScene(config.scene_manager.switch_scene))
 config.scene_manager.add_scene("MenuScene", MenuScene(config.scene_manager.switch_scene))
 config.scene_manager.add_scene("GameScene", GameScene(config.scene_manager.switch_scene))
+config.scene_manager.add_scene("SpectatorScene",
+                               SpectatorScene(config.scene_manager.switch_scene))
 
 config.scene_manager.switch_scene("LoginScene")
 
@@ -69,20 +84,45 @@ if len(sys.argv) > 1:
 
 def listen_for_messages():
     """
-        Listens for incoming messages from the server and handles them.
+        Listens for incoming messages from the server and puts them into the inbox.
+        They are handled by the main thread in dispatch_messages.
     """
     global RUNNING
 
     while not stop_event.is_set():
         try:
-            server_message = communication.load_object(client)
-            config.scene_manager.current_scene.handle_loaded_object(server_message)
+            serialized_data = communication.load_data(client)
+            received = config.tracer.now()
+            server_message = communication.decode_data(serialized_data)
+            config.tracer.complete("decode", received, info=getattr(server_message, "info", None),
+                                   bytes=len(serialized_data) + 4)
+
+            if getattr(server_message, "info", None) == "heartbeat":
+                config.latency.answer_received(server_message.data)
+                continue
+
+            config.inbox.put(server_message)
         except CommunicationError:
             print("Server closed the connection")
             RUNNING = False
             break
 
 
+def dispatch_messages(loaded_message):
+    """Passes the message from the inbox to the scene which is active at the moment."""
+    with config.tracer.span(f"handle {loaded_message.info}"):
+        config.scene_manager.current_scene.handle_loaded_object(loaded_message)
+
+
+def export_trace():
+    """Writes the recorded trace events into a file in the Chrome trace format."""
+    name = config.CLIENT_NAME or "client"
+    path = os.path.join(config.TRACE_DIRECTORY,
+                        f"trace-{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    config.tracer.write(path)
+    print(f"Trace written to {path}")
+
+
 def log_out():
     """
         Function that is called at the end of the program to tell
@@ -95,28 +135,27 @@ def log_out():
     communication.send_object(mess, client)
 
 
-def user_count_change(data):
-    """
-        Function that is called when some player has left or joined.
-    """
-    config.users_names = data
-    config.users_names.add(config.CLIENT_NAME)
-
-
 def send_heartbeat():
     """
-        Sends heartbeat messages to the server every 10 seconds.
-        If no acknowledgment is received, disconnects the client.
+        Sends timestamped heartbeat messages to the server every second, the answers
+        measure the round-trip time. If the server does not answer within the timeout
+        derived from the round-trip time, disconnects the client.
     """
     global RUNNING
 
     while RUNNING:
         try:
+            if config.latency.server_silent():
+                print("Server is not answering heartbeats.")
+                RUNNING = False
+                break
+
             heartbeat_message = message.Message()
             heartbeat_message.info = "heartbeat"
+            heartbeat_message.data = config.latency.heartbeat_data()
             communication.send_object(heartbeat_message, client)
 
-            if stop_event.wait(timeout=1):
+            if stop_event.wait(timeout=config.latency.interval):
                 break
         except CommunicationError:
             print("Heartbeat failed. Server not responding.")
@@ -135,18 +174,33 @@ heartbeat_thread.start()
 
 last_time = time.time()
 while RUNNING:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            RUNNING = False
-        config.scene_manager.handle_event(event)
+    with config.tracer.span("events"):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                RUNNING = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+                export_trace()
+            config.scene_manager.handle_event(event)
+
+    with config.tracer.span("dispatch", messages=config.inbox.depth()):
+        dispatch_started = time.perf_counter()
+        config.inbox.dispatch(dispatch_messages)
+        config.scene_manager.overlay.add_time("dispatch", time.perf_counter() - dispatch_started)
 
     dt = time.time() - last_time
     last_time = time.time()
 
-    config.scene_manager.update(dt)
+    with config.tracer.span("update"):
+        config.scene_manager.update(dt)
+
+    with config.tracer.span("draw"):
+        config.scene_manager.draw(screen)
+
+        display_started = time.perf_counter()
+        pygame.display.update()
+        config.scene_manager.overlay.add_time("display", time.perf_counter() - display_started)
 
-    config.scene_manager.draw(screen)
-    pygame.display.update()
+    config.scene_manager.overlay.end_frame()
 
 pygame.quit()
 sys.exit(0)
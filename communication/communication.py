@@ -3,6 +3,41 @@ import pickle
 from exceptions.my_exceptions import CommunicationError
 
 
+class Frame(bytes):
+    """Encoded object, which remembers the info of the message it was created from."""
+
+    info = None
+
+
+def encode_object(object_to_send):
+    """
+        Serializes an object into a frame, which can be sent with send_frame.
+        The frame starts with 4 bytes of the length of serialized data.
+    """
+    serialized_data = pickle.dumps(object_to_send)
+    frame = Frame(len(serialized_data).to_bytes(4, 'big') + serialized_data)
+    frame.info = getattr(object_to_send, "info", None)
+    return frame
+
+
+def decode_frame(frame):
+    """
+        Deserializes a frame created by encode_object back into the object.
+    """
+    return pickle.loads(frame[4:])
+
+
+def send_frame(frame, connection):
+    """
+        Sends an already encoded frame using the given socket connection.
+        Raises a CommunicationError if the frame could not be sent.
+    """
+    try:
+        connection.sendall(frame)
+    except (OSError, ConnectionError) as e:
+        raise CommunicationError(f"Error sending data: {e}") from e
+
+
 def send_object(object_to_send, connection):
     """
         Serializes and sends an object using the given socket connection.
@@ -18,36 +53,59 @@ def send_object(object_to_send, connection):
     try:
 
         data_length = len(serialized_data)
-        connection.sendall(data_length.to_bytes(4, 'big'))
-
-        connection.sendall(serialized_data)
+        connection.sendall(data_length.to_bytes(4, 'big') + serialized_data)
     except (OSError, ConnectionError):
         ...
 
 
-def load_object(connection):
+def receive_exactly(connection, length):
     """
-        Receives and deserializes an object using the given socket connection.
-        Raises a CommunicationError if any error occurs.
+        Receives exactly length bytes. A single recv can return less than asked for,
+        even from the 4 bytes of the length, when the frame arrives in more segments.
     """
-    if connection is None:
-        return None
+    data = bytearray()
+    while len(data) < length:
+        chunk = connection.recv(length - len(data))
+        if not chunk:
+            raise CommunicationError("Connection lost during object reception.")
+        data += chunk
 
+    return bytes(data)
+
+
+def load_data(connection):
+    """
+        Receives the serialized data of one object using the given socket connection.
+        Raises a CommunicationError if any error occurs.
+    """
     try:
 
-        data_length = int.from_bytes(connection.recv(4), 'big')
+        data_length = int.from_bytes(receive_exactly(connection, 4), 'big')
         if data_length <= 0:
             raise CommunicationError("Invalid data length received.")
 
-        serialized_data = b''
-        while len(serialized_data) < data_length:
-            chunk = connection.recv(min(1024, data_length - len(serialized_data)))
-            if not chunk:
-                raise CommunicationError("Connection lost during object reception.")
-            serialized_data += chunk
-
-        return pickle.loads(serialized_data)
+        return receive_exactly(connection, data_length)
     except (OSError, ConnectionError) as e:
         raise CommunicationError(f"Error receiving data: {e}")
+
+
+def decode_data(serialized_data):
+    """
+        Deserializes the data received by load_data.
+        Raises a CommunicationError if the data can not be deserialized.
+    """
+    try:
+        return pickle.loads(serialized_data)
     except pickle.UnpicklingError as e:
         raise CommunicationError(f"Deserialization error: {e}")
+
+
+def load_object(connection):
+    """
+        Receives and deserializes an object using the given socket connection.
+        Raises a CommunicationError if any error occurs.
+    """
+    if connection is None:
+        return None
+
+    return decode_data(load_data(connection))
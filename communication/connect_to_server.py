@@ -1,6 +1,31 @@
+import os
+
 import requests
 
 WORDPRESS_API_URL = "https://webtesting.sk/wp-json/server-status/v1/status"
+SERVER_ENVIRONMENT_VARIABLE = "MAZEMADNESS_SERVER"
+
+
+def server_from_environment(default_port):
+    """
+        Returns the (host, port) of the server set as host:port (or only host) in the
+        MAZEMADNESS_SERVER environment variable, or None when it is not set.
+        It is used to connect through a local proxy instead of the registered server.
+        Raises ValueError with the explanation when the port is not a valid number.
+    """
+    value = os.environ.get(SERVER_ENVIRONMENT_VARIABLE, "").strip()
+    if not value:
+        return None
+
+    host, separator, port = value.rpartition(":")
+    if not separator:
+        return value, default_port
+
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"{SERVER_ENVIRONMENT_VARIABLE}={value} is not valid, "
+                         f"expected host:port with the port from 1 to 65535")
+
+    return host or "127.0.0.1", int(port)
 
 
 def check_server_status():
@@ -0,0 +1,114 @@
+"""
+    This module implements the inbox of the client.
+    The network thread only puts received messages into the inbox and the main
+    thread drains it once per frame, so every handler runs on the same thread
+    which renders the scenes.
+"""
+
+import time
+import collections
+
+
+def keep_latest(_, current):
+    """Merge function for messages where only the newest one matters."""
+    return current
+
+
+def join_data(previous, current):
+    """Merge function for messages whose data are sequences which can be joined together."""
+    current.data = previous.data + current.data
+    return current
+
+
+class Inbox:
+    """
+        Queue of messages received from the server.
+
+        Messages whose info is in `coalesce` are merged when more of them arrive
+        within one frame, the merge function gets the older and the newer message
+        and returns the one which should be handled.
+    """
+
+    def __init__(self, max_batch=256, coalesce=None, latency_history=512):
+        """Initializes an empty inbox."""
+        self.queue = collections.deque()
+        self.max_batch = max_batch
+        self.coalesce = coalesce if coalesce is not None else {}
+
+        self.latencies = collections.deque(maxlen=latency_history)
+        self.max_depth = 0
+        self.received = 0
+        self.last_batch_size = 0
+        self.dispatched = 0
+        self.coalesced = 0
+
+    def put(self, received_message):
+        """
+            Called from the network thread. Appending to a deque is atomic,
+            so no lock is needed.
+        """
+        self.queue.append((time.perf_counter(), received_message))
+        self.received += 1
+
+    def depth(self):
+        """Returns the number of messages waiting to be handled."""
+        return len(self.queue)
+
+    def drain(self):
+        """
+            Removes at most max_batch messages from the inbox and returns them
+            as a list of (received_at, message) pairs in the order of arrival.
+            Coalesced messages take the place of the newest one.
+        """
+        depth = len(self.queue)
+        self.max_depth = max(self.max_depth, depth)
+
+        batch = []
+        waiting_for_merge = {}
+
+        for _ in range(min(depth, self.max_batch)):
+            received_at, loaded_message = self.queue.popleft()
+            info = getattr(loaded_message, "info", None)
+            merge = self.coalesce.get(info)
+
+            if merge is not None and info in waiting_for_merge:
+                index = waiting_for_merge[info]
+                received_at, previous_message = batch[index]
+                batch[index] = None
+
+                loaded_message = merge(previous_message, loaded_message)
+                self.coalesced += 1
+
+            if merge is not None:
+                waiting_for_merge[info] = len(batch)
+
+            batch.append((received_at, loaded_message))
+
+        return [item for item in batch if item is not None]
+
+    def dispatch(self, handler):
+        """
+            Drains the inbox and calls the handler with every message.
+            Has to be called from the main thread once per frame.
+        """
+        batch = self.drain()
+        self.last_batch_size = len(batch)
+
+        for received_at, loaded_message in batch:
+            self.latencies.append(time.perf_counter() - received_at)
+            self.dispatched += 1
+            handler(loaded_message)
+
+    def stats(self):
+        """Returns the current depth and dispatch latency of the inbox."""
+        latencies = sorted(self.latencies)
+
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "last_batch_size": self.last_batch_size,
+            "dispatched": self.dispatched,
+            "coalesced": self.coalesced,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0,
+            "latency_max": latencies[-1] if latencies else 0,
+        }
@@ -0,0 +1,162 @@
+"""
+    This module measures the round-trip time of the link between the client and the server.
+
+    Heartbeats carry timestamps: the client sends the time of sending together with
+    the last timestamp of the server and how long it held it, the server answers with
+    the client's timestamp and its own one. So both sides measure the round trip
+    with their own clock and without extra messages.
+    Samples are smoothed as in RFC 6298, jitter is computed as in RFC 3550.
+"""
+
+import threading
+import time
+
+
+class RttEstimator:
+    """Smoothed round-trip time, its variation, jitter and retransmission timeout."""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, min_rto=0.2, max_rto=60, initial_rto=1, granularity=0.001):
+        """Initializes the estimator without samples, the timeout is initial_rto until then."""
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.initial_rto = initial_rto
+        self.granularity = granularity
+
+        self.srtt = None
+        self.rttvar = None
+        self.jitter = 0
+        self.last_rtt = None
+        self.min_rtt = None
+        self.samples = 0
+
+        self.lock = threading.Lock()
+
+    def update(self, rtt):
+        """Adds the measured round-trip time in seconds."""
+        with self.lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+                self.jitter += (abs(rtt - self.last_rtt) - self.jitter) / 16
+
+            self.last_rtt = rtt
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+            self.samples += 1
+
+    def rto(self):
+        """Returns the time after which an answer should be considered lost."""
+        with self.lock:
+            if self.srtt is None:
+                return self.initial_rto
+
+            rto = self.srtt + max(self.granularity, self.K * self.rttvar)
+            return min(max(rto, self.min_rto), self.max_rto)
+
+    def stats(self):
+        """Returns the smoothed RTT, its variation, jitter and the timeout in seconds."""
+        rto = self.rto()
+        with self.lock:
+            return {
+                "rtt": self.srtt or 0,
+                "rttvar": self.rttvar or 0,
+                "jitter": self.jitter,
+                "last_rtt": self.last_rtt or 0,
+                "min_rtt": self.min_rtt or 0,
+                "rto": rto,
+                "samples": self.samples,
+            }
+
+
+def answer_heartbeat(data, estimator, now=None):
+    """
+        Called by the server with the data of the received heartbeat. Updates the estimator
+        when the heartbeat echoes a timestamp of the server and returns the data of the
+        answer together with the measured round trip (or None).
+    """
+    now = time.perf_counter() if now is None else now
+
+    if not isinstance(data, tuple) or len(data) != 3:
+        return (None, now), None
+
+    client_sent, echoed, held = data
+    rtt = None
+    if echoed is not None:
+        rtt = now - echoed - held
+        if rtt >= 0:
+            estimator.update(rtt)
+        else:
+            rtt = None
+
+    return (client_sent, now), rtt
+
+
+class HeartbeatLatency:
+    """Client side of the measurement, timestamps heartbeats and reads the answers."""
+
+    def __init__(self, interval=1, missed_heartbeats=5):
+        """
+            Initializes the measurement of heartbeats sent every interval seconds.
+            The server is silent when missed_heartbeats answers did not come in time.
+        """
+        self.interval = interval
+        self.missed_heartbeats = missed_heartbeats
+        self.estimator = RttEstimator()
+
+        self.server_time = None
+        self.received_at = None
+        self.last_answer = time.perf_counter()
+
+    def heartbeat_data(self, now=None):
+        """Returns the data of the next heartbeat."""
+        now = time.perf_counter() if now is None else now
+
+        if self.server_time is None:
+            return now, None, 0
+
+        return now, self.server_time, now - self.received_at
+
+    def answer_received(self, data, now=None):
+        """Called with the data of the answer of the server, returns the measured round trip."""
+        now = time.perf_counter() if now is None else now
+        self.last_answer = now
+
+        if not isinstance(data, tuple) or len(data) != 2:
+            return None
+
+        client_sent, self.server_time = data
+        self.received_at = now
+        if client_sent is None:
+            return None
+
+        rtt = now - client_sent
+        self.estimator.update(rtt)
+        return rtt
+
+    def silence_timeout(self):
+        """Returns how long the server can stay silent, it grows with the round trip."""
+        return self.missed_heartbeats * self.interval + self.estimator.rto()
+
+    def server_silent(self, now=None):
+        """Returns True when the server has not answered for longer than silence_timeout."""
+        now = time.perf_counter() if now is None else now
+        return now - self.last_answer > self.silence_timeout()
+
+    def interpolation_delay(self, tick_interval, default=0.1, minimum=0.05, maximum=0.3):
+        """
+            Returns how far in the past the opponents should be drawn. One game tick
+            has to fit in, together with the usual variation of the arrival times.
+            The default is used until the first round trip is measured.
+        """
+        stats = self.estimator.stats()
+        if not stats["samples"]:
+            return default
+
+        delay = tick_interval + 2 * max(stats["rttvar"], stats["jitter"])
+        return min(max(delay, minimum), maximum)
@@ -0,0 +1,151 @@
+"""
+    This module implements the outgoing queue of the server for one client.
+    Messages are sorted into priority lanes and written to the socket by a
+    separate thread, so a burst of chat or a big login snapshot does not delay
+    the movement in the game and a stalled socket does not block the handlers.
+"""
+
+import collections
+import threading
+
+from exceptions.my_exceptions import CommunicationError
+
+from . import communication
+
+PRIORITY_REALTIME = 0
+PRIORITY_CONTROL = 1
+PRIORITY_BULK = 2
+
+
+class Outbox:
+    """
+        Priority lanes of messages waiting to be sent to one client.
+
+        Realtime messages with a conflate key are latest-value-wins: when a newer
+        message with the same key arrives before the older one was sent, only one
+        of them is sent (the newer one, or the result of the merge function).
+        A message which replaces the state those updates apply to (e.g. the start of
+        another game) drops the waiting updates with the keys given in drops.
+    """
+
+    def __init__(self, connection, on_error=None, on_sent=None, tracer=None, name="outbox"):
+        """
+            Initializes empty lanes, the writer thread (named name) is started by start().
+            The on_sent callback is called with every frame written to the socket,
+            the time of every write is recorded by the tracer.
+        """
+        self.connection = connection
+        self.on_error = on_error
+        self.on_sent = on_sent
+        self.tracer = tracer
+
+        self.condition = threading.Condition()
+        self.lanes = {
+            PRIORITY_REALTIME: collections.deque(),
+            PRIORITY_CONTROL: collections.deque(),
+            PRIORITY_BULK: collections.deque(),
+        }
+        self.conflated = collections.OrderedDict()
+        self.closed = False
+
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.conflated_frames = 0
+
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def start(self):
+        """Starts the writer thread."""
+        self.thread.start()
+
+    def put(self, object_to_send, priority=PRIORITY_CONTROL, conflate_key=None, merge=None,
+            drops=()):
+        """
+            Queues the object. Objects are serialized right away, so the caller can
+            reuse them, unless they can be merged with a newer one. Bytes are treated
+            as an already encoded frame. Conflated updates with keys in drops, which
+            were not sent yet, are dropped, so they cannot be sent after the object.
+        """
+        if merge is None and not isinstance(object_to_send, bytes):
+            object_to_send = communication.encode_object(object_to_send)
+
+        with self.condition:
+            if self.closed:
+                return
+
+            for key in drops:
+                self.conflated.pop(key, None)
+
+            if conflate_key is None:
+                self.lanes[priority].append(object_to_send)
+
+            elif conflate_key in self.conflated:
+                previous = self.conflated[conflate_key]
+                self.conflated[conflate_key] = merge(previous, object_to_send) if merge \
+                    else object_to_send
+                self.conflated_frames += 1
+
+            else:
+                self.conflated[conflate_key] = object_to_send
+
+            self.condition.notify()
+
+    def depth(self):
+        """Returns the number of frames waiting to be sent."""
+        with self.condition:
+            return len(self.conflated) + sum(len(lane) for lane in self.lanes.values())
+
+    def next_frame(self):
+        """
+            Waits for the next frame to send, realtime lane goes first, then the
+            conflated updates, control messages and bulk traffic at the end.
+            Returns None when the outbox was closed.
+        """
+        with self.condition:
+            while not self.closed:
+                if self.lanes[PRIORITY_REALTIME]:
+                    return self.lanes[PRIORITY_REALTIME].popleft()
+
+                if self.conflated:
+                    return self.conflated.popitem(last=False)[1]
+
+                for priority in (PRIORITY_CONTROL, PRIORITY_BULK):
+                    if self.lanes[priority]:
+                        return self.lanes[priority].popleft()
+
+                self.condition.wait()
+
+            return None
+
+    def run(self):
+        """Writes queued frames to the socket until the outbox is closed or sending fails."""
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return
+
+            if not isinstance(frame, bytes):
+                frame = communication.encode_object(frame)
+
+            started = self.tracer.now() if self.tracer is not None else 0
+            try:
+                communication.send_frame(frame, self.connection)
+            except CommunicationError:
+                self.close()
+                if self.on_error is not None:
+                    self.on_error(self.connection)
+                return
+
+            self.sent_frames += 1
+            self.sent_bytes += len(frame)
+            if self.tracer is not None:
+                self.tracer.complete(f"send {getattr(frame, 'info', None)}", started,
+                                     bytes=len(frame))
+            if self.on_sent is not None:
+                self.on_sent(frame)
+
+    def close(self):
+        """Stops the writer thread, frames which were not sent yet are dropped."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
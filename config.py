@@ -1,23 +1,45 @@
 """This module is used for configuration and for sharing variables throughout different files."""
 
+from lobby.leaderboard import Leaderboard
+from monitoring.tracing import Tracer
+from communication.latency import HeartbeatLatency
+
 MAXIMAL_NAME_LENGTH = 8
 
 client = ""
+inbox = None
 users_names = set()
 scores = {}
+leaderboard = Leaderboard()
 challenges_received = set()
 challenges_send = set()
 
+in_queue = False
+queue_length = 0
+
+presence_version = 0
+presence_snapshot_requested = False
+pending_presence_deltas = {}
+MAX_PENDING_PRESENCE_DELTAS = 32
+
 public_messages = []
+HISTORY_REQUEST_TIMEOUT = 5
 
 CLIENT_NAME = ""
 AUTOMATIC_TESTING = False
 
+MAX_SPEED = 8
+MOVEMENT_TICK_RATE = 20
+
 window_width = 1200
 window_height = 700
 
 scene_manager = ""
 
+tracer = Tracer("client")
+latency = HeartbeatLatency()
+TRACE_DIRECTORY = "traces"
+
 # Colors for Pygame
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
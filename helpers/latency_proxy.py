@@ -0,0 +1,340 @@
+"""
+    Local TCP proxy which makes the loopback behave like a worse network.
+    It sits between the clients and the server and forwards the bytes in both directions
+    with a delay (and its jitter), through a link of limited bandwidth, and it can reset
+    the connections at random. So the stalls which a zero latency loopback hides can be
+    seen and measured on one machine.
+
+    Every direction of a connection is modelled as a link: a chunk of bytes leaves after
+    the previous ones were transmitted at the bandwidth, and arrives one-way delay later.
+    The jitter varies the delay, but the order of bytes is kept, as TCP keeps it.
+    The proxy buffers at most buffer_size bytes per direction, then it stops reading,
+    so a slow link pushes back on the sender as a real one does.
+
+    Usage:
+        python helpers/latency_proxy.py --upstream 127.0.0.1:65432 --profile wifi
+        python helpers/latency_proxy.py --upstream 127.0.0.1:65432 --listen 127.0.0.1:65433 \\
+            --delay 40 --jitter 15 --bandwidth 64 --reset-interval 120
+        MAZEMADNESS_SERVER=127.0.0.1:65433 python client.py
+
+    Delays are in milliseconds, bandwidth in kilobytes per second in both directions.
+"""
+
+import argparse
+import collections
+import random
+import socket
+import struct
+import threading
+import time
+
+CHUNK_SIZE = 4096
+BUFFER_SIZE = 256 * 1024
+
+PROFILES = {
+    "lan": {"delay": 0.001, "jitter": 0.0005},
+    "wifi": {"delay": 0.015, "jitter": 0.01, "bandwidth": 2_000_000},
+    "congested-wifi": {"delay": 0.04, "jitter": 0.03, "bandwidth": 200_000},
+    "flaky": {"delay": 0.06, "jitter": 0.04, "bandwidth": 100_000, "reset_interval": 30},
+}
+
+
+def parse_address(text, default_host="127.0.0.1"):
+    """Parses host:port (or only port) into the address tuple."""
+    host, _, port = text.rpartition(":")
+    return host or default_host, int(port)
+
+
+class Link:
+    """One direction of a proxied connection."""
+
+    def __init__(self, source, destination, proxy, on_closed):
+        """
+            Initializes the link which reads from source and writes to destination
+            with the conditions of the proxy. on_closed is called when writing fails
+            or when the end of the stream was forwarded.
+        """
+        self.source = source
+        self.destination = destination
+        self.proxy = proxy
+        self.on_closed = on_closed
+        self.finished = False
+
+        self.chunks = collections.deque()
+        self.buffered = 0
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.link_free_at = 0
+        self.last_arrival = 0
+        self.forwarded = 0
+
+    def arrival_time(self, now, size):
+        """Returns when the chunk of size bytes read now arrives at the other side."""
+        bandwidth = self.proxy.bandwidth
+        self.link_free_at = max(now, self.link_free_at) + (size / bandwidth if bandwidth else 0)
+
+        delay = max(0, self.proxy.random.gauss(self.proxy.delay, self.proxy.jitter)
+                    if self.proxy.jitter else self.proxy.delay)
+        self.last_arrival = max(self.link_free_at + delay, self.last_arrival)
+        return self.last_arrival
+
+    def read(self):
+        """Reads the chunks from the source, an empty chunk marks the end of the stream."""
+        while True:
+            with self.condition:
+                while self.buffered >= self.proxy.buffer_size and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+
+            try:
+                chunk = self.source.recv(CHUNK_SIZE)
+            except OSError:
+                chunk = b""
+
+            with self.condition:
+                self.chunks.append((self.arrival_time(time.perf_counter(), len(chunk)), chunk))
+                self.buffered += len(chunk)
+                self.condition.notify_all()
+
+            if not chunk:
+                return
+
+    def write(self):
+        """Writes the chunks to the destination when they arrive."""
+        while True:
+            with self.condition:
+                while not self.chunks and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+
+                arrival, chunk = self.chunks[0]
+                waiting = arrival - time.perf_counter()
+                if waiting > 0:
+                    self.condition.wait(waiting)
+                    continue
+
+                self.chunks.popleft()
+                self.buffered -= len(chunk)
+                self.condition.notify_all()
+
+            try:
+                if not chunk:
+                    self.destination.shutdown(socket.SHUT_WR)
+                    self.finished = True
+                    self.on_closed(failed=False)
+                    return
+                self.destination.sendall(chunk)
+                self.forwarded += len(chunk)
+            except OSError:
+                self.on_closed()
+                return
+
+    def close(self):
+        """Stops both threads of the link, the buffered chunks are dropped."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class ProxiedConnection:
+    """Connection of one client forwarded to the upstream server."""
+
+    def __init__(self, client, upstream, proxy):
+        """Initializes the links of both directions between the client and the upstream."""
+        self.client = client
+        self.upstream = upstream
+        self.proxy = proxy
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.links = (Link(client, upstream, proxy, self.close),
+                      Link(upstream, client, proxy, self.close))
+        self.reset_timer = None
+
+    def start(self):
+        """Starts forwarding, the reset is scheduled when the proxy resets connections."""
+        for link in self.links:
+            for target in (link.read, link.write):
+                threading.Thread(target=target, daemon=True).start()
+
+        if self.proxy.reset_interval:
+            self.reset_timer = threading.Timer(
+                self.proxy.random.expovariate(1 / self.proxy.reset_interval), self.reset)
+            self.reset_timer.daemon = True
+            self.reset_timer.start()
+
+    def reset(self):
+        """Resets the connection, both the client and the server get RST."""
+        with self.lock:
+            if self.closed:
+                return
+
+        self.proxy.resets += 1
+        for connection in (self.client, self.upstream):
+            try:
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            except OSError:
+                ...
+        self.close(reset=True)
+
+    def close(self, failed=True, reset=False):
+        """
+            Closes both sockets and stops the links. When a link has only forwarded
+            the end of its stream, the connection is closed after the other one ends.
+            The reset only wakes the readers, so the sockets are closed without FIN.
+        """
+        with self.lock:
+            if self.closed or not (failed or all(link.finished for link in self.links)):
+                return
+            self.closed = True
+
+        if self.reset_timer is not None:
+            self.reset_timer.cancel()
+
+        for link in self.links:
+            link.close()
+        for connection in (self.client, self.upstream):
+            try:
+                connection.shutdown(socket.SHUT_RD if reset else socket.SHUT_RDWR)
+            except OSError:
+                ...
+            connection.close()
+
+        self.proxy.forget(self)
+
+
+class LatencyProxy:  # pylint: disable=too-many-instance-attributes
+    """
+        Proxy listening on host and port (0 picks a free one, the bound address is in address)
+        which forwards every connection to upstream. The conditions (delay and jitter in
+        seconds, bandwidth in bytes per second, mean seconds between resets of a connection)
+        can be changed while the proxy runs, they apply to the bytes read afterwards.
+    """
+
+    def __init__(self, upstream, host="127.0.0.1", port=0, delay=0, jitter=0, bandwidth=None,
+                 reset_interval=None, buffer_size=BUFFER_SIZE, seed=None):
+        """Binds the proxy, the connections are accepted after start()."""
+        self.upstream = upstream
+        self.delay = delay
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.reset_interval = reset_interval
+        self.buffer_size = buffer_size
+        self.random = random.Random(seed)
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen()
+        self.address = self.server_socket.getsockname()
+
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.resets = 0
+        self.accepted = 0
+
+    def __enter__(self):
+        """Starts the proxy, used as with LatencyProxy(...) as proxy."""
+        return self.start()
+
+    def __exit__(self, *_):
+        """Stops the proxy at the end of the with block."""
+        self.stop()
+
+    def start(self):
+        """Starts accepting connections in a daemon thread, returns the proxy."""
+        threading.Thread(target=self.accept_connections, daemon=True).start()
+        return self
+
+    def accept_connections(self):
+        """Accepts clients and connects each of them to the upstream until the proxy stops."""
+        while not self.stopped.is_set():
+            try:
+                client, _ = self.server_socket.accept()
+            except OSError:
+                return
+
+            try:
+                upstream = socket.create_connection(self.upstream)
+            except OSError:
+                client.close()
+                continue
+
+            connection = ProxiedConnection(client, upstream, self)
+            with self.lock:
+                self.connections.add(connection)
+                self.accepted += 1
+            connection.start()
+
+    def forget(self, connection):
+        """Called by the connection when it is closed."""
+        with self.lock:
+            self.connections.discard(connection)
+
+    def reset_all(self):
+        """Resets all connections at once, as when the Wi-Fi drops."""
+        with self.lock:
+            connections = list(self.connections)
+
+        for connection in connections:
+            connection.reset()
+
+    def stop(self):
+        """Stops accepting and closes all connections."""
+        self.stopped.set()
+        try:
+            self.server_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            ...
+        self.server_socket.close()
+
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.close()
+
+
+def main():
+    """Runs the proxy until it is interrupted."""
+    parser = argparse.ArgumentParser(description="TCP proxy injecting latency and resets.")
+    parser.add_argument("--upstream", required=True, help="host:port of the server")
+    parser.add_argument("--listen", default="127.0.0.1:0", help="host:port of the proxy")
+    parser.add_argument("--profile", choices=PROFILES, help="predefined network conditions")
+    parser.add_argument("--delay", type=float, help="one-way delay in milliseconds")
+    parser.add_argument("--jitter", type=float, help="deviation of the delay in milliseconds")
+    parser.add_argument("--bandwidth", type=float, help="kilobytes per second")
+    parser.add_argument("--reset-interval", type=float,
+                        help="mean seconds between resets of one connection")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    conditions = dict(PROFILES.get(args.profile, {}))
+    if args.delay is not None:
+        conditions["delay"] = args.delay / 1000
+    if args.jitter is not None:
+        conditions["jitter"] = args.jitter / 1000
+    if args.bandwidth is not None:
+        conditions["bandwidth"] = args.bandwidth * 1000
+    if args.reset_interval is not None:
+        conditions["reset_interval"] = args.reset_interval
+
+    host, port = parse_address(args.listen)
+    proxy = LatencyProxy(parse_address(args.upstream), host, port, seed=args.seed,
+                         **conditions).start()
+    print(f"Proxy {proxy.address[0]}:{proxy.address[1]} -> {args.upstream} {conditions}")
+
+    try:
+        proxy.stopped.wait()
+    except KeyboardInterrupt:
+        ...
+    finally:
+        proxy.stop()
+        print(f"Accepted {proxy.accepted} connections, reset {proxy.resets}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+"""
+    End-to-end benchmark of the latency of moves, the delay the players actually feel.
+    A server is started in this process on a free port of the loopback and two headless
+    bots play a scripted game against each other, each of them in its own process with
+    the Maze of the client. The latency of a step is the time from Maze.change_position
+    of one bot to Maze.move_opponent of the other one, so it contains the network tick
+    of the client, the game tick of the server and the frame in which the other client
+    dispatches its inbox. It is split into the wait for the network tick of the client
+    (step -> sent) and the rest (sent -> opponent).
+
+    Every scenario runs on a new server with its own background load, generated by
+    another process: chatting players, players logging in and out and other games.
+    With --network the bots connect through the latency proxy with the conditions
+    of one of its profiles, the steps lost by resets of the connections are counted.
+
+    Usage:
+        python helpers/move_latency_benchmark.py
+        python helpers/move_latency_benchmark.py --scenarios idle games --duration 20
+        python helpers/move_latency_benchmark.py --network wifi --save latency.json
+
+    The bots take the timestamps from time.perf_counter, which is a clock shared
+    by all processes of the machine, so the timestamps of both bots can be compared.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config  # pylint: disable=wrong-import-position
+from communication import communication, message  # pylint: disable=wrong-import-position
+from communication.inbox import Inbox  # pylint: disable=wrong-import-position
+from exceptions.my_exceptions import CommunicationError  # pylint: disable=C0413
+from maze.maze_generator import distances_from_end  # pylint: disable=wrong-import-position
+from maze.movement import merge_state_deltas, pack_path  # pylint: disable=C0413
+from maze.player_maze import Maze  # pylint: disable=wrong-import-position
+from server import GameServer  # pylint: disable=wrong-import-position
+from latency_proxy import LatencyProxy, PROFILES  # pylint: disable=C0411,C0413
+
+SCENARIOS = {
+    "idle": {},
+    "chat": {"chatters": 8, "chat_rate": 40},
+    "logins": {"login_rate": 10},
+    "games": {"games": 8},
+    "all": {"chatters": 8, "chat_rate": 40, "login_rate": 10, "games": 8},
+}
+MAX_CLIENTS = 100
+SETTLE_TIME = 1
+LOAD_SETUP_TIMEOUT = 10
+
+
+def percentile(ordered, fraction):
+    """Returns the value at the fraction (0..1) of the sorted list."""
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """Returns the percentiles of the latencies in milliseconds."""
+    ordered = sorted(latencies)
+    if not ordered:
+        return {"p50": 0, "p90": 0, "p99": 0, "max": 0}
+
+    return {
+        "p50": percentile(ordered, 0.5) * 1000,
+        "p90": percentile(ordered, 0.9) * 1000,
+        "p99": percentile(ordered, 0.99) * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+
+def send(connection, info, data=None):
+    """Sends one message to the server."""
+    communication.send_object(message.Message(info, data), connection)
+
+
+def read_until(connection, info, backlog=None):
+    """
+        Reads messages from the server until the one with the info, which is returned.
+        When the backlog list is given, the message is taken from it if it is there
+        and the skipped messages are stored in it.
+    """
+    for index, received in enumerate(backlog or ()):
+        if received.info == info:
+            return backlog.pop(index)
+
+    while True:
+        received = communication.load_object(connection)
+        if received.info == info:
+            return received
+        if backlog is not None:
+            backlog.append(received)
+
+
+def login(address, name, backlog=None):
+    """Connects to the server and logs in, returns the connection and the lobby snapshot."""
+    connection = socket.create_connection(address)
+    send(connection, "login_attempt", name)
+    return connection, read_until(connection, "login_successful", backlog)
+
+
+def wait_for_player(connection, lobby, player, backlog):
+    """Reads the presence deltas until the player is logged in."""
+    def joined(received):
+        return received.info == "presence_delta" and received.data[1] == "joined" \
+            and received.data[2][0] == player
+
+    if player in lobby.data[0] or any(joined(received) for received in backlog):
+        return
+
+    while not joined(communication.load_object(connection)):
+        ...
+
+
+def scripted_route(generated_maze, name):
+    """
+        Returns the endless walk of the player along the shortest path to the end tile
+        and back. The end tile itself is never entered, so the game never ends.
+    """
+    distances = distances_from_end(generated_maze["array"], tuple(generated_maze["end_tile"]))
+
+    def neighbours(position):
+        x, y = position
+        return [tile for tile in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+                if distances.get(tile, 0) > 0]
+
+    position = tuple(generated_maze[name])
+    path = [position]
+    while distances[position] > 1:
+        position = min(neighbours(position), key=distances.get)
+        path.append(position)
+
+    if len(path) < 2:
+        path.append(max(neighbours(path[0]), key=distances.get))
+
+    return itertools.cycle(path[1:] + path[-2::-1])
+
+
+class Bot:
+    """Headless client which walks the scripted route with the Maze of the client."""
+
+    def __init__(self, connection, name, opponent, generated_maze):
+        """
+            Initializes the maze of the game which was just started, config.client and
+            config.CLIENT_NAME have to be set to the connection and the name already.
+        """
+        self.connection = connection
+        self.name = name
+        self.opponent = opponent
+
+        self.inbox = Inbox(coalesce={"game_state_delta": merge_state_deltas})
+        self.maze = Maze(generated_maze, [opponent], lambda: None)
+        self.route = scripted_route(generated_maze, name)
+
+        self.steps = []
+        self.sent = []
+        self.received = []
+
+        self.send_moves = self.maze.send_moves
+        self.maze.send_moves = self.send_and_record
+
+    def listen(self):
+        """Puts the messages from the server into the inbox, as the network thread of the client."""
+        try:
+            while True:
+                self.inbox.put(communication.load_object(self.connection))
+        except CommunicationError:
+            ...
+
+    def handle(self, loaded_message):
+        """Applies the state deltas as GameScene does, other messages are dropped."""
+        if loaded_message.info != "game_state_delta":
+            return
+
+        _, moves, acknowledgements = loaded_message.data
+        if self.opponent in moves:
+            self.received.extend([time.perf_counter()] * (len(moves[self.opponent]) // 2))
+            self.maze.move_opponent(self.opponent, moves[self.opponent])
+
+        if self.name in acknowledgements:
+            self.maze.acknowledge_position(*acknowledgements[self.name])
+
+    def step(self):
+        """Moves to the next tile of the route."""
+        self.maze.my_position_x, self.maze.my_position_y = next(self.route)
+        self.steps.append(time.perf_counter())
+        self.maze.change_position()
+
+    def send_and_record(self):
+        """Sends the collected steps and records when they were sent."""
+        waiting = len(self.maze.outgoing_moves.path)
+        self.send_moves()
+        self.sent.extend([time.perf_counter()] * waiting)
+
+    def run(self, duration, fps, speed):
+        """
+            Runs the frames of the client for duration seconds, moves speed times per second.
+            Then it only dispatches for SETTLE_TIME, so the last steps of the opponent arrive.
+        """
+        frame_interval = 1 / fps
+        step_interval = 1 / speed
+
+        started = last_frame = next_frame = next_step = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now - started >= duration + SETTLE_TIME:
+                return
+
+            if now - started < duration and now >= next_step:
+                self.step()
+                next_step += step_interval
+
+            self.inbox.dispatch(self.handle)
+            self.maze.update(now - last_frame)
+            last_frame = now
+
+            next_frame += frame_interval
+            time.sleep(max(0, next_frame - time.perf_counter()))
+
+
+def play(address, name, opponent, challenger, options, results):
+    """
+        Process of one bot. Logs in, starts the game against the opponent (the challenger
+        challenges, the other one accepts), plays it and puts its timestamps into results.
+        The lobby snapshot is sent in the bulk lane, so the presence delta and the challenge
+        of the opponent can overtake it, the messages read before it are kept in the backlog.
+    """
+    backlog = []
+    connection, lobby = login(address, name, backlog)
+    config.client = connection
+    config.CLIENT_NAME = name
+
+    if challenger:
+        wait_for_player(connection, lobby, opponent, backlog)
+        send(connection, "create_challenge", opponent)
+    else:
+        read_until(connection, "received_challenge", backlog)
+        send(connection, "accept_challenge", opponent)
+
+    generated_maze = read_until(connection, "accepted_challenge", backlog).data[1]
+
+    bot = Bot(connection, name, opponent, generated_maze)
+    threading.Thread(target=bot.listen, daemon=True).start()
+    bot.run(options["duration"], options["fps"], options["speed"])
+
+    send(connection, "disconnect", name)
+    connection.close()
+
+    results.put((name, {"steps": bot.steps, "sent": bot.sent, "received": bot.received}))
+
+
+def drain(connection):
+    """Reads and drops everything the server sends, as a client which keeps up."""
+    try:
+        while connection.recv(65536):
+            ...
+    except OSError:
+        ...
+
+
+def chat(address, name, interval, started, stop):
+    """Background player who sends a public message every interval seconds."""
+    connection, _ = login(address, name)
+    threading.Thread(target=drain, args=(connection,), daemon=True).start()
+    started.set()
+
+    for number in itertools.count():
+        if stop.wait(interval):
+            return
+        send(connection, "public_message", f"{name}: message number {number}")
+
+
+def churn_logins(address, interval, started, stop):
+    """Background players who log in and right away out, one every interval seconds."""
+    started.set()
+
+    for number in itertools.count():
+        if stop.wait(interval):
+            return
+
+        name = f"login{number}"
+        connection, _ = login(address, name)
+        send(connection, "disconnect", name)
+        connection.close()
+
+
+def play_load_game(address, number, started, stop):
+    """Background game of two players who walk their scripted routes at the maximal speed."""
+    names = (f"game{number}a", f"game{number}b")
+    connections = [login(address, name)[0] for name in names]
+
+    send(connections[0], "create_challenge", names[1])
+    read_until(connections[1], "received_challenge")
+    send(connections[1], "accept_challenge", names[0])
+
+    routes = []
+    for connection, name in zip(connections, names):
+        routes.append(scripted_route(read_until(connection, "accepted_challenge").data[1], name))
+        threading.Thread(target=drain, args=(connection,), daemon=True).start()
+    started.set()
+
+    for sequence in itertools.count(1):
+        if stop.wait(1 / config.MAX_SPEED):
+            return
+
+        for connection, route in zip(connections, routes):
+            send(connection, "change_position", (sequence, pack_path([next(route)])))
+
+
+def run_load_worker(target, args, started, stop):
+    """Runs one generator of the load, it ends quietly when the server goes away."""
+    try:
+        target(*args, started, stop)
+    except (CommunicationError, OSError):
+        started.set()
+
+
+def generate_load(address, load, ready, stop):
+    """Process of the background load of the scenario, runs until stop is set."""
+    workers = [(play_load_game, (address, number)) for number in range(load.get("games", 0))]
+    workers += [(chat, (address, f"chat{number}", load["chatters"] / load["chat_rate"]))
+                for number in range(load.get("chatters", 0))]
+    if load.get("login_rate"):
+        workers.append((churn_logins, (address, 1 / load["login_rate"])))
+
+    started = []
+    for target, args in workers:
+        event = threading.Event()
+        threading.Thread(target=run_load_worker, args=(target, args, event, stop),
+                         daemon=True).start()
+        started.append(event)
+
+    for event in started:
+        event.wait(LOAD_SETUP_TIMEOUT)
+
+    ready.set()
+    stop.wait()
+
+
+def step_latencies(mover, watcher):
+    """
+        Returns the latencies (total, step -> sent, sent -> opponent) of the steps of the mover
+        seen by the watcher and the number of steps which the watcher has not seen.
+    """
+    count = min(len(mover["steps"]), len(mover["sent"]), len(watcher["received"]))
+    steps, sent, received = mover["steps"][:count], mover["sent"][:count], \
+        watcher["received"][:count]
+
+    total = [seen - step for step, seen in zip(steps, received)]
+    batching = [send_time - step for step, send_time in zip(steps, sent)]
+    transit = [seen - send_time for send_time, seen in zip(sent, received)]
+    return total, batching, transit, len(mover["steps"]) - count
+
+
+def run_scenario(load, options):
+    """Runs one scenario on a new server and returns the statistics of its latencies."""
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as directory, \
+            GameServer("127.0.0.1", 0, data_directory=directory,
+                       max_clients=MAX_CLIENTS) as server:
+        ready = context.Event()
+        stop = context.Event()
+        load_process = context.Process(target=generate_load,
+                                       args=(server.address, load, ready, stop), daemon=True)
+        load_process.start()
+        ready.wait()
+
+        proxy = None
+        address = server.address
+        if options["network"] is not None:
+            proxy = LatencyProxy(server.address, **PROFILES[options["network"]]).start()
+            address = proxy.address
+
+        results = context.Queue()
+        bots = [context.Process(target=play, args=(address, "bot1", "bot2", True,
+                                                   options, results), daemon=True),
+                context.Process(target=play, args=(address, "bot2", "bot1", False,
+                                                   options, results), daemon=True)]
+        for bot in bots:
+            bot.start()
+
+        timestamps = dict(results.get(timeout=options["duration"] + 60) for _ in bots)
+        for bot in bots:
+            bot.join()
+
+        if proxy is not None:
+            proxy.stop()
+
+        stop.set()
+        load_process.join(SETTLE_TIME)
+        if load_process.is_alive():
+            load_process.terminate()
+
+    total, batching, transit, lost = [], [], [], 0
+    for mover, watcher in (("bot1", "bot2"), ("bot2", "bot1")):
+        latencies = step_latencies(timestamps[mover], timestamps[watcher])
+        total += latencies[0]
+        batching += latencies[1]
+        transit += latencies[2]
+        lost += latencies[3]
+
+    return {"steps": len(total), "lost": lost, "total": summarize(total),
+            "batching": summarize(batching), "transit": summarize(transit)}
+
+
+def main():
+    """Runs the scenarios and prints the percentiles of the latencies of moves."""
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the latency of moves.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--fps", type=float, default=60)
+    parser.add_argument("--speed", type=float, default=config.MAX_SPEED,
+                        help="steps of every bot per second")
+    parser.add_argument("--network", choices=PROFILES,
+                        help="connects the bots through the latency proxy with the profile")
+    parser.add_argument("--save", help="writes the results as JSON into the file")
+    args = parser.parse_args()
+
+    options = {"duration": args.duration, "fps": args.fps, "speed": args.speed,
+               "network": args.network}
+
+    results = {}
+    for name in args.scenarios:
+        print(f"Running scenario {name} for {args.duration} s ...")
+        results[name] = run_scenario(SCENARIOS[name], options)
+
+    print(f"{'scenario':10} {'steps':>6} {'lost':>5} {'p50':>8} {'p90':>8} {'p99':>8} "
+          f"{'max':>8} {'tick p50':>9} {'rest p50':>9} {'rest p99':>9}  (ms)")
+    for name, stats in results.items():
+        total = stats["total"]
+        print(f"{name:10} {stats['steps']:6} {stats['lost']:5} {total['p50']:8.2f} "
+              f"{total['p90']:8.2f} {total['p99']:8.2f} {total['max']:8.2f} "
+              f"{stats['batching']['p50']:9.2f} {stats['transit']['p50']:9.2f} "
+              f"{stats['transit']['p99']:9.2f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+    Headless benchmark of rendering of the client.
+    Every case builds a scene (or a widget) with synthetic state and measures how long
+    its draw takes in every frame. The SDL dummy video driver is used, so no display
+    is needed and the numbers measure only the drawing into the screen surface.
+
+    Usage:
+        python helpers/render_benchmark.py --frames 300
+        python helpers/render_benchmark.py --save baseline.json
+        python helpers/render_benchmark.py --compare baseline.json --tolerance 0.2
+
+    With --compare the program exits with 1 when the median frame time of any case
+    got slower by more than the tolerance.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pygame  # pylint: disable=wrong-import-position
+
+import config  # pylint: disable=wrong-import-position
+from maze.maze_generator import bfs_maze, assign_start_positions  # pylint: disable=C0413
+from maze.player_maze import Maze  # pylint: disable=wrong-import-position
+from scenes.game_scene import GameScene  # pylint: disable=wrong-import-position
+from scenes.login_scene import LoginScene  # pylint: disable=wrong-import-position
+from scenes.menu_scene import MenuScene  # pylint: disable=wrong-import-position
+from scenes.scene import SceneManager  # pylint: disable=wrong-import-position
+from widgets.chatlog import Chatlog  # pylint: disable=wrong-import-position
+
+WINDOW_SIZE = (1200, 700)
+
+
+def percentile(ordered, fraction):
+    """Returns the value at the fraction (0..1) of the sorted list."""
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+def measure(draw, screen, frames, warmup):
+    """Calls draw(screen) warmup + frames times and returns the times of the measured frames."""
+    for _ in range(warmup):
+        draw(screen)
+
+    times = []
+    for _ in range(frames):
+        started = time.perf_counter()
+        draw(screen)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def summarize(times):
+    """Returns the percentiles of frame times in milliseconds."""
+    ordered = sorted(times)
+    return {
+        "mean": sum(ordered) / len(ordered) * 1000,
+        "p50": percentile(ordered, 0.5) * 1000,
+        "p90": percentile(ordered, 0.9) * 1000,
+        "p99": percentile(ordered, 0.99) * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+
+def synthetic_lobby(players, messages, challenges):
+    """Fills the shared state of the client with players, scores, chat and challenges."""
+    config.client = None
+    config.CLIENT_NAME = "player0"
+
+    names = [f"player{index}" for index in range(players)]
+    config.users_names = set(names)
+    config.scores = {name: random.randint(0, 500) for name in names}
+    config.leaderboard.reset(config.scores)
+    config.challenges_received = set(names[1:challenges + 1])
+    config.challenges_send = set(names[challenges + 1:2 * challenges + 1])
+
+    config.public_messages = [f"{random.choice(names)}: message number {index} "
+                              f"with some text to wrap" for index in range(messages)]
+
+
+def generated_maze(size, players):
+    """Generates the maze with start positions of the players."""
+    maze = bfs_maze(size)
+    assign_start_positions(maze, players)
+    return maze
+
+
+def build_cases(args):
+    """Returns the list of (name, draw function) of all benchmarked cases."""
+    synthetic_lobby(args.players, args.messages, args.challenges)
+    config.scene_manager = SceneManager()
+
+    login = LoginScene(config.scene_manager.switch_scene)
+
+    menu = MenuScene(config.scene_manager.switch_scene)
+    menu.chatlog.set_messages(config.public_messages)
+
+    chatlog = Chatlog(config.window_width * (2 / 3), 75, config.window_width,
+                      config.window_height)
+    chatlog.set_messages(config.public_messages)
+
+    overlay = config.scene_manager.overlay
+    overlay.toggle()
+
+    def draw_overlay(screen):
+        overlay.add_time("draw", 0.004)
+        overlay.end_frame()
+        overlay.draw(screen)
+
+    cases = [
+        ("login", login.draw),
+        (f"menu ({args.players} players, {args.messages} messages)", menu.draw),
+        (f"chatlog ({args.messages} messages)", chatlog.draw),
+        ("perf overlay", draw_overlay),
+    ]
+
+    players = [config.CLIENT_NAME] + [f"player{index}" for index in range(1, args.opponents + 1)]
+    for size in args.sizes:
+        maze = generated_maze(size, players)
+
+        game = GameScene(config.scene_manager.switch_scene)
+        game.on_enter()
+        game.set_opponents(players)
+        game.set_maze(maze)
+
+        cases.append((f"maze {size}x{size}", Maze(maze, players[1:], None).draw))
+        cases.append((f"game {size}x{size} ({args.opponents} opponents)", game.draw))
+
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change against the baseline and returns the names of slower cases."""
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+
+        ratio = stats["p50"] / baseline[name]["p50"] if baseline[name]["p50"] else 1
+        print(f"{name:45} p50 {baseline[name]['p50']:8.3f} -> {stats['p50']:8.3f} ms "
+              f"({(ratio - 1) * 100:+.1f} %)")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    """Runs all cases and prints the percentiles of their frame times."""
+    parser = argparse.ArgumentParser(description="Headless benchmark of rendering.")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--players", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--challenges", type=int, default=50)
+    parser.add_argument("--opponents", type=int, default=3)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[21, 41, 81])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="writes the results as JSON into the file")
+    parser.add_argument("--compare", help="compares the results with a saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    pygame.init()
+    config.window_width, config.window_height = WINDOW_SIZE
+    screen = pygame.display.set_mode(WINDOW_SIZE)
+
+    results = {}
+    print(f"{'case':45} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name, draw in build_cases(args):
+        stats = summarize(measure(draw, screen, args.frames, args.warmup))
+        results[name] = stats
+        print(f"{name:45} {stats['mean']:8.3f} {stats['p50']:8.3f} {stats['p90']:8.3f} "
+              f"{stats['p99']:8.3f} {stats['max']:8.3f}")
+
+    pygame.quit()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Slower by more than {args.tolerance * 100:.0f} %: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+    This module keeps the challenges between players on the server.
+    Challenges are indexed from both sides, so when a player starts a game
+    or leaves, only his own challenges are found and only the players who
+    hold them are notified.
+"""
+
+import threading
+
+
+class ChallengeRegistry:
+    """Open challenges indexed by the challenger and by the challenged player."""
+
+    def __init__(self):
+        """Initializes the registry without any challenges."""
+        self.sent = {}
+        self.received = {}
+        self.lock = threading.Lock()
+
+    def add(self, challenger, target):
+        """Stores the challenge, returns False when it is a duplicate or invalid."""
+        if challenger == target:
+            return False
+
+        with self.lock:
+            targets = self.sent.setdefault(challenger, set())
+            if target in targets:
+                return False
+
+            targets.add(target)
+            self.received.setdefault(target, set()).add(challenger)
+            return True
+
+    def remove(self, challenger, target):
+        """Removes the challenge, returns False when there was no such challenge."""
+        with self.lock:
+            return self.discard(challenger, target)
+
+    def exists(self, challenger, target):
+        """Returns True when the challenger challenged the target."""
+        with self.lock:
+            return target in self.sent.get(challenger, ())
+
+    def remove_player(self, name):
+        """
+            Removes all challenges sent or received by the player.
+            Returns {other player: challenges removed from him}, where every
+            challenge is the pair (challenger, target).
+        """
+        affected = {}
+
+        with self.lock:
+            for target in list(self.sent.get(name, ())):
+                self.discard(name, target)
+                affected.setdefault(target, []).append((name, target))
+
+            for challenger in list(self.received.get(name, ())):
+                self.discard(challenger, name)
+                affected.setdefault(challenger, []).append((challenger, name))
+
+        return affected
+
+    def challenges_of(self, name):
+        """Returns (sent, received) challenges of the player as sets of names."""
+        with self.lock:
+            return set(self.sent.get(name, ())), set(self.received.get(name, ()))
+
+    def discard(self, challenger, target):
+        """Removes one challenge from both indexes, the lock must be held."""
+        targets = self.sent.get(challenger)
+        if targets is None or target not in targets:
+            return False
+
+        targets.discard(target)
+        if not targets:
+            del self.sent[challenger]
+
+        challengers = self.received[target]
+        challengers.discard(challenger)
+        if not challengers:
+            del self.received[target]
+
+        return True
+
+    def __len__(self):
+        """Returns the number of open challenges."""
+        with self.lock:
+            return sum(len(targets) for targets in self.sent.values())
@@ -0,0 +1,60 @@
+"""
+    This module stores the history of public messages on the server.
+    Every message has an increasing id and is stored in a ring buffer at the slot
+    given by its id, so appending overwrites the oldest message in place and any page
+    of the history is found without searching.
+"""
+
+import threading
+
+
+class ChatHistory:
+    """Public messages, which can be read page by page from the newest to the oldest."""
+
+    def __init__(self, max_messages=10000):
+        """Initializes an empty history, only the newest max_messages are kept."""
+        self.max_messages = max_messages
+        self.slots = [None] * max_messages
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def append(self, text):
+        """Stores the message and returns its id."""
+        with self.lock:
+            message_id = self.next_id
+            self.slots[message_id % self.max_messages] = text
+            self.next_id += 1
+
+            return message_id
+
+    def first_id(self):
+        """Returns the id of the oldest stored message."""
+        return max(self.next_id - self.max_messages, 0)
+
+    def latest(self, limit):
+        """Returns the newest page of messages, see before."""
+        with self.lock:
+            return self.page(self.next_id, limit)
+
+    def before(self, cursor, limit):
+        """
+            Returns (messages, cursor) with at most limit messages older than the cursor,
+            from the oldest one. The returned cursor is used to fetch the previous page,
+            it is None when there are no older messages.
+        """
+        with self.lock:
+            return self.page(cursor, limit)
+
+    def page(self, cursor, limit):
+        """Returns the page of messages older than the cursor, the lock must be held."""
+        first_id = self.first_id()
+        end = min(max(cursor, first_id), self.next_id)
+        start = max(end - limit, first_id)
+
+        next_cursor = start if start > first_id else None
+        return [self.slots[message_id % self.max_messages]
+                for message_id in range(start, end)], next_cursor
+
+    def __len__(self):
+        """Returns the number of stored messages."""
+        return self.next_id - self.first_id()
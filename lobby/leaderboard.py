@@ -0,0 +1,147 @@
+"""
+    This module keeps the players ordered by their score.
+    The number of players with every score is stored in a Fenwick tree, so the
+    rank of a player and the k-th best score are found in O(log n) and a change
+    of a score updates the tree in O(log n) without sorting the players again.
+    It is used by the server and also by the client for the list of players.
+"""
+
+import threading
+
+
+class Leaderboard:
+    """Players ordered by score (descending) and name, with rank and top-k queries."""
+
+    def __init__(self, max_score=1024):
+        """Initializes an empty leaderboard, the tree grows when a bigger score appears."""
+        self.capacity = max_score
+        self.tree = [0] * (self.capacity + 1)
+        self.buckets = {}
+        self.scores = {}
+
+        self.version = 0
+        self.cached_ranking = []
+        self.cached_version = 0
+
+        self.lock = threading.RLock()
+
+    def add_count(self, score, delta):
+        """Adds delta to the number of players with the score, the lock must be held."""
+        index = score + 1
+        while index <= self.capacity:
+            self.tree[index] += delta
+            index += index & -index
+
+    def count_up_to(self, score):
+        """Returns the number of players with the score at most score, the lock must be held."""
+        index = min(score + 1, self.capacity)
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def kth_smallest_score(self, k):
+        """Returns the score of the k-th worst player (from 1), the lock must be held."""
+        position = 0
+        step = 1 << self.capacity.bit_length()
+
+        while step:
+            following = position + step
+            if following <= self.capacity and self.tree[following] < k:
+                position = following
+                k -= self.tree[following]
+            step >>= 1
+
+        return position
+
+    def grow(self, score):
+        """Rebuilds the tree with enough space for the score, the lock must be held."""
+        while self.capacity <= score:
+            self.capacity *= 2
+
+        self.tree = [0] * (self.capacity + 1)
+        for bucket_score, names in self.buckets.items():
+            self.add_count(bucket_score, len(names))
+
+    def update(self, name, score):
+        """Sets the score of the player, he is added when he is not on the leaderboard yet."""
+        score = max(0, int(score))
+
+        with self.lock:
+            if self.scores.get(name) == score:
+                return
+
+            self.remove(name)
+
+            if score >= self.capacity:
+                self.grow(score)
+
+            self.scores[name] = score
+            self.buckets.setdefault(score, set()).add(name)
+            self.add_count(score, 1)
+            self.version += 1
+
+    def remove(self, name):
+        """Removes the player from the leaderboard."""
+        with self.lock:
+            score = self.scores.pop(name, None)
+            if score is None:
+                return
+
+            bucket = self.buckets[score]
+            bucket.discard(name)
+            if not bucket:
+                del self.buckets[score]
+
+            self.add_count(score, -1)
+            self.version += 1
+
+    def rank(self, name):
+        """Returns the rank of the player (players with the same score share it), or None."""
+        with self.lock:
+            if name not in self.scores:
+                return None
+
+            return len(self.scores) - self.count_up_to(self.scores[name]) + 1
+
+    def top(self, k):
+        """Returns the best k players as a list of (name, score)."""
+        with self.lock:
+            best = []
+            remaining = len(self.scores)
+
+            while remaining > 0 and len(best) < k:
+                score = self.kth_smallest_score(remaining)
+                names = sorted(self.buckets[score])
+
+                best.extend((name, score) for name in names[:k - len(best)])
+                remaining -= len(names)
+
+            return best
+
+    def ranking(self):
+        """
+            Returns all players as a list of (name, score) from the best one.
+            The list is built again only after a change, so it can be used every frame.
+        """
+        with self.lock:
+            if self.cached_version != self.version:
+                self.cached_ranking = self.top(len(self.scores))
+                self.cached_version = self.version
+
+            return self.cached_ranking
+
+    def reset(self, scores):
+        """Replaces all players by the players from the dictionary of scores."""
+        with self.lock:
+            for name in list(self.scores):
+                self.remove(name)
+
+            for name, score in scores.items():
+                self.update(name, score)
+
+    def __len__(self):
+        """Returns the number of players on the leaderboard."""
+        with self.lock:
+            return len(self.scores)
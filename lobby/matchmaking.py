@@ -0,0 +1,149 @@
+"""
+    This module groups the players waiting in the matchmaking queue into rooms.
+    Players are grouped in batches by the scheduler of the server, the waiting
+    players are sorted by score and neighbours share a room when their scores
+    are close enough. The allowed difference grows with the waiting time,
+    so nobody waits forever.
+"""
+
+import collections
+import threading
+import time
+
+
+class Matchmaker:
+    """Queue of players waiting for a game together with its metrics."""
+
+    def __init__(self, room_size=2, score_band=2, band_growth=1, rate_window=60, history=256):
+        """
+            Initializes an empty queue. At least two and at most room_size players are
+            grouped when their scores differ by at most score_band plus band_growth for
+            every second of waiting of the longest waiting one.
+            Pairings per second are measured over the last rate_window seconds.
+        """
+        self.room_size = room_size
+        self.score_band = score_band
+        self.band_growth = band_growth
+        self.rate_window = rate_window
+
+        self.waiting = {}
+        self.grouped = {}
+        self.lock = threading.Lock()
+
+        self.pairings = 0
+        self.pairing_times = collections.deque()
+        self.wait_times = collections.deque(maxlen=history)
+
+    def join(self, name, score, now=None):
+        """Adds the player to the queue, returns False when he is already waiting."""
+        now = time.perf_counter() if now is None else now
+
+        with self.lock:
+            if name in self.waiting:
+                return False
+
+            self.waiting[name] = (score, now)
+            return True
+
+    def leave(self, name):
+        """Removes the player from the queue, returns False when he was not waiting."""
+        with self.lock:
+            return self.waiting.pop(name, None) is not None
+
+    def tolerance(self, joined_at, now):
+        """Returns the allowed score difference for the player waiting since joined_at."""
+        return self.score_band + self.band_growth * (now - joined_at)
+
+    def pair(self, now=None):
+        """
+            Groups the waiting players and removes them from the queue.
+            Returns the list of tuples of names, the rest keeps waiting.
+            The grouped players are remembered until the next pairing, see requeue.
+        """
+        now = time.perf_counter() if now is None else now
+
+        with self.lock:
+            self.grouped = {}
+            ordered = sorted(self.waiting.items(), key=lambda item: item[1])
+            groups = []
+
+            index = 0
+            while index < len(ordered) - 1:
+                group = self.take_group(ordered, index, now)
+                if len(group) < 2:
+                    index += 1
+                    continue
+
+                groups.append(tuple(name for name, _ in group))
+                for name, (_, joined) in group:
+                    self.grouped[name] = self.waiting.pop(name)
+                    self.wait_times.append(now - joined)
+                index += len(group)
+
+            self.pairings += len(groups)
+            self.pairing_times.extend([now] * len(groups))
+            while self.pairing_times and self.pairing_times[0] < now - self.rate_window:
+                self.pairing_times.popleft()
+
+            return groups
+
+    def requeue(self, name):
+        """
+            Returns the player grouped by the last pairing to the queue with his original
+            joining time, so the waiting time and the grown score band are not lost.
+            Returns False when he was not grouped or is already waiting again.
+        """
+        with self.lock:
+            entry = self.grouped.pop(name, None)
+            if entry is None or name in self.waiting:
+                return False
+
+            self.waiting[name] = entry
+            return True
+
+    def take_group(self, ordered, index, now):
+        """
+            Returns the players sorted by score starting at index, which fit into one room
+            with the player at index, the lock must be held.
+        """
+        lowest_score, oldest_joined = ordered[index][1]
+        group = [ordered[index]]
+
+        for name, (score, joined) in ordered[index + 1:index + self.room_size]:
+            oldest = min(oldest_joined, joined)
+            if score - lowest_score > self.tolerance(oldest, now):
+                break
+
+            oldest_joined = oldest
+            group.append((name, (score, joined)))
+
+        return group
+
+    def stats(self, now=None):
+        """Returns the length of the queue, waiting times and pairings per second."""
+        now = time.perf_counter() if now is None else now
+
+        with self.lock:
+            oldest = min((joined for _, joined in self.waiting.values()), default=now)
+            recent = [moment for moment in self.pairing_times
+                      if moment >= now - self.rate_window]
+
+            return {
+                "queue_length": len(self.waiting),
+                "longest_wait": now - oldest,
+                "wait_avg": sum(self.wait_times) / len(self.wait_times)
+                if self.wait_times else 0,
+                "wait_max": max(self.wait_times, default=0),
+                "pairings": self.pairings,
+                "pairings_per_second": len(recent) / self.rate_window,
+            }
+
+    def __contains__(self, name):
+        """Returns True when the player is waiting in the queue."""
+        with self.lock:
+            return name in self.waiting
+
+    def __len__(self):
+        """Returns the number of waiting players."""
+        with self.lock:
+            return len(self.waiting)
@@ -0,0 +1,51 @@
+"""
+    This module keeps the version of the presence of players on the server.
+    Every login, logout and change of score is one delta with the next version,
+    so clients apply only the change and ask for a full snapshot when they miss one.
+"""
+
+import threading
+
+
+class Presence:
+    """Versioned presence of players."""
+
+    def __init__(self):
+        """Initializes the presence with version 0."""
+        self.version = 0
+        self.lock = threading.RLock()
+
+    def next_delta(self, kind, payload):
+        """
+            Returns the delta with the next version. The caller should hold the lock
+            until the delta is queued for all clients, so they receive deltas in order.
+        """
+        with self.lock:
+            self.version += 1
+            return self.version, kind, payload
+
+
+def apply_delta(names, scores, kind, payload, leaderboard=None):
+    """
+        Applies one delta to the set of names and the dictionary of scores,
+        and to the leaderboard when it is given.
+    """
+    match kind:
+        case "joined":
+            name, score = payload
+            names.add(name)
+            scores[name] = score
+            if leaderboard is not None:
+                leaderboard.update(name, score)
+
+        case "score_changed":
+            name, score = payload
+            scores[name] = score
+            if leaderboard is not None:
+                leaderboard.update(name, score)
+
+        case "left":
+            names.discard(payload)
+            scores.pop(payload, None)
+            if leaderboard is not None:
+                leaderboard.remove(payload)
@@ -0,0 +1,206 @@
+"""
+    This module stores the scores of players in an SQLite database in WAL mode.
+    Scores are loaded lazily when a player logs in and kept in memory, so the
+    startup does not depend on the number of stored players. Changes are written
+    by a background thread in batches, so the handlers never wait for the disk.
+    A score stays in the cache until its change is committed, the database may
+    hold an older score before.
+    The best players and ranks are answered by queries on an index of the scores,
+    corrected by the few changes which are not committed yet.
+"""
+
+import contextlib
+import sqlite3
+import threading
+
+
+class ScoreStore:
+    """Durable scores of players with an in-memory cache and batched writes."""
+
+    def __init__(self, path, flush_interval=0.5):
+        """
+            Opens (or creates) the database. Changed scores are written at most
+            flush_interval seconds after the change by the writer thread.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self.reader = self.connect()
+        self.reader.execute(
+            "CREATE TABLE IF NOT EXISTS scores (name TEXT PRIMARY KEY, score INTEGER NOT NULL)"
+            " WITHOUT ROWID")
+        self.reader.execute(
+            "CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, name)")
+        self.reader.commit()
+
+        self.cache = {}
+        self.pending = {}
+        self.in_flight = {}
+        self.evicted = set()
+        self.lock = threading.Lock()
+
+        self.closed = threading.Event()
+        self.flushed_batches = 0
+        self.flushed_scores = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def connect(self):
+        """Opens a connection to the database in WAL mode."""
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def start(self):
+        """Starts the writer thread."""
+        self.thread.start()
+
+    def get(self, name, register=False):
+        """
+            Returns the score of the player, it is read from the database only the first time.
+            With register, a new player is stored with no points, so he is ranked.
+        """
+        with self.lock:
+            if name in self.cache:
+                self.evicted.discard(name)
+                return self.cache[name]
+
+            row = self.reader.execute("SELECT score FROM scores WHERE name = ?",
+                                      (name,)).fetchone()
+            score = row[0] if row else 0
+            self.cache[name] = score
+            if row is None and register:
+                self.pending[name] = score
+            return score
+
+    @contextlib.contextmanager
+    def snapshot(self):
+        """
+            Holds the lock and one read transaction, so the queries inside see the same
+            committed scores and the same uncommitted changes.
+        """
+        with self.lock:
+            self.reader.execute("BEGIN")
+            try:
+                yield {**self.in_flight, **self.pending}
+            finally:
+                self.reader.rollback()
+
+    def committed(self, names):
+        """Returns the committed scores of the players as a dictionary, see snapshot."""
+        names = list(names)
+        placeholders = ", ".join("?" * len(names))
+        return dict(self.reader.execute(
+            f"SELECT name, score FROM scores WHERE name IN ({placeholders})", names).fetchall())
+
+    def top(self, limit):
+        """
+            Returns the best players as a list of (name, score), sorted by score and name.
+            Enough rows are read that the uncommitted changes cannot push out a player.
+        """
+        with self.snapshot() as uncommitted:
+            scores = dict(self.reader.execute(
+                "SELECT name, score FROM scores ORDER BY score DESC, name LIMIT ?",
+                (limit + len(uncommitted),)).fetchall())
+
+        scores.update(uncommitted)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def rank(self, name):
+        """
+            Returns the rank of the player (players with the same score share it),
+            or None when he is not stored.
+        """
+        with self.snapshot() as uncommitted:
+            committed = self.committed(uncommitted.keys() | {name})
+            score = uncommitted.get(name, committed.get(name))
+            if score is None:
+                return None
+
+            better = self.reader.execute("SELECT COUNT(*) FROM scores WHERE score > ?",
+                                         (score,)).fetchone()[0]
+
+        for other, other_score in uncommitted.items():
+            better += (other_score > score) - (committed.get(other, -1) > score)
+
+        return better + 1
+
+    def count(self):
+        """Returns the number of stored players, with the ones not committed yet."""
+        with self.snapshot() as uncommitted:
+            committed = self.committed(uncommitted)
+            stored = self.reader.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+        return stored + len(uncommitted.keys() - committed.keys())
+
+    def set(self, name, score):
+        """Changes the score of the player, the change is written by the next batch."""
+        with self.lock:
+            self.cache[name] = score
+            self.pending[name] = score
+
+    def add(self, name, points=1):
+        """Adds points to the score of the player and returns the new score."""
+        score = self.get(name) + points
+        self.set(name, score)
+        return score
+
+    def evict(self, name):
+        """
+            Removes the player from the cache, his score stays in the database.
+            When his score was not committed yet, he is removed after the commit.
+        """
+        with self.lock:
+            if name in self.pending or name in self.in_flight:
+                self.evicted.add(name)
+            else:
+                self.cache.pop(name, None)
+
+    def take_pending(self):
+        """Returns the changed scores not written yet, they stay in flight until the commit."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.in_flight = pending
+            return pending
+
+    def write_batch(self, connection, batch):
+        """Writes the scores in one transaction, then evicts the players waiting for it."""
+        if not batch:
+            return
+
+        with connection:
+            connection.executemany(
+                "INSERT INTO scores (name, score) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET score = excluded.score",
+                batch.items())
+
+        self.flushed_batches += 1
+        self.flushed_scores += len(batch)
+
+        with self.lock:
+            self.in_flight = {}
+            for name in [name for name in self.evicted if name not in self.pending]:
+                self.cache.pop(name, None)
+                self.evicted.discard(name)
+
+    def run(self):
+        """Writes the changed scores in batches until the store is closed."""
+        writer = self.connect()
+
+        while not self.closed.wait(self.flush_interval):
+            self.write_batch(writer, self.take_pending())
+
+        self.write_batch(writer, self.take_pending())
+        writer.close()
+
+    def close(self):
+        """Writes the remaining changes and closes the database."""
+        self.closed.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        else:
+            self.write_batch(self.reader, self.take_pending())
+
+        with self.lock:
+            self.reader.close()
@@ -0,0 +1,60 @@
+"""
+    This module caches the encoded lobby snapshot which is sent on login.
+    The snapshot is encoded once and the presence deltas which happened since
+    then are sent after it, so concurrent logins reuse the same bytes.
+"""
+
+import threading
+
+
+class LobbySnapshot:
+    """
+        Encoded snapshot of the lobby together with the encoded presence deltas
+        which are newer than the snapshot.
+    """
+
+    def __init__(self, max_catch_up=64):
+        """
+            Initializes an empty cache. When more than max_catch_up deltas happen
+            after the snapshot, the snapshot is encoded again.
+        """
+        self.max_catch_up = max_catch_up
+        self.lock = threading.Lock()
+
+        self.frame = None
+        self.deltas = []
+
+        self.builds = 0
+        self.reuses = 0
+
+    def invalidate(self):
+        """Called when the part of the lobby which is not versioned (games or chat) changes."""
+        with self.lock:
+            self.frame = None
+            self.deltas = []
+
+    def record_delta(self, frame):
+        """Remembers the encoded presence delta, which happened after the snapshot."""
+        with self.lock:
+            if self.frame is None:
+                return
+
+            self.deltas.append(frame)
+            if len(self.deltas) > self.max_catch_up:
+                self.frame = None
+                self.deltas = []
+
+    def frames(self, build):
+        """
+            Returns the encoded snapshot followed by the encoded deltas newer than
+            the snapshot. `build` is called to encode a new snapshot when needed.
+        """
+        with self.lock:
+            if self.frame is None:
+                self.frame = build()
+                self.deltas = []
+                self.builds += 1
+            else:
+                self.reuses += 1
+
+            return [self.frame] + self.deltas
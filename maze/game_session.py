@@ -0,0 +1,109 @@
+"""
+    This module contains the server-side state of one game.
+    Moves received from the players are only queued, they are applied by
+    the game tick of the server, which then sends one state delta per tick.
+"""
+
+import collections
+import threading
+
+from .maze_generator import is_valid_step
+from .movement import pack_path, unpack_path
+
+
+class GameSession:
+    """Authoritative state of the game played by the given players."""
+
+    def __init__(self, players, generated_maze):
+        """Initializes the session, players start on the positions stored in the generated maze."""
+        self.players = tuple(players)
+        self.maze = generated_maze
+        self.array = generated_maze["array"]
+        self.end_tile = tuple(generated_maze["end_tile"])
+
+        self.positions = {player: tuple(generated_maze[player]) for player in self.players}
+        self.sequences = {player: 0 for player in self.players}
+        self.acknowledged = {player: 0 for player in self.players}
+        self.pending_moves = {player: collections.deque() for player in self.players}
+
+        self.tick = 0
+        self.winner = None
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        """Returns (tick, players, positions) of the game, consistent with the deltas of the ticks."""
+        with self.lock:
+            return self.tick, self.players, dict(self.positions)
+
+    def remove_player(self, player):
+        """Removes the player who left the game, returns the names of the remaining players."""
+        with self.lock:
+            self.players = tuple(name for name in self.players if name != player)
+            for state in (self.positions, self.sequences, self.acknowledged, self.pending_moves):
+                state.pop(player, None)
+
+            return self.players
+
+    def queue_moves(self, player, sequence, packed_path):
+        """
+            Called from the thread of the client. Queues the path segment until the
+            next tick, segments with already received sequence numbers are ignored.
+        """
+        with self.lock:
+            if player not in self.sequences or sequence <= self.sequences[player]:
+                return False
+
+            self.sequences[player] = sequence
+            self.pending_moves[player].append((sequence, unpack_path(packed_path)))
+            return True
+
+    def advance(self, max_steps):
+        """
+            Applies at most max_steps queued steps of every player. Returns the steps
+            accepted in this tick as {player: packed path} and the acknowledgements
+            as {player: (sequence, position)} for players whose segments were finished.
+        """
+        moves = {}
+        acknowledgements = {}
+
+        with self.lock:
+            self.tick += 1
+
+            for player, queue in self.pending_moves.items():
+                accepted_path = self.apply_moves(player, queue, max_steps)
+                if accepted_path:
+                    moves[player] = pack_path(accepted_path)
+
+                if self.acknowledged[player] != self.sequences[player] and not queue:
+                    self.acknowledged[player] = self.sequences[player]
+                    acknowledgements[player] = (self.sequences[player], self.positions[player])
+
+        return moves, acknowledgements
+
+    def apply_moves(self, player, queue, max_steps):
+        """
+            Applies queued segments of one player in order. Segment which does not fit
+            into max_steps stays at the front of the queue. Invalid step drops the rest
+            of its segment. The first player who steps on the end tile is the winner.
+        """
+        accepted_path = []
+
+        while queue and len(accepted_path) < max_steps:
+            sequence, path = queue.popleft()
+            budget = max_steps - len(accepted_path)
+
+            for number, step in enumerate(path[:budget]):
+                if not is_valid_step(self.array, self.positions[player], step):
+                    path = path[:number]
+                    break
+
+                self.positions[player] = step
+                accepted_path.append(step)
+
+                if step == self.end_tile and self.winner is None:
+                    self.winner = player
+
+            if len(path) > budget:
+                queue.appendleft((sequence, path[budget:]))
+
+        return accepted_path
@@ -100,3 +100,105 @@ def find_best_ends(array):
                 best_pair = ((x1, y1), (x2, y2))
 
     return best_pair[0], best_pair[1]
+
+
+def is_valid_step(array, old_position, new_position):
+    """Checks whether the player can move from old_position to the neighbouring new_position."""
+
+    old_x, old_y = old_position
+    new_x, new_y = new_position
+    size = len(array)
+
+    if abs(new_x - old_x) + abs(new_y - old_y) != 1:
+        return False
+
+    return 0 <= new_x < size and 0 <= new_y < size and array[new_y][new_x] == 1
+
+
+def distances_from_end(array, end_tile):
+    """Returns the length of the shortest path from the end tile to every reachable tile."""
+
+    size = len(array)
+    distances = {end_tile: 0}
+
+    queue = collections.deque()
+    queue.append(end_tile)
+
+    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+    while queue:
+        current_x, current_y = queue.popleft()
+
+        for dx, dy in directions:
+            new_x, new_y = current_x + dx, current_y + dy
+
+            if new_x < 0 or new_x >= size or new_y < 0 or new_y >= size \
+                    or (new_x, new_y) in distances:
+                continue
+
+            if array[new_y][new_x] == 0:
+                continue
+
+            distances[(new_x, new_y)] = distances[(current_x, current_y)] + 1
+            queue.append((new_x, new_y))
+
+    return distances
+
+
+def find_start_positions(generated_maze, count):
+    """
+        Finds start positions for count players, which all have the same distance
+        from the end tile. Among the distances around twice the size of the maze with
+        enough tiles, the one where the tiles are the furthest from each other is used.
+        When no distance has enough tiles, some players share the start position.
+    """
+
+    array = generated_maze["array"]
+    size = len(array)
+    wanted_distance = int(size * 2)
+
+    tiles_by_distance = collections.defaultdict(list)
+    for tile, distance in distances_from_end(array, tuple(generated_maze["end_tile"])).items():
+        if distance > 0:
+            tiles_by_distance[distance].append(tile)
+
+    enough = [distance for distance, tiles in tiles_by_distance.items() if len(tiles) >= count]
+    in_band = [distance for distance in enough if abs(distance - wanted_distance) <= size // 2]
+
+    if in_band:
+        starts = max((spread_tiles(tiles_by_distance[distance], count) for distance in in_band),
+                     key=smallest_gap)
+    elif enough:
+        distance = min(enough, key=lambda item: (abs(item - wanted_distance), -item))
+        starts = spread_tiles(tiles_by_distance[distance], count)
+    else:
+        distance = max(tiles_by_distance, key=lambda item: (len(tiles_by_distance[item]), item))
+        starts = spread_tiles(tiles_by_distance[distance], count)
+
+    return [starts[number % len(starts)] for number in range(count)]
+
+
+def spread_tiles(tiles, count):
+    """Picks at most count tiles, every next one is the furthest from the already picked ones."""
+
+    picked = [tiles[0]]
+
+    while len(picked) < min(count, len(tiles)):
+        picked.append(max((tile for tile in tiles if tile not in picked),
+                          key=lambda tile: min(math.dist(tile, start) for start in picked)))
+
+    return picked
+
+
+def smallest_gap(tiles):
+    """Returns the smallest distance between two of the tiles."""
+
+    return min((math.dist(first, second) for number, first in enumerate(tiles)
+                for second in tiles[number + 1:]), default=0)
+
+
+def assign_start_positions(generated_maze, players):
+    """Stores the start position of every player in the generated maze under his name."""
+
+    for player, start in zip(players, find_start_positions(generated_maze, len(players))):
+        generated_maze[player] = start
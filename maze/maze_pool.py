@@ -0,0 +1,65 @@
+"""
+    This module keeps mazes generated in advance.
+    The generation runs in a background thread, so when many games start
+    at once, their mazes are already waiting.
+"""
+
+import queue
+import random
+import threading
+
+from .maze_generator import bfs_maze
+
+
+class MazePool:
+    """Bounded pool of generated mazes, refilled by a background thread."""
+
+    def __init__(self, sizes=range(21, 31, 2), capacity=16):
+        """Initializes an empty pool of at most capacity mazes, of size chosen from sizes."""
+        self.sizes = sizes
+        self.mazes = queue.Queue(maxsize=capacity)
+        self.closed = threading.Event()
+
+        self.generated = 0
+        self.misses = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        """Starts filling the pool."""
+        self.thread.start()
+
+    def generate(self):
+        """Generates a maze of random size."""
+        return bfs_maze(random.choice(self.sizes))
+
+    def take(self):
+        """Returns a maze from the pool, it is generated right away when the pool is empty."""
+        try:
+            return self.mazes.get_nowait()
+        except queue.Empty:
+            self.misses += 1
+            return self.generate()
+
+    def run(self):
+        """Generates mazes until the pool is closed, waits while the pool is full."""
+        generated_maze = None
+
+        while not self.closed.is_set():
+            if generated_maze is None:
+                generated_maze = self.generate()
+                self.generated += 1
+
+            try:
+                self.mazes.put(generated_maze, timeout=0.5)
+                generated_maze = None
+            except queue.Full:
+                ...
+
+    def close(self):
+        """Stops the background thread."""
+        self.closed.set()
+
+    def __len__(self):
+        """Returns the number of mazes waiting in the pool."""
+        return self.mazes.qsize()
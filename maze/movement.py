@@ -0,0 +1,86 @@
+"""
+    This module contains the compact representation of the movement which is
+    sent through the network. Steps made within one network tick are sent
+    together as one path segment, every coordinate is stored in one byte.
+"""
+
+from communication import communication
+
+
+def pack_path(path):
+    """Packs the list of (x, y) positions into bytes."""
+    return bytes(coordinate for position in path for coordinate in position)
+
+
+def unpack_path(packed_path):
+    """Unpacks bytes created by pack_path back into the list of (x, y) positions."""
+    return [(packed_path[i], packed_path[i + 1]) for i in range(0, len(packed_path) - 1, 2)]
+
+
+def pack_maze(array):
+    """Packs the square maze of zeros and ones into (size, bytes) with one bit per tile."""
+    bits = "".join(str(tile) for row in array for tile in row)
+    return len(array), int(bits, 2).to_bytes((len(bits) + 7) // 8, "big")
+
+
+def unpack_maze(size, packed_maze):
+    """Unpacks the maze created by pack_maze back into the list of rows."""
+    bits = bin(int.from_bytes(packed_maze, "big"))[2:].zfill(size * size)
+    return [[int(bits[y * size + x]) for x in range(size)] for y in range(size)]
+
+
+def merge_state_deltas(previous, current):
+    """
+        Merge function for game_state_delta messages received within one frame.
+        Paths of every player are joined and the newest acknowledgements are kept.
+    """
+    _, previous_moves, previous_acknowledgements = previous.data
+    tick, moves, acknowledgements = current.data
+
+    merged_moves = dict(previous_moves)
+    for player, packed_path in moves.items():
+        merged_moves[player] = merged_moves.get(player, b"") + packed_path
+
+    current.data = (tick, merged_moves, {**previous_acknowledgements, **acknowledgements})
+    return current
+
+
+def merge_state_frames(previous, current):
+    """
+        Merge function for encoded game_state_delta frames, which are still waiting
+        in the outbox of a slow client. The frames are decoded, merged and encoded again.
+    """
+    merged = merge_state_deltas(communication.decode_frame(previous),
+                                communication.decode_frame(current))
+    return communication.encode_object(merged)
+
+
+class OutgoingMoves:
+    """
+        Collects steps of the player until the next network tick, when they are
+        sent to the server as one message.
+    """
+
+    def __init__(self, tick_rate):
+        """Initializes the buffer, which is flushed tick_rate times per second."""
+        self.tick_interval = 1 / tick_rate
+        self.time_since_flush = 0
+        self.path = []
+
+    def add(self, position):
+        """Adds a step which should be sent with the next tick."""
+        self.path.append(position)
+
+    def tick(self, dt):
+        """Returns True when the collected steps should be sent."""
+        self.time_since_flush += dt
+        if self.time_since_flush < self.tick_interval:
+            return False
+
+        self.time_since_flush = 0
+        return bool(self.path)
+
+    def take(self):
+        """Returns the collected steps and clears the buffer."""
+        path, self.path = self.path, []
+        return path
@@ -1,10 +1,15 @@
 import sys
 import os
+import time
 
 import pygame
 
 from communication import communication, message
 
+from .maze_generator import is_valid_step
+from .movement import OutgoingMoves, pack_path, unpack_path
+from .smoothing import OpponentInterpolator, MovePredictor
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import config
@@ -15,19 +20,27 @@ class Maze:
     Manages the maze, player movement, win conditions, and drawing of the maze.
     """
 
-    def __init__(self, generated_maze, opponent, win_callback):
+    def __init__(self, generated_maze, opponents, win_callback):
         """
-        Initializes the maze with the generated maze data and opponent.
+        Initializes the maze with the generated maze data and the opponents racing in it.
+        When the player is not in the generated maze, he only watches the race.
         """
-        self.opponent = opponent
         self.array = generated_maze["array"]
         self.win_callback = win_callback
 
-        self.my_position_x, self.my_position_y = generated_maze[config.CLIENT_NAME]
-        self.opponent_position_x, self.opponent_position_y = generated_maze[self.opponent]
+        self.my_position_x, self.my_position_y = generated_maze.get(config.CLIENT_NAME,
+                                                                    (None, None))
 
         self.end_x, self.end_y = generated_maze["end_tile"]
 
+        now = time.perf_counter()
+        self.opponent_positions = {opponent: tuple(generated_maze[opponent])
+                                   for opponent in opponents}
+        self.opponent_interpolators = {opponent: OpponentInterpolator(position, now)
+                                       for opponent, position in self.opponent_positions.items()}
+        self.move_predictor = MovePredictor()
+        self.outgoing_moves = OutgoingMoves(config.MOVEMENT_TICK_RATE)
+
         self.NUMBER_OF_TILES = len(self.array)
 
         self.OFFSET_Y = 70
@@ -38,26 +51,101 @@ class Maze:
 
     def change_position(self):
         """
-        Updates the player's position and checks if they have reached the end tile.
+        Queues the player's new position for the next network tick and checks
+        if they have reached the end tile.
         """
+        self.outgoing_moves.add((self.my_position_x, self.my_position_y))
+        config.tracer.instant("step", position=(self.my_position_x, self.my_position_y))
+
         if (self.my_position_x, self.my_position_y) == (self.end_x, self.end_y):
-            self.win = "me"
+            self.send_moves()
+            self.win = config.CLIENT_NAME
             self.win_callback()
 
+    def update(self, dt):
+        """
+        Sends the steps collected within the last network tick.
+        """
+        self.update_interpolation_delay()
+
+        if self.outgoing_moves.tick(dt):
+            self.send_moves()
+
+    def update_interpolation_delay(self):
+        """
+        Draws the opponents as far in the past as the measured jitter of the link requires.
+        """
+        delay = config.latency.interpolation_delay(1 / config.MOVEMENT_TICK_RATE)
+        for interpolator in self.opponent_interpolators.values():
+            interpolator.delay = delay
+
+    def send_moves(self):
+        """
+        Sends all collected steps to the server as one path segment with a sequence number.
+        """
+        path = self.outgoing_moves.take()
+        if not path:
+            return
+
+        sequence = self.move_predictor.predict(path)
+
         info_to_server = message.Message()
         info_to_server.info = "change_position"
-        info_to_server.data = (self.my_position_x, self.my_position_y)
+        info_to_server.data = (sequence, pack_path(path))
 
-        communication.send_object(info_to_server, config.client)
+        with config.tracer.span("send change_position", sequence=sequence, steps=len(path)):
+            communication.send_object(info_to_server, config.client)
 
-    def move_opponent(self, new_position):
+    def acknowledge_position(self, sequence, server_position):
+        """
+        Reconciles the predicted position of the player with the position
+        the server has confirmed for the move with the given sequence number.
+        Steps which were not sent yet are replayed from the corrected position.
+        """
+        position = self.move_predictor.reconcile(sequence, tuple(server_position),
+                                                 self.is_valid_step)
+        if position is None:
+            return
+
+        unsent_path = self.outgoing_moves.take()
+        for step in unsent_path:
+            if not self.is_valid_step(position, step):
+                break
+            position = step
+            self.outgoing_moves.add(step)
+
+        self.my_position_x, self.my_position_y = position
+
+    def is_valid_step(self, old_position, new_position):
+        """Checks whether the move between two neighbouring tiles is possible."""
+        return is_valid_step(self.array, old_position, new_position)
+
+    def is_walkable(self, x, y):
+        """Checks whether the tile is inside the maze and is not a wall."""
+        return 0 <= x < self.NUMBER_OF_TILES and 0 <= y < self.NUMBER_OF_TILES \
+            and self.array[y][x] == 1
+
+    def move_opponent(self, opponent, packed_path):
         """
         Updates the opponent's position and checks if they have reached the end tile.
         """
-        self.opponent_position_x, self.opponent_position_y = new_position
+        path = unpack_path(packed_path)
+        if not path or opponent not in self.opponent_interpolators:
+            return
+
+        self.opponent_positions[opponent] = path[-1]
+        self.opponent_interpolators[opponent].push_path(path, time.perf_counter(),
+                                                        1 / config.MAX_SPEED)
+
+        if path[-1] == (self.end_x, self.end_y) and self.win is None:
+            self.win = opponent
 
-        if (self.opponent_position_x, self.opponent_position_y) == (self.end_x, self.end_y):
-            self.win = "opponent"
+    def remove_opponent(self, opponent):
+        """
+        Removes the opponent who left the game.
+        """
+        self.opponent_positions.pop(opponent, None)
+        self.opponent_interpolators.pop(opponent, None)
 
     def move_up(self):
         """Moves the player up if the tile is walkable."""
@@ -98,8 +186,12 @@ class Maze:
                     self.OFFSET_X + x * self.TILE_SIZE, self.OFFSET_Y + y * self.TILE_SIZE,
                     self.TILE_SIZE, self.TILE_SIZE))
 
-        self.draw_tile(screen, self.my_position_x, self.my_position_y, config.GREEN)
-        self.draw_tile(screen, self.opponent_position_x, self.opponent_position_y, config.RED)
+        if self.my_position_x is not None:
+            self.draw_tile(screen, self.my_position_x, self.my_position_y, config.GREEN)
+        now = time.perf_counter()
+        for interpolator in self.opponent_interpolators.values():
+            opponent_x, opponent_y = interpolator.position(now, self.is_walkable)
+            self.draw_tile(screen, opponent_x, opponent_y, config.RED)
         self.draw_tile(screen, self.end_x, self.end_y, config.GOLD)
 
     def draw_tile(self, screen, x, y, color=config.WHITE):
@@ -0,0 +1,358 @@
+"""
+    This module records finished and running games into an append-only replay log.
+
+    The log is a sequence of records, every record starts with a fixed header
+    (kind, game id, timestamp, length of the payload) followed by the payload.
+    Next to the log there is an index file with one (game id, offset) entry per
+    record, so the reader finds all records of one game without reading the log.
+    The index file is read once into ReplayIndex, which the writer then updates
+    with every flushed record, so finding a replay costs the same however long
+    the log is. The reader reads only the records of the requested game.
+"""
+
+import collections
+import os
+import struct
+import threading
+import time
+
+from .movement import pack_maze, unpack_maze
+
+RECORD_HEADER = struct.Struct(">BIdI")
+INDEX_ENTRY = struct.Struct(">IQ")
+PATH_HEADER = struct.Struct(">BH")
+
+RECORD_START = 1
+RECORD_MOVES = 2
+RECORD_WIN = 3
+RECORD_END = 4
+
+
+def encode_names(names):
+    """Encodes the names of the players as one string separated by newlines."""
+    return "\n".join(names).encode()
+
+
+def decode_names(payload):
+    """Decodes the names encoded by encode_names."""
+    return tuple(payload.decode().split("\n")) if payload else ()
+
+
+def encode_start(players, array, end_tile, positions):
+    """Encodes the players, the maze packed into bits, the end tile and start positions."""
+    names = encode_names(players)
+    size, packed_maze = pack_maze(array)
+    starts = bytes(coordinate for player in players for coordinate in positions[player])
+
+    return struct.pack(">HBBB", len(names), size, *end_tile) + names + starts + packed_maze
+
+
+def decode_start(payload):
+    """Decodes the payload of the start record into a dictionary."""
+    names_length, size, end_x, end_y = struct.unpack_from(">HBBB", payload)
+    offset = struct.calcsize(">HBBB")
+
+    players = decode_names(payload[offset:offset + names_length])
+    offset += names_length
+
+    positions = {}
+    for player in players:
+        positions[player] = (payload[offset], payload[offset + 1])
+        offset += 2
+
+    return {
+        "players": players,
+        "array": unpack_maze(size, payload[offset:]),
+        "end_tile": (end_x, end_y),
+        "positions": positions,
+    }
+
+
+def decode_start_players(payload):
+    """Decodes only the names of the players from the payload of the start record."""
+    names_length, = struct.unpack_from(">H", payload)
+    offset = struct.calcsize(">HBBB")
+    return decode_names(payload[offset:offset + names_length])
+
+
+def encode_moves(players, tick, moves):
+    """Encodes the packed paths of one tick, players are stored as their index."""
+    payload = [struct.pack(">I", tick)]
+    for player, packed_path in moves.items():
+        payload.append(PATH_HEADER.pack(players.index(player), len(packed_path)))
+        payload.append(packed_path)
+
+    return b"".join(payload)
+
+
+def decode_moves(players, payload):
+    """Decodes the payload of the moves record into (tick, {player: packed path})."""
+    tick, = struct.unpack_from(">I", payload)
+    offset = 4
+
+    moves = {}
+    while offset < len(payload):
+        player, length = PATH_HEADER.unpack_from(payload, offset)
+        offset += PATH_HEADER.size
+        moves[players[player]] = bytes(payload[offset:offset + length])
+        offset += length
+
+    return tick, moves
+
+
+class ReplayIndex:
+    """Offsets of the records of every game and the recorded games of every player."""
+
+    def __init__(self):
+        """Initializes an empty index, game ids are added in increasing order."""
+        self.offsets = collections.defaultdict(list)
+        self.player_games = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, log_path, index_path):
+        """
+            Builds the index of the existing log from the index file, the start records
+            are read for the names of the players. Entries pointing behind the end
+            of the log (not written before a crash) are skipped.
+        """
+        games_index = cls()
+        if not os.path.exists(log_path) or not os.path.exists(index_path):
+            return games_index
+
+        with open(index_path, "rb") as index, open(log_path, "rb") as log:
+            entries = index.read()
+            log_size = os.fstat(log.fileno()).st_size
+
+            for entry in range(len(entries) // INDEX_ENTRY.size):
+                game_id, offset = INDEX_ENTRY.unpack_from(entries, entry * INDEX_ENTRY.size)
+                if offset + RECORD_HEADER.size > log_size:
+                    continue
+
+                kind, _, _, length = RECORD_HEADER.unpack(
+                    os.pread(log.fileno(), RECORD_HEADER.size, offset))
+                players = ()
+                if kind == RECORD_START:
+                    players = decode_start_players(
+                        os.pread(log.fileno(), length, offset + RECORD_HEADER.size))
+
+                games_index.add(game_id, offset, players)
+
+        return games_index
+
+    def add(self, game_id, offset, players=()):
+        """Adds the offset of the record of the game, players are given with the start record."""
+        with self.lock:
+            self.offsets[game_id].append(offset)
+            for player in players:
+                self.player_games[player].append(game_id)
+
+    def games(self):
+        """Returns the ids of all recorded games from the oldest one."""
+        with self.lock:
+            return list(self.offsets)
+
+    def offsets_of(self, game_id):
+        """Returns the offsets of all records of the game in order."""
+        with self.lock:
+            return list(self.offsets.get(game_id, ()))
+
+    def newest_game(self, player=None):
+        """Returns the id of the newest game of the player (or of anybody), or None."""
+        with self.lock:
+            if player is None:
+                return next(reversed(self.offsets), None)
+
+            games = self.player_games.get(player)
+            return games[-1] if games else None
+
+
+class ReplayWriter:
+    """Appends the records of games to the replay log and its index."""
+
+    def __init__(self, directory, flush_interval=1):
+        """
+            Opens (or creates) the replay log in the directory. Records are buffered
+            and written to the disk at most flush_interval seconds later.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, "replays.log")
+        self.index_path = os.path.join(directory, "replays.idx")
+
+        self.log = open(self.log_path, "ab")
+        self.index = open(self.index_path, "ab")
+
+        self.lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self.last_flush = time.perf_counter()
+
+        self.players = {}
+        self.next_game_id = self.find_next_game_id()
+
+        self.games_index = ReplayIndex.load(self.log_path, self.index_path)
+        self.unflushed = []
+
+    def find_next_game_id(self):
+        """Returns the id following the newest game in the existing index."""
+        size = os.path.getsize(self.index_path)
+        if size < INDEX_ENTRY.size:
+            return 1
+
+        with open(self.index_path, "rb") as index:
+            index.seek(size - size % INDEX_ENTRY.size - INDEX_ENTRY.size)
+            game_id, _ = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+
+        return game_id + 1
+
+    def append(self, kind, game_id, payload):
+        """Appends one record and its index entry, the lock must be held."""
+        offset = self.log.tell()
+        self.log.write(RECORD_HEADER.pack(kind, game_id, time.time(), len(payload)))
+        self.log.write(payload)
+        self.index.write(INDEX_ENTRY.pack(game_id, offset))
+        self.unflushed.append((game_id, offset, self.players[game_id]
+                               if kind == RECORD_START else ()))
+
+        if time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush_locked()
+
+    def start_game(self, players, array, end_tile, positions):
+        """Records the start of the game and returns its replay id."""
+        with self.lock:
+            game_id = self.next_game_id
+            self.next_game_id += 1
+
+            self.players[game_id] = tuple(players)
+            self.append(RECORD_START, game_id, encode_start(players, array, end_tile, positions))
+            return game_id
+
+    def record_moves(self, game_id, tick, moves):
+        """Records the paths accepted by the game tick."""
+        with self.lock:
+            if game_id in self.players:
+                self.append(RECORD_MOVES, game_id,
+                            encode_moves(self.players[game_id], tick, moves))
+
+    def record_win(self, game_id, player):
+        """Records that the player has reached the end tile."""
+        with self.lock:
+            if game_id in self.players:
+                self.append(RECORD_WIN, game_id, player.encode())
+
+    def end_game(self, game_id):
+        """Records the end of the game, the replay is written to the disk."""
+        with self.lock:
+            if self.players.pop(game_id, None) is None:
+                return
+
+            self.append(RECORD_END, game_id, b"")
+            self.flush_locked()
+
+    def flush(self):
+        """Writes the buffered records to the disk."""
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        """
+            Writes the buffered records to the disk and adds them to the index of games,
+            so readers see only whole records. The lock must be held.
+        """
+        self.log.flush()
+        self.index.flush()
+        self.last_flush = time.perf_counter()
+
+        for game_id, offset, players in self.unflushed:
+            self.games_index.add(game_id, offset, players)
+        self.unflushed = []
+
+    def close(self):
+        """Writes the buffered records and closes the files."""
+        with self.lock:
+            self.flush_locked()
+            self.log.close()
+            self.index.close()
+
+
+class ReplayReader:
+    """
+        Reads replays from the log written by ReplayWriter. Records are read with
+        positioned reads, so one reader can be shared by threads and it also sees
+        the records which were flushed after it was opened, when it shares the index
+        of games with the writer.
+    """
+
+    def __init__(self, directory, games_index=None):
+        """Opens the replay log, the index of games is loaded from the directory unless given."""
+        log_path = os.path.join(directory, "replays.log")
+        if games_index is None:
+            games_index = ReplayIndex.load(log_path, os.path.join(directory, "replays.idx"))
+
+        self.games_index = games_index
+        self.log = os.open(log_path, os.O_RDONLY) if os.path.exists(log_path) else None
+
+    def games(self):
+        """Returns the ids of all recorded games from the oldest one."""
+        return self.games_index.games()
+
+    def newest_game(self, player=None):
+        """Returns the id of the newest game of the player (or of anybody), or None."""
+        return self.games_index.newest_game(player)
+
+    def records(self, game_id):
+        """Yields (kind, timestamp, payload) of all records of the game in order."""
+        if self.log is None:
+            return
+
+        for offset in self.games_index.offsets_of(game_id):
+            header = os.pread(self.log, RECORD_HEADER.size, offset)
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            kind, _, timestamp, length = RECORD_HEADER.unpack(header)
+            payload = os.pread(self.log, length, offset + RECORD_HEADER.size)
+            if len(payload) < length:
+                return
+
+            yield kind, timestamp, payload
+
+    def header(self, game_id):
+        """
+            Returns the start of the game as a dictionary with players, array, end_tile,
+            positions and started_at, or None when the game was not recorded.
+        """
+        for kind, timestamp, payload in self.records(game_id):
+            if kind == RECORD_START:
+                start = decode_start(payload)
+                start["started_at"] = timestamp
+                return start
+
+        return None
+
+    def moves(self, game_id):
+        """Yields (seconds since the start, tick, {player: packed path}) of the game."""
+        players = ()
+        started_at = 0
+
+        for kind, timestamp, payload in self.records(game_id):
+            if kind == RECORD_START:
+                players = decode_start(payload)["players"]
+                started_at = timestamp
+
+            elif kind == RECORD_MOVES:
+                tick, moves = decode_moves(players, payload)
+                yield timestamp - started_at, tick, moves
+
+    def winner(self, game_id):
+        """Returns the name of the player who has won the game, or None."""
+        for kind, _, payload in self.records(game_id):
+            if kind == RECORD_WIN:
+                return bytes(payload).decode()
+
+        return None
+
+    def close(self):
+        """Closes the log."""
+        if self.log is not None:
+            os.close(self.log)
+            self.log = None
@@ -0,0 +1,158 @@
+"""
+    This module contains client-side smoothing of the movement in the maze.
+    Positions of the opponent are timestamped when they arrive and drawn
+    slightly in the past, so the opponent glides between tiles instead of
+    jumping whenever a message from the server arrives.
+"""
+
+import collections
+
+
+class OpponentInterpolator:
+    """
+        Keeps the last received positions of the opponent and computes the
+        position in which he should be drawn.
+    """
+
+    def __init__(self, start_position, timestamp, delay=0.1, max_extrapolation=0.1,
+                 history=32):
+        """
+            Initializes the interpolator with the start position of the opponent.
+            `delay` is how far in the past the opponent is drawn and
+            `max_extrapolation` is how long the last movement is continued when
+            no newer position has arrived.
+        """
+        self.delay = delay
+        self.max_extrapolation = max_extrapolation
+        self.samples = collections.deque(maxlen=history)
+        self.samples.append((timestamp, start_position))
+
+    def push(self, position, timestamp):
+        """
+            Adds a newly received position. When the position is not next to the
+            previous one, interpolating between them would go through the walls,
+            so the opponent is moved there directly.
+        """
+        last_timestamp, (last_x, last_y) = self.samples[-1]
+        timestamp = max(timestamp, last_timestamp)
+
+        if abs(position[0] - last_x) + abs(position[1] - last_y) > 1:
+            self.samples.clear()
+
+        self.samples.append((timestamp, position))
+
+    def push_path(self, path, timestamp, step_interval):
+        """
+            Adds the path segment received at once. Its steps are spread over the
+            time the opponent needed to make them, at most step_interval per step.
+        """
+        last_timestamp, last_position = self.samples[-1]
+        start = max(last_timestamp, timestamp - len(path) * step_interval)
+        if start > last_timestamp:
+            self.samples.append((start, last_position))
+
+        for number, position in enumerate(path, start=1):
+            self.push(position, start + (timestamp - start) * number / len(path))
+
+    def latest(self):
+        """Returns the newest received position."""
+        return self.samples[-1][1]
+
+    def position(self, now, is_walkable=None):
+        """
+            Returns the (x, y) position as floats in which the opponent should be
+            drawn at time `now`. `is_walkable(x, y)` is used to stop extrapolation
+            in front of a wall.
+        """
+        render_time = now - self.delay
+
+        while len(self.samples) > 2 and self.samples[1][0] <= render_time:
+            self.samples.popleft()
+
+        first_time, (first_x, first_y) = self.samples[0]
+        if render_time <= first_time:
+            return float(first_x), float(first_y)
+
+        for (start_time, start), (end_time, end) in zip(self.samples,
+                                                        list(self.samples)[1:]):
+            if start_time <= render_time < end_time:
+                ratio = (render_time - start_time) / (end_time - start_time)
+                return (start[0] + (end[0] - start[0]) * ratio,
+                        start[1] + (end[1] - start[1]) * ratio)
+
+        return self.extrapolate(render_time, is_walkable)
+
+    def extrapolate(self, render_time, is_walkable=None):
+        """
+            Continues the last step of the opponent for at most max_extrapolation
+            seconds and never further than half of the tile.
+        """
+        last_time, (last_x, last_y) = self.samples[-1]
+        if len(self.samples) < 2 or render_time <= last_time:
+            return float(last_x), float(last_y)
+
+        previous_time, (previous_x, previous_y) = self.samples[-2]
+        step_x, step_y = last_x - previous_x, last_y - previous_y
+        if (step_x, step_y) == (0, 0) or last_time <= previous_time:
+            return float(last_x), float(last_y)
+
+        if is_walkable is not None and not is_walkable(last_x + step_x, last_y + step_y):
+            return float(last_x), float(last_y)
+
+        elapsed = min(render_time - last_time, self.max_extrapolation)
+        ratio = min(0.5, elapsed / (last_time - previous_time))
+
+        return last_x + step_x * ratio, last_y + step_y * ratio
+
+
+class MovePredictor:
+    """
+        Remembers the moves which were already drawn, but were not yet
+        acknowledged by the server. When the server answers with a different
+        position, the moves which are still pending are replayed from it.
+    """
+
+    def __init__(self):
+        """Initializes the predictor without any pending moves."""
+        self.sequence = 0
+        self.pending_moves = collections.deque()
+
+    def predict(self, path):
+        """Stores the predicted path segment and returns its sequence number."""
+        self.sequence += 1
+        self.pending_moves.append((self.sequence, tuple(path)))
+        return self.sequence
+
+    def reconcile(self, sequence, server_position, is_valid_step):
+        """
+            Removes the moves acknowledged by the server. When the server confirmed
+            a different position than predicted, returns the position in which the
+            player should be now, otherwise None. Moves which are not valid from
+            the position confirmed by the server are dropped.
+        """
+        predicted_position = None
+        while self.pending_moves and self.pending_moves[0][0] <= sequence:
+            _, path = self.pending_moves.popleft()
+            predicted_position = path[-1]
+
+        if predicted_position == server_position or predicted_position is None:
+            return None
+
+        position = server_position
+        replayed_moves = collections.deque()
+        for pending_sequence, path in self.pending_moves:
+            replayed_path = []
+            for step in path:
+                if not is_valid_step(position, step):
+                    break
+                position = step
+                replayed_path.append(step)
+
+            if replayed_path:
+                replayed_moves.append((pending_sequence, tuple(replayed_path)))
+
+            if len(replayed_path) < len(path):
+                break
+
+        self.pending_moves = replayed_moves
+        return position
@@ -0,0 +1,215 @@
+"""
+    This module collects the metrics of the server and serves them to a scraper.
+    Counters and histograms are kept per metric name and a set of labels,
+    gauges are read by callbacks only when the metrics are requested.
+    The metrics are rendered in the Prometheus text exposition format and served
+    over HTTP on the local address only, together with the administration commands.
+"""
+
+import bisect
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labels, extra=()):
+    """Formats the labels (tuple of (name, value)) as {name="value",...}."""
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f"{name}=\"{value}\"" for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    """Formats the number as Prometheus expects it."""
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Number of observed values in fixed buckets, together with their sum."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Initializes empty buckets, every value falls into the first bucket not smaller."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Adds the value to its bucket."""
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Returns (upper bound, number of values not bigger) for every bucket and +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+
+        result.append((float("inf"), self.count))
+        return result
+
+
+class Metrics:
+    """Registry of counters, histograms and gauges of the server."""
+
+    def __init__(self, prefix=""):
+        """Initializes an empty registry, all metric names start with the prefix."""
+        self.prefix = prefix
+        self.lock = threading.Lock()
+
+        self.descriptions = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def describe(self, name, kind, text):
+        """Sets the type (counter, histogram or gauge) and the help text of the metric."""
+        self.descriptions[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        """Adds amount to the counter with the labels."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Adds the value to the histogram with the labels."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def gauge(self, name, text, callback):
+        """
+            Registers the gauge, the callback returns its value when the metrics are
+            rendered. It can also return a dictionary {labels tuple: value}.
+        """
+        self.describe(name, "gauge", text)
+        self.gauges[name] = callback
+
+    def value(self, name, **labels):
+        """Returns the current value of the counter with the labels."""
+        with self.lock:
+            return self.counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def histogram(self, name, **labels):
+        """Returns the histogram with the labels, or None when nothing was observed."""
+        with self.lock:
+            return self.histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def header(self, name, default_kind):
+        """Returns the HELP and TYPE lines of the metric."""
+        kind, text = self.descriptions.get(name, (default_kind, name))
+        full_name = self.prefix + name
+        return [f"# HELP {full_name} {text}", f"# TYPE {full_name} {kind}"]
+
+    def render_gauge(self, name, callback):
+        """Returns the lines of the gauge, a failing callback is skipped."""
+        try:
+            value = callback()
+        except Exception:  # pylint: disable=broad-exception-caught
+            return []
+
+        series = value if isinstance(value, dict) else {(): value}
+        lines = self.header(name, "gauge")
+        for key, series_value in sorted(series.items()):
+            lines.append(f"{self.prefix}{name}{format_labels(key)} {format_value(series_value)}")
+        return lines
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.extend(self.header(name, "counter"))
+                for key, value in sorted(series.items()):
+                    lines.append(f"{self.prefix}{name}{format_labels(key)} {format_value(value)}")
+
+            for name, series in sorted(self.histograms.items()):
+                lines.extend(self.header(name, "histogram"))
+                full_name = self.prefix + name
+                for key, histogram in sorted(series.items()):
+                    for bound, count in histogram.cumulative():
+                        labels = format_labels(key, (("le", format_value(float(bound))),))
+                        lines.append(f"{full_name}_bucket{labels} {count}")
+                    lines.append(f"{full_name}_sum{format_labels(key)} "
+                                 f"{format_value(float(histogram.sum))}")
+                    lines.append(f"{full_name}_count{format_labels(key)} {histogram.count}")
+
+        for name, callback in sorted(self.gauges.items()):
+            lines.extend(self.render_gauge(name, callback))
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+        Answers GET /metrics with the rendered metrics of the server and other paths
+        with the result of the command registered for the path.
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Sends the metrics or the result of the command, other paths are not found."""
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path == "/metrics":
+            text = self.server.metrics.render()
+
+        elif url.path in self.server.commands:
+            query = {name: values[-1] for name, values in
+                     urllib.parse.parse_qs(url.query).items()}
+            text = self.server.commands[url.path](query)
+            if text is None:
+                self.send_error(409, "Command is already running")
+                return
+
+        else:
+            self.send_error(404)
+            return
+
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Requests of the scraper are not logged."""
+
+
+def serve_metrics(metrics, host="127.0.0.1", port=0, commands=None):
+    """
+        Starts the HTTP endpoint with the metrics in a daemon thread. The commands map
+        paths to callbacks, which get the query as a dictionary and return the text of
+        the response (or None when the command can not run now).
+        Returns the HTTP server, its address is in server_address.
+    """
+    http_server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    http_server.daemon_threads = True
+    http_server.metrics = metrics
+    http_server.commands = commands or {}
+
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    return http_server
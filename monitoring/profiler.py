@@ -0,0 +1,173 @@
+"""
+    This module profiles the running server without restarting it.
+
+    The sampling profiler reads the stacks of the selected threads a few hundred
+    times per second and counts them in the collapsed stack format
+    ("outer;inner;innermost count" per line), which is read by flamegraph.pl,
+    speedscope and similar tools. The memory tracker compares tracemalloc
+    snapshots, so the code where the memory grows between two snapshots is found.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+
+def frame_label(frame):
+    """Returns the name of the function with its file and first line."""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(thread_name, frame):
+    """Returns the stack of the frame from the outermost call, starting with the thread."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+def format_collapsed(samples):
+    """Formats the counted stacks, one "stack count" per line."""
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads whose name starts with one of the prefixes."""
+
+    def __init__(self, thread_prefixes=None, interval=0.005):
+        """
+            Initializes the profiler, all threads are sampled when thread_prefixes is None.
+            The stacks are read every interval seconds.
+        """
+        self.thread_prefixes = tuple(thread_prefixes) if thread_prefixes else None
+        self.interval = interval
+        self.lock = threading.Lock()
+
+    def sampled_threads(self):
+        """Returns {thread id: thread name} of the threads which are sampled."""
+        current = threading.get_ident()
+        return {
+            thread.ident: thread.name for thread in threading.enumerate()
+            if thread.ident != current and (
+                self.thread_prefixes is None or thread.name.startswith(self.thread_prefixes))
+        }
+
+    def sample(self, samples):
+        """Adds the current stacks of the sampled threads to the counter."""
+        names = self.sampled_threads()
+        for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if ident in names:
+                samples[collapse_stack(names[ident], frame)] += 1
+
+    def profile(self, seconds):
+        """
+            Samples the threads for the given number of seconds and returns the counter
+            of collapsed stacks. Returns None when another profile is running.
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+
+        try:
+            samples = Counter()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                self.sample(samples)
+                time.sleep(self.interval)
+            return samples
+        finally:
+            self.lock.release()
+
+    def profile_to_file(self, seconds, path):
+        """
+            Profiles the threads and writes the collapsed stacks to the file.
+            Returns the collapsed stacks, or None when another profile is running.
+        """
+        samples = self.profile(seconds)
+        if samples is None:
+            return None
+
+        collapsed = format_collapsed(samples)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(collapsed)
+        return collapsed
+
+
+class MemoryTracker:
+    """
+        Compares tracemalloc snapshots. Tracing starts with the first snapshot, unless
+        it was started earlier (for example by PYTHONTRACEMALLOC), so allocations made
+        before it are not visible.
+    """
+
+    def __init__(self, frames=5, limit=25, sizes=None):
+        """
+            Initializes the tracker, every allocation keeps frames frames of its stack and
+            limit biggest differences are reported. The sizes callback returns a dictionary
+            {name: length} of the containers of the server, which are reported too.
+        """
+        self.frames = frames
+        self.limit = limit
+        self.sizes = sizes
+
+        self.previous = None
+        self.previous_sizes = {}
+        self.lock = threading.Lock()
+
+    def take_snapshot(self):
+        """Takes a snapshot without the allocations of tracemalloc itself."""
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def diff(self):
+        """
+            Takes a snapshot and returns the report of the differences against the previous
+            one. The first call only starts tracing and remembers the first snapshot.
+        """
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+
+            snapshot = self.take_snapshot()
+            sizes = self.sizes() if self.sizes is not None else {}
+            previous, self.previous = self.previous, snapshot
+            previous_sizes, self.previous_sizes = self.previous_sizes, sizes
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB"]
+
+        for name, length in sorted(sizes.items()):
+            change = length - previous_sizes.get(name, length)
+            lines.append(f"{name}: {length} ({change:+d})")
+
+        if previous is None:
+            lines.append("First snapshot taken, the next one is compared with it.")
+            return "\n".join(lines) + "\n"
+
+        lines.append(f"Top {self.limit} differences:")
+        for statistic in snapshot.compare_to(previous, "traceback")[:self.limit]:
+            lines.append(f"{statistic.size_diff / 1024:+.1f} KiB, "
+                         f"{statistic.count_diff:+d} blocks, "
+                         f"{statistic.size / 1024:.1f} KiB total")
+            lines.extend(f"    {line}" for line in statistic.traceback.format())
+
+        return "\n".join(lines) + "\n"
+
+    def diff_to_file(self, path):
+        """Writes the report of diff to the file and returns it."""
+        report = self.diff()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(report)
+        return report
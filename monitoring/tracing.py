@@ -0,0 +1,89 @@
+"""
+    This module records trace events of the message lifecycle into a ring buffer.
+    Recording an event only appends a tuple to a bounded deque, so tracing can stay
+    enabled all the time, the oldest events are dropped when the buffer is full.
+    The buffer is exported in the Chrome trace event format, which is opened by
+    chrome://tracing or https://ui.perfetto.dev. Timestamps are taken from the wall
+    clock, so the traces of the server and the clients on one machine can be
+    loaded together and a move can be followed from one client to another.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """Ring buffer of trace events of one process."""
+
+    def __init__(self, process_name, capacity=65536, enabled=True):
+        """Initializes an empty buffer which keeps the newest capacity events."""
+        self.process_name = process_name
+        self.enabled = enabled
+        self.events = collections.deque(maxlen=capacity)
+        self.pid = os.getpid()
+
+    @staticmethod
+    def now():
+        """Returns the current time in microseconds used by the trace events."""
+        return time.time_ns() // 1000
+
+    def instant(self, name, **args):
+        """Records an event without duration."""
+        if self.enabled:
+            self.events.append((name, "i", self.now(), 0, threading.get_ident(), args))
+
+    def complete(self, name, start, **args):
+        """Records an event which started at start (taken from now) and ends now."""
+        if self.enabled:
+            self.events.append((name, "X", start, self.now() - start,
+                                threading.get_ident(), args))
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Records the time spent in the with block as one event."""
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.complete(name, start, **args)
+
+    def clear(self):
+        """Removes all recorded events."""
+        self.events.clear()
+
+    def export(self):
+        """Returns the recorded events as a dictionary in the Chrome trace event format."""
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        events = list(self.events)
+
+        trace_events = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                         "args": {"name": self.process_name}}]
+
+        for tid in sorted({event[4] for event in events}):
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                                 "args": {"name": thread_names.get(tid, str(tid))}})
+
+        for name, phase, timestamp, duration, tid, args in events:
+            trace_event = {"name": name, "cat": "mazemadness", "ph": phase, "ts": timestamp,
+                           "pid": self.pid, "tid": tid, "args": args}
+            if phase == "X":
+                trace_event["dur"] = duration
+            else:
+                trace_event["s"] = "t"
+            trace_events.append(trace_event)
+
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export_json(self):
+        """Returns the exported events as a JSON string."""
+        return json.dumps(self.export(), default=str)
+
+    def write(self, path):
+        """Writes the exported events into the file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.export_json())
@@ -0,0 +1,83 @@
+"""
+    This module watches the handlers of messages for ones which take too long.
+    A handler only marks its start and end, a separate thread checks the running
+    handlers a few times per budget and captures the stack of the thread which
+    exceeded the budget, so the place where it blocks is known afterwards.
+"""
+
+import sys
+import threading
+import time
+import traceback
+
+
+def print_slow_handler(info, client, elapsed, stack):
+    """Default report of a slow handler."""
+    print(f"Slow handler {info} of {client} running for {elapsed * 1000:.0f} ms:\n"
+          f"{''.join(stack)}", end="")
+
+
+class HandlerWatchdog:
+    """Reports handlers running longer than the budget together with their stack."""
+
+    def __init__(self, budget=0.1, on_slow=print_slow_handler, checks_per_budget=4):
+        """
+            Initializes the watchdog, on_slow(info, client, elapsed, stack) is called once
+            for every handler running longer than budget seconds.
+            The running handlers are checked checks_per_budget times per budget.
+        """
+        self.budget = budget
+        self.on_slow = on_slow
+        self.interval = budget / checks_per_budget
+
+        self.running = {}
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+
+        self.slow_handlers = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        """Starts the watching thread."""
+        self.thread.start()
+
+    def begin(self, info, client):
+        """Marks the start of the handler of the message in the current thread."""
+        with self.lock:
+            self.running[threading.get_ident()] = [time.perf_counter(), info, client, False]
+
+    def end(self):
+        """Marks the end of the handler in the current thread."""
+        with self.lock:
+            self.running.pop(threading.get_ident(), None)
+
+    def check(self, now=None):
+        """Reports the handlers which exceeded the budget and were not reported yet."""
+        now = time.perf_counter() if now is None else now
+
+        with self.lock:
+            slow = []
+            for ident, entry in self.running.items():
+                if not entry[3] and now - entry[0] > self.budget:
+                    entry[3] = True
+                    slow.append((ident, now - entry[0], entry[1], entry[2]))
+
+        if not slow:
+            return
+
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        for ident, elapsed, info, client in slow:
+            frame = frames.get(ident)
+            stack = traceback.format_stack(frame) if frame is not None else []
+
+            self.slow_handlers += 1
+            self.on_slow(info, client, elapsed, stack)
+
+    def run(self):
+        """Checks the running handlers until the watchdog is closed."""
+        while not self.closed.wait(self.interval):
+            self.check()
+
+    def close(self):
+        """Stops the watching thread."""
+        self.closed.set()
@@ -1,4 +1,3 @@
-import time
 import pygame
 
 from communication import communication, message
@@ -19,11 +18,12 @@ class GameScene(Scene):
         super().__init__()
         self.switch_scene_callback = switch_scene_callback
         self.font = pygame.font.Font(None, 36)
-        self.opponent = None
+        self.opponents = ()
         self.maze = None
 
-        self.last_time = None
-        self.max_speed = 8
+        self.move_cooldown = 0
+        self.max_speed = config.MAX_SPEED
+        self.key_to_function = {}
 
         self.button = None
         self.chatlog = None
@@ -51,20 +51,24 @@ class GameScene(Scene):
         Handles the loaded message and processes different types of server responses.
         """
         match loaded_message.info:
-            case "user_count_change":
-                self.user_count_change(loaded_message.data)
+            case "presence_delta":
+                self.apply_presence_delta(loaded_message.data)
 
-            case "left_game":
-                config.scene_manager.switch_scene("MenuScene")
+            case "presence_snapshot":
+                self.apply_presence_snapshot(loaded_message.data)
 
-            case "opponent_changed_position":
-                self.maze.move_opponent(loaded_message.data)
+            case "left_game":
+                self.remove_opponent(loaded_message.data)
 
-            case "player_has_won_a_game":
-                config.scores[loaded_message.data] += 1
+            case "game_state_delta":
+                self.apply_state_delta(loaded_message.data)
 
             case "public_message":
-                self.chatlog.add_message(loaded_message.data)
+                config.scene_manager.scenes["MenuScene"].chatlog.add_message(loaded_message.data)
+
+            case "history_page":
+                config.scene_manager.scenes["MenuScene"].chatlog.prepend_history(
+                    loaded_message.data)
 
             case "private_message":
                 self.chatlog.add_message(loaded_message.data, True)
@@ -75,10 +79,36 @@ class GameScene(Scene):
             case _:
                 ...
 
+    def apply_state_delta(self, delta):
+        """
+        Moves the opponents by the steps from the game tick and reconciles the
+        player's position with his acknowledgement from the server.
+        """
+        tick, moves, acknowledgements = delta
+
+        with config.tracer.span("apply state delta", tick=tick, players=list(moves)):
+            for opponent, packed_path in moves.items():
+                if opponent != self.my_name:
+                    self.maze.move_opponent(opponent, packed_path)
+
+            if self.my_name in acknowledgements:
+                self.maze.acknowledge_position(*acknowledgements[self.my_name])
+
+    def remove_opponent(self, opponent):
+        """
+        Removes the opponent who left the room, the game ends when nobody is left.
+        """
+        self.opponents = tuple(name for name in self.opponents if name != opponent)
+        self.maze.remove_opponent(opponent)
+
+        if not self.opponents:
+            config.scene_manager.switch_scene("MenuScene")
+
     def remove_challenges(self, players):
-        """When challenge becomes invalid - the player started playing other game,
-           function removes those two players from received challenges."""
+        """When challenge becomes invalid - the player started playing other game
+           or left, function removes those players from sent and received challenges."""
         config.challenges_received = config.challenges_received - set(players)
+        config.challenges_send = config.challenges_send - set(players)
 
     def update(self, dt):
         """
@@ -89,43 +119,37 @@ class GameScene(Scene):
         if self.maze.win:
             return
 
-        key_to_function = {
-            pygame.K_w: self.maze.move_up,
-            pygame.K_a: self.maze.move_left,
-            pygame.K_s: self.maze.move_down,
-            pygame.K_d: self.maze.move_right,
-        }
+        self.maze.update(dt)
+        self.move_cooldown = max(0, self.move_cooldown - dt)
+        if self.move_cooldown > 0:
+            return
 
         keys = pygame.key.get_pressed()
 
-        for key, action in key_to_function.items():
+        for key, action in self.key_to_function.items():
             if keys[key]:
-                if self.last_time is None:
-                    self.last_time = time.time()
-
-                elif time.time() - self.last_time < 1 / self.max_speed:
-                    return
-
-                self.last_time = time.time()
+                self.move_cooldown = 1 / self.max_speed
                 action()
+                return
 
-    def set_opponent(self, opponent):
-        """
-        Sets the opponent's name for the game.
-        """
-        self.opponent = opponent
-
-    def set_names(self, names):
+    def set_opponents(self, players):
         """
-        Sets the names of the player and the opponent.
+        Sets the names of the opponents from the names of all players in the room.
         """
-        self.my_name, self.opponent = names
+        self.opponents = tuple(player for player in players if player != config.CLIENT_NAME)
 
     def set_maze(self, generated_maze):
         """
         Sets the maze for the game and initializes the button and chatlog.
         """
-        self.maze = Maze(generated_maze, self.opponent, self.send_winning_message)
+        self.maze = Maze(generated_maze, self.opponents, self.send_winning_message)
+        self.key_to_function = {
+            pygame.K_w: self.maze.move_up,
+            pygame.K_a: self.maze.move_left,
+            pygame.K_s: self.maze.move_down,
+            pygame.K_d: self.maze.move_right,
+        }
+        self.move_cooldown = 0
         self.init_button()
 
     def on_enter(self):
@@ -151,7 +175,7 @@ class GameScene(Scene):
         """
         left_message = message.Message()
         left_message.info = "leaving_game"
-        left_message.data = self.opponent
+        left_message.data = self.opponents
 
         communication.send_object(left_message, config.client)
         config.scene_manager.switch_scene("MenuScene")
@@ -172,7 +196,7 @@ class GameScene(Scene):
         screen.fill((250, 250, 250))
         self.chatlog.draw(screen)
 
-        text = f"You are playing against: {self.opponent}"
+        text = f"You are playing against: {', '.join(self.opponents)}"
         color = config.RED
 
         opponent_text = self.font.render(text, True, color)
@@ -187,10 +211,9 @@ class GameScene(Scene):
         if self.maze.win is None:
             return
 
-        winner_name = self.opponent if self.maze.win == "opponent" else self.my_name
-        color = config.GREEN if self.maze.win == "me" else config.RED
+        color = config.GREEN if self.maze.win == self.my_name else config.RED
 
-        render_text = self.font.render(f"{winner_name} has won!", True, color)
+        render_text = self.font.render(f"{self.maze.win} has won!", True, color)
 
         text_width = render_text.get_width()
         text_height = render_text.get_height()
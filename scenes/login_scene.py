@@ -37,18 +37,25 @@ class LoginScene(Scene):
                 config.users_names = loaded_message.data[0]
                 config.live_games = set(loaded_message.data[1])
                 config.scores = loaded_message.data[2]
+                config.leaderboard.reset(config.scores)
                 config.public_messages = loaded_message.data[3]
+                config.presence_version = loaded_message.data[4]
+                config.presence_snapshot_requested = False
+                config.tracer.process_name = f"client {config.CLIENT_NAME}"
+                self.apply_pending_presence_deltas()
 
+                config.scene_manager.scenes["MenuScene"].chatlog.set_messages(
+                    config.public_messages, loaded_message.data[5])
                 config.scene_manager.switch_scene("MenuScene")
                 config.scene_manager.scenes["MenuScene"].set_players(loaded_message.data)
 
+            case "presence_delta":
+                config.pending_presence_deltas[loaded_message.data[0]] = loaded_message.data
+
             case "wrong_login_name":
                 self.error_message = "Name is already taken."
                 self.error_timer = 3
 
-            case "user_count_change":
-                self.user_count_change(loaded_message.data)
-
             case _:
                 pass
 
@@ -5,6 +5,15 @@ from widgets.chatlog import Chatlog
 
 from .scene import Scene
 
+SPECTATE_REFUSALS = {
+    "not_playing": "{} is not playing now",
+    "racing": "You can not watch while playing",
+    "full": "The game of {} has too many spectators",
+    "no_replay": "There is no recorded game to watch",
+}
+NOTICE_DURATION = 4
+LEADERBOARD_SIZE = 8
+
 
 class MenuScene(Scene):
     def __init__(self, switch_scene_callback):
@@ -15,6 +24,7 @@ class MenuScene(Scene):
         super().__init__()
         self.switch_scene_callback = switch_scene_callback
         self.font = pygame.font.Font(None, 36)
+        self.notice_font = pygame.font.Font(None, 26)
         self.players = set()
 
         self.player_scroll_offset = 0
@@ -25,6 +35,15 @@ class MenuScene(Scene):
 
         self.player_rects = []
         self.challenges_rects = []
+        self.queue_button_rect = None
+        self.replay_button_rect = None
+
+        self.notice = None
+        self.notice_time = 0
+
+        self.leaderboard_shown = False
+        self.leaderboard_page = None
+        self.leaderboard_button_rect = None
 
         self.text_start_offset = 20
         self.space_between_list_items = 40
@@ -37,8 +56,11 @@ class MenuScene(Scene):
         Handles server responses based on the loaded message.
         """
         match loaded_message.info:
-            case "user_count_change":
-                self.user_count_change(loaded_message.data)
+            case "presence_delta":
+                self.apply_presence_delta(loaded_message.data)
+
+            case "presence_snapshot":
+                self.apply_presence_snapshot(loaded_message.data)
 
             case "received_challenge":
                 config.challenges_received.add(loaded_message.data)
@@ -50,8 +72,11 @@ class MenuScene(Scene):
                     ...
 
             case "accepted_challenge":
+                config.challenges_received.clear()
+                config.challenges_send.clear()
+                config.in_queue = False
 
-                config.scene_manager.scenes["GameScene"].set_opponent(loaded_message.data[0])
+                config.scene_manager.scenes["GameScene"].set_opponents(loaded_message.data[0])
                 config.scene_manager.scenes["GameScene"].set_maze(loaded_message.data[1])
 
                 config.scene_manager.switch_scene("GameScene")
@@ -59,23 +84,36 @@ class MenuScene(Scene):
             case "left_game":
                 ...
 
-            case "player_has_won_a_game":
-
-                config.scores[loaded_message.data] += 1
-
             case "public_message":
                 self.chatlog.add_message(loaded_message.data)
 
+            case "history_page":
+                self.chatlog.prepend_history(loaded_message.data)
+
             case "challenge_no_longer_valid":
                 self.remove_challenges(loaded_message.data)
 
+            case "spectate_snapshot":
+                config.scene_manager.scenes["SpectatorScene"].set_snapshot(loaded_message.data)
+                config.scene_manager.switch_scene("SpectatorScene")
+
+            case "leaderboard":
+                self.leaderboard_page = loaded_message.data
+
+            case "spectate_refused":
+                self.refuse_spectating(*loaded_message.data)
+
+            case "queue_status":
+                config.in_queue, config.queue_length = loaded_message.data
+
             case _:
                 ...
 
     def remove_challenges(self, players):
-        """When challenge becomes invalid - the player started playing other game,
-           function removes those two players from received challenges."""
+        """When challenge becomes invalid - the player started playing other game
+           or left, function removes those players from sent and received challenges."""
         config.challenges_received = config.challenges_received - set(players)
+        config.challenges_send = config.challenges_send - set(players)
 
     def send_public_message(self):
         """
@@ -121,6 +159,40 @@ class MenuScene(Scene):
         challenge.data = opponent
         communication.send_object(challenge, config.client)
 
+    def spectate(self, player):
+        """
+        Asks the server to watch the game of the specified player.
+        """
+        spectate_message = message.Message()
+        spectate_message.info = "spectate"
+        spectate_message.data = player
+
+        communication.send_object(spectate_message, config.client)
+
+    def refuse_spectating(self, target, reason):
+        """
+        Tells the user why the server refused to show the game or the replay.
+        """
+        self.show_notice(SPECTATE_REFUSALS.get(reason, "The game can not be watched")
+                         .format(target))
+
+    def show_notice(self, text):
+        """
+        Shows the text under the menu buttons for NOTICE_DURATION seconds.
+        """
+        self.notice = text
+        self.notice_time = NOTICE_DURATION
+
+    def watch_replay(self, replay_id=None):
+        """
+        Asks the server to play the replay, the newest game of the player by default.
+        """
+        replay_message = message.Message()
+        replay_message.info = "watch_replay"
+        replay_message.data = replay_id
+
+        communication.send_object(replay_message, config.client)
+
     def accept_challenge(self, opponent):
         """
         Accepts a challenge from the specified opponent.
@@ -131,6 +203,74 @@ class MenuScene(Scene):
 
         communication.send_object(answer, config.client)
 
+    def toggle_leaderboard(self):
+        """
+        Shows the best players of all time instead of the challenges, or hides them.
+        """
+        self.leaderboard_shown = not self.leaderboard_shown
+        self.challenges_rects.clear()
+
+        if self.leaderboard_shown:
+            self.fetch_leaderboard()
+
+    def fetch_leaderboard(self):
+        """
+        Asks the server for the best players and the rank of the player.
+        """
+        request = message.Message()
+        request.info = "fetch_leaderboard"
+        request.data = LEADERBOARD_SIZE
+
+        communication.send_object(request, config.client)
+
+    def toggle_queue(self):
+        """
+        Joins the matchmaking queue, or leaves it when the player is already waiting.
+        """
+        queue_message = message.Message()
+        queue_message.info = "leave_queue" if config.in_queue else "join_queue"
+        communication.send_object(queue_message, config.client)
+
+    def draw_queue_button(self, screen):
+        """
+        Draws the button for joining and leaving the matchmaking queue.
+        """
+        if config.in_queue:
+            text = f"Searching... ({config.queue_length} waiting)"
+        else:
+            text = "Find opponent"
+
+        self.queue_button_rect = self.draw_text_button(screen, text, config.window_height - 40)
+
+    def draw_leaderboard_button(self, screen):
+        """
+        Draws the button switching between the challenges and the best players.
+        """
+        text = "Show challenges" if self.leaderboard_shown else "Best players"
+        self.leaderboard_button_rect = self.draw_text_button(screen, text,
+                                                             config.window_height - 235)
+
+    def draw_replay_button(self, screen):
+        """
+        Draws the button for watching the replay of the last game.
+        """
+        self.replay_button_rect = self.draw_text_button(screen, "Watch last game",
+                                                        config.window_height - 95)
+
+    def draw_text_button(self, screen, text, y):
+        """
+        Draws the text button centered in the challenges column and returns its rect.
+        """
+        mouse_x, mouse_y = pygame.mouse.get_pos()
+        button_text = self.font.render(text, True, config.WHITE)
+
+        button_rect = button_text.get_rect(center=(config.window_width / 2, y)).inflate(20, 16)
+
+        color = config.GREEN if button_rect.collidepoint(mouse_x, mouse_y) else config.BLUE
+        pygame.draw.rect(screen, color, button_rect)
+        screen.blit(button_text, button_text.get_rect(center=button_rect.center))
+        return button_rect
+
     def draw_players(self, screen):
         """
         Draws the list of players on the screen.
@@ -141,8 +281,7 @@ class MenuScene(Scene):
         self.max_scroll = max(0, (len(config.users_names) * self.space_between_list_items) - (
                 screen.get_height() - 180))
 
-        for (player, score) in sorted(config.scores.items(), key=lambda item: item[1],
-                                      reverse=True):
+        for (player, score) in config.leaderboard.ranking():
 
             player_text_color = (0, 0, 0) if player != config.CLIENT_NAME else (0, 180, 0)
             player_text = self.font.render(f"{score}. {player}", True,
@@ -172,30 +311,49 @@ class MenuScene(Scene):
         mouse_x, mouse_y = pygame.mouse.get_pos()
         y_offset = 85 - self.challenges_scroll_offset
 
-        try:
-            for position, challenge in enumerate(config.challenges_received):
-                challenge_text = self.font.render(f"{position + 1}. {challenge}", True,
-                                                  config.BLACK)
+        for position, challenge in enumerate(config.challenges_received):
+            challenge_text = self.font.render(f"{position + 1}. {challenge}", True,
+                                              config.BLACK)
+
+            text_rect = challenge_text.get_rect(
+                topleft=(config.window_width / 3 + self.text_start_offset, y_offset))
 
-                text_rect = challenge_text.get_rect(
-                    topleft=(config.window_width / 3 + self.text_start_offset, y_offset))
+            if text_rect.collidepoint(mouse_x, mouse_y):
+                challenge_text = self.font.render(f"{position + 1}. {challenge}", True,
+                                                  config.GREEN)
 
-                if text_rect.collidepoint(mouse_x, mouse_y):
-                    challenge_text = self.font.render(f"{position + 1}. {challenge}", True,
-                                                      config.GREEN)
+            if y_offset >= 80:
+                screen.blit(challenge_text,
+                            (config.window_width / 3 + self.text_start_offset, y_offset))
+                self.challenges_rects.append((text_rect, challenge))
+            y_offset += self.space_between_list_items
 
-                if y_offset >= 80:
-                    screen.blit(challenge_text,
-                                (config.window_width / 3 + self.text_start_offset, y_offset))
-                    self.challenges_rects.append((text_rect, challenge))
-                y_offset += self.space_between_list_items
+        if len(config.challenges_received) == 0:
+            player_text = self.font.render("No challenges", True, (200, 0, 0))
+            screen.blit(player_text, (config.window_width / 3 + self.text_start_offset, 85))
 
-            if len(config.challenges_received) == 0:
-                player_text = self.font.render("No challenges", True, (200, 0, 0))
-                screen.blit(player_text, (config.window_width / 3 + self.text_start_offset, 85))
+    def draw_leaderboard(self, screen):
+        """
+        Draws the best players of all time and the rank of the player received from the server.
+        """
+        x = config.window_width / 3 + self.text_start_offset
+        if self.leaderboard_page is None:
+            loading_text = self.font.render("Loading...", True, config.BLACK)
+            screen.blit(loading_text, (x, 85))
+            return
+
+        best, rank, total = self.leaderboard_page
+
+        y_offset = 85
+        for position, (player, score) in enumerate(best):
+            color = (0, 180, 0) if player == config.CLIENT_NAME else config.BLACK
+            player_text = self.font.render(f"{position + 1}. {player} ({score})", True, color)
+            screen.blit(player_text, (x, y_offset))
+            y_offset += self.space_between_list_items
 
-        except RuntimeError:
-            pass
+        if rank is not None:
+            rank_text = self.font.render(f"Your rank: {rank} of {total}", True, config.BLUE)
+            screen.blit(rank_text, (x, y_offset))
 
     def handle_event(self, event):
         """
@@ -235,17 +393,39 @@ class MenuScene(Scene):
                                 self.create_challenge(player)
                             break
 
+                elif self.queue_button_rect is not None and \
+                        self.queue_button_rect.collidepoint(mouse_x, mouse_y):
+                    self.toggle_queue()
+
+                elif self.leaderboard_button_rect is not None and \
+                        self.leaderboard_button_rect.collidepoint(mouse_x, mouse_y):
+                    self.toggle_leaderboard()
+
+                elif self.replay_button_rect is not None and \
+                        self.replay_button_rect.collidepoint(mouse_x, mouse_y):
+                    self.watch_replay()
+
                 elif config.window_width / 3 <= mouse_x <= 2 * config.window_width / 3:
                     for text_rect, challenge in self.challenges_rects:
                         if text_rect.collidepoint(mouse_x, mouse_y):
                             self.accept_challenge(challenge)
 
+            elif event.button == 3 and mouse_x < config.window_width / 3:
+                for text_rect, player in self.player_rects:
+                    if player != config.CLIENT_NAME and text_rect.collidepoint(mouse_x, mouse_y):
+                        self.spectate(player)
+                        break
+
     def update(self, dt):
         """
-        Updates the state of the scene, such as the chatlog.
+        Updates the state of the scene, such as the chatlog and the notice.
         """
         self.chatlog.update(dt)
 
+        self.notice_time = max(0, self.notice_time - dt)
+        if not self.notice_time:
+            self.notice = None
+
     def draw_menu(self, screen, titles):
         """
         Draws the menu with sections for players, challenges, and chat log.
@@ -271,19 +451,55 @@ class MenuScene(Scene):
         screen.fill(config.WHITE)
 
         self.chatlog.draw(screen)
-        self.draw_menu(screen, ["Online Players", "Challenges", "Chat log"])
+        self.draw_menu(screen, ["Online Players",
+                                "Best Players" if self.leaderboard_shown else "Challenges",
+                                "Chat log"])
 
         self.draw_players(screen)
-        self.draw_challenges(screen)
+        if self.leaderboard_shown:
+            self.draw_leaderboard(screen)
+        else:
+            self.draw_challenges(screen)
+        self.draw_leaderboard_button(screen)
+        self.draw_queue_button(screen)
+        self.draw_replay_button(screen)
+        self.draw_link_quality(screen)
+        self.draw_notice(screen)
+
+    def draw_link_quality(self, screen):
+        """
+        Draws the round-trip time and jitter of the connection to the server.
+        """
+        stats = config.latency.estimator.stats()
+        if stats["samples"]:
+            text = f"Ping {stats['rtt'] * 1000:.0f} ms, jitter {stats['jitter'] * 1000:.0f} ms"
+        else:
+            text = "Ping: measuring..."
 
-    def on_enter(self):
+        ping_text = self.font.render(text, True, config.BLACK)
+        screen.blit(ping_text, ping_text.get_rect(center=(config.window_width / 2,
+                                                           config.window_height - 140)))
+
+    def draw_notice(self, screen):
         """
-        Called when the scene becomes active.
+        Draws the notice for the user, e.g. why the game can not be watched.
         """
+        if self.notice is None:
+            return
+
+        notice_text = self.notice_font.render(self.notice, True, config.RED)
+        screen.blit(notice_text, notice_text.get_rect(center=(config.window_width / 2,
+                                                               config.window_height - 180)))
 
-        self.chatlog.set_messages(config.public_messages)
+    def on_enter(self):
+        """
+        Called when the scene becomes active, the shown best players are fetched again.
+        """
         self.chatlog.entry.active = True
 
+        if self.leaderboard_shown:
+            self.fetch_leaderboard()
+
         if config.AUTOMATIC_TESTING:
             for player in config.users_names:
                 if player != config.CLIENT_NAME:
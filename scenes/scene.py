@@ -2,10 +2,16 @@
 
 import sys
 import os
+import time
+
+import pygame
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import config
+from communication import communication, message
+from lobby.presence import apply_delta
+from widgets.perf_overlay import PerfOverlay
 
 
 class Scene:
@@ -25,17 +31,51 @@ class Scene:
         """Handles user events for the scene."""
 
 
-    def user_count_change(self, data):
-        """This method updates the list of players, scores,
-            and challenges based on the provided data."""
-        config.users_names = data[0]
-        config.scores = data[1]
+    def apply_presence_delta(self, delta):
+        """This method applies one change of the list of players or scores.
+            Deltas which arrive before the older ones wait for them, when too many
+            of them are waiting, the whole presence is requested from the server."""
+        if delta[0] > config.presence_version:
+            config.pending_presence_deltas[delta[0]] = delta
+
+        self.apply_pending_presence_deltas()
+
+    def apply_pending_presence_deltas(self):
+        """This method applies the waiting deltas which follow the current presence version."""
+        while config.presence_version + 1 in config.pending_presence_deltas:
+            version, kind, payload = config.pending_presence_deltas.pop(
+                config.presence_version + 1)
+
+            apply_delta(config.users_names, config.scores, kind, payload, config.leaderboard)
+            config.presence_version = version
+
+            if kind == "left":
+                config.challenges_received.discard(payload)
+                config.challenges_send.discard(payload)
+
+        for version in [version for version in config.pending_presence_deltas if
+                        version <= config.presence_version]:
+            del config.pending_presence_deltas[version]
+
+        if len(config.pending_presence_deltas) > config.MAX_PENDING_PRESENCE_DELTAS and \
+                not config.presence_snapshot_requested:
+            config.presence_snapshot_requested = True
+            communication.send_object(message.Message("presence_snapshot_request"),
+                                      config.client)
+
+    def apply_presence_snapshot(self, snapshot):
+        """This method replaces the list of players, scores,
+            and challenges with the snapshot from the server."""
+        config.presence_version, config.users_names, config.scores = snapshot
+        config.presence_snapshot_requested = False
+        config.leaderboard.reset(config.scores)
         config.users_names.add(config.CLIENT_NAME)
+        self.apply_pending_presence_deltas()
 
         config.challenges_received = {challenge for challenge in config.challenges_received if
-                                      challenge in data}
+                                      challenge in config.users_names}
         config.challenges_send = {challenge for challenge in config.challenges_send if
-                                  challenge in data}
+                                  challenge in config.users_names}
 
     def update(self, dt):
         """This method is called every frame to update the state of the scene."""
@@ -57,10 +97,16 @@ class Scene:
 class SceneManager:
     """Manages the transitions and handling of scenes."""
 
+    OVERLAY_KEY = pygame.K_F3
+
     def __init__(self):
-        """Initializes the SceneManager with an empty set of scenes and no active scene."""
+        """
+        Initializes the SceneManager with an empty set of scenes and no active scene.
+        The performance overlay is toggled by OVERLAY_KEY.
+        """
         self.scenes = {}
         self.current_scene = None
+        self.overlay = PerfOverlay()
 
     def add_scene(self, name, scene):
         """Adds a new scene to the manager.
@@ -81,15 +127,33 @@ class SceneManager:
 
     def handle_event(self, event):
         """This method passes events to the current scene's `handle_event` method."""
-        if self.current_scene:
+        started = time.perf_counter()
+
+        if event.type == pygame.KEYDOWN and event.key == self.OVERLAY_KEY:
+            self.overlay.toggle()
+        elif self.current_scene:
             self.current_scene.handle_event(event)
 
+        self.overlay.add_time("handle_event", time.perf_counter() - started)
+
     def update(self, dt):
         """This method calls the `update` method on the current scene."""
+        started = time.perf_counter()
+
         if self.current_scene:
             self.current_scene.update(dt)
 
+        self.overlay.add_time("update", time.perf_counter() - started)
+
     def draw(self, screen):
-        """This method calls the `draw` method on the current scene to render it to the screen."""
+        """
+        This method calls the `draw` method on the current scene to render it to the screen
+        and draws the performance overlay over it.
+        """
+        started = time.perf_counter()
+
         if self.current_scene:
             self.current_scene.draw(screen)
+
+        self.overlay.add_time("draw", time.perf_counter() - started)
+        self.overlay.draw(screen)
@@ -0,0 +1,129 @@
+import pygame
+
+from communication import communication, message
+import config
+
+from widgets.button import Button
+from maze.player_maze import Maze
+from maze.movement import unpack_maze
+
+from .scene import Scene
+
+
+class SpectatorScene(Scene):
+    def __init__(self, switch_scene_callback):
+        """
+        Initializes the SpectatorScene with the given callback function for switching scenes.
+        """
+        super().__init__()
+        self.switch_scene_callback = switch_scene_callback
+        self.font = pygame.font.Font(None, 36)
+
+        self.players = ()
+        self.maze = None
+        self.snapshot_tick = 0
+
+        self.button = None
+
+    def set_snapshot(self, snapshot):
+        """
+        Builds the watched maze from the snapshot sent by the server. Only state deltas
+        of ticks newer than the snapshot are applied afterwards.
+        """
+        self.snapshot_tick, self.players, (size, packed_maze), end_tile, positions = snapshot
+
+        generated_maze = {"array": unpack_maze(size, packed_maze), "end_tile": end_tile}
+        generated_maze.update(positions)
+
+        self.maze = Maze(generated_maze, self.players, None)
+        self.button = Button(x=self.calculate_mid(), y=config.window_height - 30,
+                             command=self.go_back_to_menu, text="Stop watching")
+
+    def calculate_mid(self):
+        """
+        Calculates the horizontal center position of the maze.
+        """
+        return self.maze.OFFSET_X + (config.window_width - self.maze.OFFSET_X) // 2
+
+    def handle_loaded_object(self, loaded_message):
+        """
+        Handles the messages of the watched game, the rest is handled as in the menu.
+        """
+        match loaded_message.info:
+            case "game_state_delta":
+                self.apply_state_delta(loaded_message.data)
+
+            case "left_game":
+                self.players = tuple(name for name in self.players
+                                     if name != loaded_message.data)
+                self.maze.remove_opponent(loaded_message.data)
+
+            case "spectating_ended":
+                config.scene_manager.switch_scene("MenuScene")
+
+            case "spectate_refused":
+                config.scene_manager.scenes["MenuScene"].handle_loaded_object(loaded_message)
+                config.scene_manager.switch_scene("MenuScene")
+
+            case _:
+                config.scene_manager.scenes["MenuScene"].handle_loaded_object(loaded_message)
+
+    def apply_state_delta(self, delta):
+        """
+        Moves the racers by the steps from the game tick, deltas already contained
+        in the snapshot are skipped.
+        """
+        tick, moves, _ = delta
+        if tick <= self.snapshot_tick:
+            return
+
+        for player, packed_path in moves.items():
+            self.maze.move_opponent(player, packed_path)
+
+    def update(self, dt):
+        """
+        Adjusts the smoothing of the watched racers to the measured jitter of the link.
+        """
+        if self.maze is not None:
+            self.maze.update_interpolation_delay()
+
+    def go_back_to_menu(self):
+        """
+        Tells the server that the player stopped watching and switches to the MenuScene.
+        """
+        stop_message = message.Message()
+        stop_message.info = "stop_spectating"
+
+        communication.send_object(stop_message, config.client)
+        config.scene_manager.switch_scene("MenuScene")
+
+    def draw(self, screen):
+        """
+        Draws the watched maze with all racers and the winner.
+        """
+        if self.maze is None:
+            return
+
+        screen.fill((250, 250, 250))
+
+        text = f"Watching: {', '.join(self.players)}"
+        watching_text = self.font.render(text, True, config.BLUE)
+        x, y = config.center_text(watching_text, self.calculate_mid(), 30)
+        screen.blit(watching_text, (x, y))
+
+        self.button.draw(screen)
+        self.maze.draw(screen)
+
+        if self.maze.win is None:
+            return
+
+        render_text = self.font.render(f"{self.maze.win} has won!", True, config.GOLD)
+        x, y = config.center_text(render_text, self.calculate_mid(), config.window_height // 2)
+        screen.blit(render_text, (x, y))
+
+    def on_exit(self):
+        """
+        Called when the scene is exited, the watched maze is not needed anymore.
+        """
+        self.maze = None
+        self.snapshot_tick = 0
@@ -2,11 +2,16 @@
     This module implements the server.
     When client connects to a server, new thread is created which
     communicates with him.
+
+    All state of the server belongs to one GameServer object, so tests and
+    benchmarks can run several isolated servers in one process, each of them
+    on its own port (port 0 picks a free one) and with its own data directory.
 """
 
-import random
+import os
 import time
 import socket
+import itertools
 import atexit
 import threading
 
@@ -14,462 +19,1202 @@ import sys
 import signal
 
 from communication import communication, server_utils, message
-
-import maze.maze_generator
+from communication.outbox import Outbox, PRIORITY_REALTIME, PRIORITY_CONTROL, PRIORITY_BULK
+from communication.latency import RttEstimator, answer_heartbeat
+
+from lobby.presence import Presence
+from lobby.snapshot import LobbySnapshot
+from lobby.chat_history import ChatHistory
+from lobby.challenges import ChallengeRegistry
+from lobby.matchmaking import Matchmaker
+from lobby.score_store import ScoreStore
+from maze.game_session import GameSession
+from maze.maze_generator import assign_start_positions
+from maze.maze_pool import MazePool
+from maze.movement import merge_state_frames, pack_maze
+from maze.replay import ReplayWriter, ReplayReader
+from monitoring.metrics import Metrics, serve_metrics
+from monitoring.watchdog import HandlerWatchdog
+from monitoring.profiler import SamplingProfiler, MemoryTracker
+from monitoring.tracing import Tracer
 from exceptions.my_exceptions import CommunicationError
 
 HOST = server_utils.get_local_ip()
 PORT = 65432
 MAX_CLIENTS = 20
 
-server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-server_socket.bind((HOST, PORT))
+HEARTBEAT_TIMEOUT = 10
+MAX_SPECTATORS_PER_ROOM = 8
 
-server_socket.listen(MAX_CLIENTS)
+DATA_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 
-clients = []
-clients_lock = threading.Lock()
+LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
 
-clients_name = set()
-client_to_name = {}
-names_to_client = {}
+GAME_TICK_RATE = 20
+MAX_STEPS_PER_TICK = 16
+GAME_STATE_DELTA = "game_state_delta"
 
-last_heartbeat = {}
-HEARTBEAT_TIMEOUT = 10
+ROOM_SIZE = 4
+MATCHMAKING_INTERVAL = 1
 
-client_threads = {}
-games = {}
-scores = {}
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
 
-public_messages = []
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+HANDLED_MESSAGES = frozenset({
+    "login_attempt", "disconnect", "create_challenge", "delete_challenge", "accept_challenge",
+    "change_position", "leaving_game", "player_have_won_a_game", "public_message",
+    "private_message", "fetch_history", "join_queue", "leave_queue", "spectate",
+    "fetch_leaderboard", "watch_replay", "stop_spectating", "heartbeat",
+    "presence_snapshot_request",
+})
 
-shutdown_event = threading.Event()
+HANDLER_BUDGET = 0.1
 
+PROFILE_SECONDS = 10
+MAX_PROFILE_SECONDS = 60
 
-def handler(_, __):
-    """Called when program receives SIGINT"""
-    shutdown_event.set()
-    server_socket.close()
-    sys.exit(0)
+SHUTDOWN_TIMEOUT = 1
 
 
-signal.signal(signal.SIGINT, handler)
+def message_label(info):
+    """Returns the label of the message type, unknown types share one label."""
+    return info if info in HANDLED_MESSAGES else "unknown"
 
 
-def safe_send_object(object_to_send, receiver):
+def close_connection(connection):
     """
-        Safely sends an object using the given receiver socket.
-        Removes the receiver from clients and stops its thread if an error occurs.
+        Shuts the socket down before closing it, so the threads blocked in reading
+        from it or writing to it wake up right away.
     """
     try:
-        communication.send_object(object_to_send, receiver)
-    except CommunicationError as e:
-        print(f"Communication error with receiver {receiver}: {e}")
-        with clients_lock:
-            if receiver in clients:
-                clients.remove(receiver)
-
-            if receiver in client_threads:
-                stop_client_thread(receiver)
-
-
-def client_login(name, sender):
-    """
-        Called when client tries to connect to the server.
-        Checks whether name of the clients is unique.
-    """
-
-    answer = message.Message()
-
-    answer.info = "login_successful" if name not in clients_name else "wrong_login_name"
-    if name not in clients_name:
-        clients_name.add(name)
-    answer.data = [clients_name,
-                   [tuple(players) for players in games.keys() if games[players] != []], scores,
-                   public_messages]
-    client_to_name[sender] = name
-    names_to_client[name] = sender
-    scores[name] = 0
-
-    safe_send_object(answer, sender)
-
-    answer.info = "user_count_change"
-    answer.data = [clients_name, scores]
-    for client in clients:
-        if client != sender:
-            safe_send_object(answer, client)
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        ...
+    connection.close()
 
 
-def find_player_games(name):
+def find_replay(reader, name, replay_id):
     """
-        Helper function, finds all games which player with given name is playing.
-        Player should be able to play maximally 1 game, this is just paranoia.
+        Returns the requested replay id, or the newest replay of the player when
+        replay_id is None, or the newest replay at all when the player has none.
     """
-    ans = []
-    for (first, second) in games.keys():
-        if name == first:
-            ans.append((name, second))
+    if replay_id is not None:
+        return replay_id if reader.header(replay_id) is not None else None
 
-        elif name == second:
-            ans.append((name, first))
+    newest = reader.newest_game(name)
+    return newest if newest is not None else reader.newest_game()
 
-    return ans
 
-
-def client_logout(name, sender):
+class GameServer:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
     """
-        When player sends message he logged_out, this functions sends
-        this information to all other players.
+        The game server with all its clients, rooms and stored data.
+        The socket is bound when the server is created, so address holds the real
+        port even when port 0 was requested. start() runs the server in background
+        threads and stop() stops all of them and closes every connection.
     """
 
-    if name not in clients_name:
-        return
-
-    clients_name.remove(name)
-    if sender in clients:
-        clients.remove(sender)
-
-    del scores[name]
-
-    left_message = message.Message()
-    left_message.info = "left_game"
-    player_games = find_player_games(name)
-    for game in player_games:
-        left_message.data = game
-        safe_send_object(left_message, names_to_client[game[1]])
-
-    info_message = message.Message()
-    info_message.info = "user_count_change"
-    info_message.data = [clients_name, scores]
-
-    for client in clients:
-        if client == sender:
-            continue
-
-        safe_send_object(info_message, client)
-
-
-def stop_client_thread(client_connection):
-    """Stops the thread handling the client and removes the client from the list."""
-
-    if client_connection in client_threads:
-        client_threads[client_connection].set()
-        client_threads.pop(client_connection, None)
-
-    else:
-        return
-
-    if client_connection in clients:
-        clients.remove(client_connection)
-
-    if client_connection in client_to_name:
-        client_logout(client_to_name[client_connection], client_connection)
+    def __init__(self, host=HOST, port=PORT, data_directory=DATA_DIRECTORY,
+                 metrics_port=None, max_clients=MAX_CLIENTS):
+        """
+            Binds the server to the host and port, scores, replays and profiles are
+            stored in the data directory. The metrics endpoint is served on
+            metrics_port of METRICS_HOST, it is not served when metrics_port is None.
+        """
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen(max_clients)
+        self.address = self.server_socket.getsockname()
+        self.max_clients = max_clients
+
+        self.clients = []
+        self.clients_lock = threading.Lock()
+
+        self.clients_name = set()
+        self.client_to_name = {}
+        self.names_to_client = {}
+
+        self.last_heartbeat = {}
+        self.client_rtt = {}
+
+        self.client_threads = {}
+        self.outboxes = {}
+        self.rooms = {}
+        self.player_rooms = {}
+        self.rooms_lock = threading.Lock()
+        self.room_ids = itertools.count(1)
+        self.room_spectators = {}
+        self.spectated_rooms = {}
+
+        self.replay_directory = os.path.join(data_directory, "replays")
+        self.replay_writer = ReplayWriter(self.replay_directory)
+        self.replay_reader = ReplayReader(self.replay_directory, self.replay_writer.games_index)
+        self.room_replays = {}
+        self.replay_playbacks = {}
+
+        self.score_store = ScoreStore(os.path.join(data_directory, "scores.db"))
+        self.maze_pool = MazePool()
+        self.scores = {}
+        self.presence = Presence()
+        self.lobby_snapshot = LobbySnapshot()
+        self.challenges = ChallengeRegistry()
+
+        self.matchmaker = Matchmaker(room_size=ROOM_SIZE)
+
+        self.public_messages = ChatHistory()
+
+        self.metrics = Metrics(prefix="mazemadness_")
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.register_metrics()
+
+        self.profile_directory = os.path.join(data_directory, "profiles")
+        self.profiler = SamplingProfiler(thread_prefixes=("handler",))
+        self.memory_tracker = MemoryTracker(sizes=self.container_sizes)
+        self.tracer = Tracer("server")
+        self.watchdog = HandlerWatchdog(HANDLER_BUDGET, self.report_slow_handler)
+
+        self.shutdown_event = threading.Event()
+        self.threads = []
+
+    def __enter__(self):
+        """Starts the server, used as with GameServer(...) as server."""
+        return self.start()
+
+    def __exit__(self, *_):
+        """Stops the server at the end of the with block."""
+        self.stop()
+
+    def container_sizes(self):
+        """Returns the lengths of the containers of the server, reported with memory diffs."""
+        return {
+            "clients": len(self.clients),
+            "outboxes": len(self.outboxes),
+            "last_heartbeat": len(self.last_heartbeat),
+            "client_rtt": len(self.client_rtt),
+            "rooms": len(self.rooms),
+            "player_rooms": len(self.player_rooms),
+            "room_spectators": len(self.room_spectators),
+            "room_replays": len(self.room_replays),
+            "replay_playbacks": len(self.replay_playbacks),
+            "public_messages": len(self.public_messages),
+            "challenges": len(self.challenges),
+            "matchmaker": len(self.matchmaker),
+            "score_cache": len(self.score_store.cache),
+            "scores": len(self.scores),
+        }
+
+    def profile_handlers(self, seconds=PROFILE_SECONDS):
+        """
+            Samples the stacks of the client handler threads and writes them into a file
+            in the collapsed stack format. Returns the collapsed stacks, or None when
+            another profile is running.
+        """
+        path = os.path.join(self.profile_directory,
+                            f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        collapsed = self.profiler.profile_to_file(seconds, path)
+
+        if collapsed is None:
+            print("Profiler is already running.")
+        else:
+            print(f"Profile of {seconds} s written to {path}")
+        return collapsed
+
+    def write_memory_diff(self):
+        """Writes the difference of memory since the previous call into a file and returns it."""
+        path = os.path.join(self.profile_directory,
+                            f"memory-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        report = self.memory_tracker.diff_to_file(path)
+        print(f"Memory diff written to {path}")
+        return report
+
+    def profile_command(self, query):
+        """Admin command /profile?seconds=N, responds with the collapsed stacks."""
         try:
-            del names_to_client[client_to_name[client_connection]]
-            del client_to_name[client_connection]
-        except KeyError:
-            ...
+            seconds = float(query.get("seconds", PROFILE_SECONDS))
+        except ValueError:
+            seconds = PROFILE_SECONDS
+        return self.profile_handlers(min(max(seconds, 0.1), MAX_PROFILE_SECONDS))
+
+    def safe_send_object(self, object_to_send, receiver, priority=PRIORITY_CONTROL, **options):
+        """
+            Queues an object in the outbox of the receiver, it is sent by the writer
+            thread of the receiver in the order of priority lanes.
+            Realtime objects with the same conflate_key replace (or are merged with)
+            the one which was not sent yet. Waiting objects with conflate keys in drops
+            are dropped. The options (conflate_key, merge, drops) are passed to Outbox.put.
+        """
+        outbox = self.outboxes.get(receiver)
+        if outbox is None:
+            return
+
+        outbox.put(object_to_send, priority, **options)
+
+    def drop_receiver(self, receiver):
+        """
+            Called by the writer thread when sending to the receiver fails.
+            Removes the receiver from clients and stops its thread.
+        """
+        print(f"Communication error with receiver {receiver}")
+        with self.clients_lock:
+            if receiver in self.clients:
+                self.clients.remove(receiver)
+
+            if receiver in self.client_threads:
+                self.stop_client_thread(receiver)
+
+    def build_lobby_snapshot(self):
+        """
+            Encodes the login_successful message with players, live games, scores
+            and the newest page of the chat with the cursor to the older messages.
+            Called with the presence lock held, so it matches presence.version.
+        """
+        latest_messages, history_cursor = self.public_messages.latest(HISTORY_PAGE_SIZE)
+
+        answer = message.Message()
+        answer.info = "login_successful"
+        answer.data = [self.clients_name, [room.players for room in list(self.rooms.values())],
+                       self.scores, latest_messages, self.presence.version, history_cursor]
+
+        return communication.encode_object(answer)
+
+    def broadcast_presence(self, kind, payload, excluded=None):
+        """
+            Sends the presence delta with the next version to all logged in clients except
+            the excluded one. The delta is serialized only once for all of them,
+            the encoded delta is returned.
+        """
+        with self.presence.lock:
+            delta = message.Message()
+            delta.info = "presence_delta"
+            delta.data = self.presence.next_delta(kind, payload)
+
+            frame = communication.encode_object(delta)
+            self.lobby_snapshot.record_delta(frame)
+
+            for client in list(self.client_to_name):
+                if client != excluded:
+                    self.safe_send_object(frame, client)
+
+            return frame
+
+    def send_presence_snapshot(self, sender):
+        """Sends the whole presence to the client, which has missed some presence delta."""
+        with self.presence.lock:
+            answer = message.Message()
+            answer.info = "presence_snapshot"
+            answer.data = (self.presence.version, self.clients_name, self.scores)
+
+            self.safe_send_object(answer, sender)
+
+    def client_login(self, name, sender):
+        """
+            Called when client tries to connect to the server.
+            Checks whether name of the clients is unique, his stored score is loaded
+            (a new player is stored with no points, so he is ranked).
+            The client gets the cached lobby snapshot and the presence deltas
+            which are newer than the snapshot, including his own login, all of them
+            in the bulk lane, so they arrive in order.
+        """
+
+        score = self.score_store.get(name, register=True)
+
+        with self.presence.lock:
+            if name in self.clients_name:
+                answer = message.Message()
+                answer.info = "wrong_login_name"
+                self.safe_send_object(answer, sender)
+                return
+
+            for frame in self.lobby_snapshot.frames(self.build_lobby_snapshot):
+                self.safe_send_object(frame, sender, PRIORITY_BULK)
+
+            self.clients_name.add(name)
+            self.client_to_name[sender] = name
+            self.names_to_client[name] = sender
+            self.scores[name] = score
+
+            joined_frame = self.broadcast_presence("joined", (name, self.scores[name]), sender)
+            self.safe_send_object(joined_frame, sender, PRIORITY_BULK)
+
+    def find_player_room(self, name):
+        """Returns the game session of the room in which the player plays, or None."""
+        return self.rooms.get(self.player_rooms.get(name))
+
+    def leave_room(self, name):
+        """
+            Removes the player from his room and notifies the other racers.
+            The room is closed when less than two players remain in it.
+        """
+        with self.rooms_lock:
+            room_id = self.player_rooms.pop(name, None)
+            room = self.rooms.get(room_id)
+            if room is None:
+                return
+
+            remaining = room.remove_player(name)
+            watching = set(self.room_spectators.get(room_id, ()))
+            closed = len(remaining) < 2
+
+            if closed:
+                self.close_room(room_id)
+
+        self.lobby_snapshot.invalidate()
+
+        left_message = message.Message()
+        left_message.info = "left_game"
+        left_message.data = name
+
+        frame = communication.encode_object(left_message)
+        for player in list(remaining) + list(watching):
+            self.safe_send_object(frame, self.names_to_client.get(player))
+
+        if closed:
+            ended_message = message.Message()
+            ended_message.info = "spectating_ended"
+
+            for spectator in watching:
+                self.safe_send_object(ended_message, self.names_to_client.get(spectator))
+
+    def close_room(self, room_id):
+        """
+            Removes the room, frees its racers and spectators and ends the replay
+            of the game. Called with the rooms_lock held.
+        """
+        room = self.rooms.pop(room_id)
+        watching = self.room_spectators.pop(room_id, ())
+        replay_id = self.room_replays.pop(room_id, None)
+        if replay_id is not None:
+            self.replay_writer.end_game(replay_id)
+
+        for player in room.players:
+            self.player_rooms.pop(player, None)
+        for spectator in watching:
+            self.spectated_rooms.pop(spectator, None)
+
+    def spectate(self, loaded_message, sender):
+        """
+            Subscribes the client to the room of the given player. He gets one snapshot
+            of the maze and positions and then the same state deltas as the racers.
+            Players who are racing can not watch and every room has a limited number
+            of spectators, so the fan-out does not slow down the racers. A refused
+            client gets the reason: not_playing, racing or full.
+        """
+
+        name = self.client_to_name[sender]
+        target = loaded_message.data
+
+        with self.rooms_lock:
+            room_id = self.player_rooms.get(target)
+            room = self.rooms.get(room_id)
+
+            if room is None:
+                refusal = "not_playing"
+            elif name in self.player_rooms:
+                refusal = "racing"
+            elif len(self.room_spectators.get(room_id, ())) >= MAX_SPECTATORS_PER_ROOM:
+                refusal = "full"
+            else:
+                refusal = None
 
-    client_connection.close()
+            if refusal is None:
+                previous = self.spectated_rooms.pop(name, None)
+                if previous is not None:
+                    self.room_spectators.get(previous, set()).discard(name)
 
+                self.room_spectators.setdefault(room_id, set()).add(name)
+                self.spectated_rooms[name] = room_id
 
-def create_challenge(loaded_message, sender):
-    """Sends info to the player who was challenged by other player."""
+        answer = message.Message()
 
-    player1 = client_to_name[sender]
-    player2 = loaded_message.data
+        if refusal is not None:
+            answer.info = "spectate_refused"
+            answer.data = (target, refusal)
+            self.safe_send_object(answer, sender)
+            return
 
-    answer = message.Message()
-    answer.info = "received_challenge"
-    answer.data = player1
+        tick, players, positions = room.snapshot()
 
-    opponent = None
-    for opponent_connection, name in client_to_name.items():
-        if name == player2:
-            opponent = opponent_connection
-            break
+        answer.info = "spectate_snapshot"
+        answer.data = (tick, players, pack_maze(room.array), room.maze["end_tile"], positions)
+        self.safe_send_object(answer, sender, PRIORITY_REALTIME, drops=(GAME_STATE_DELTA,))
 
-    safe_send_object(answer, opponent)
+    def stop_spectating(self, name):
+        """Unsubscribes the client from the room or the replay he is watching."""
+        playback = self.replay_playbacks.pop(name, None)
+        if playback is not None:
+            playback.set()
 
+        with self.rooms_lock:
+            room_id = self.spectated_rooms.pop(name, None)
+            if room_id in self.room_spectators:
+                self.room_spectators[room_id].discard(name)
 
-def delete_challenge(loaded_message, sender):
-    """
-        Sends info that the opponent was too scared and changed
-        his mind to play against given player.
-    """
-    player1 = client_to_name[sender]
-    player2 = loaded_message.data
+    def client_logout(self, name, sender):
+        """
+            When player sends message he logged_out, this functions sends
+            this information to all other players.
+        """
 
-    answer = message.Message()
-    answer.info = "delete_challenge"
-    answer.data = player1
+        with self.presence.lock:
+            if name not in self.clients_name:
+                return
 
-    opponent = None
-    for opponent_connection, name in client_to_name.items():
-        if name == player2:
-            opponent = opponent_connection
-            break
+            self.clients_name.remove(name)
+            if sender in self.clients:
+                self.clients.remove(sender)
 
-    safe_send_object(answer, opponent)
+            del self.scores[name]
+            self.broadcast_presence("left", name, sender)
 
+        self.score_store.evict(name)
 
-def accept_challenge(loaded_message, sender):
-    """Inform given player that his challenge was accepted."""
+        self.invalidate_challenges(name)
+        self.matchmaker.leave(name)
+        self.stop_spectating(name)
+        self.leave_room(name)
 
-    player1 = client_to_name[sender]
-    player2 = loaded_message.data
+    def stop_client_thread(self, client_connection):
+        """Stops the thread handling the client and removes the client from the list."""
 
-    players = frozenset([player1, player2])
+        if client_connection in self.client_threads:
+            self.client_threads[client_connection].set()
+            self.client_threads.pop(client_connection, None)
 
-    maze_size = random.randrange(21, 31, 2)
-    generated_maze = maze.maze_generator.bfs_maze(maze_size)
+            outbox = self.outboxes.pop(client_connection, None)
+            if outbox is not None:
+                outbox.close()
+            self.client_rtt.pop(client_connection, None)
+            self.last_heartbeat.pop(client_connection, None)
 
-    generated_maze[player1] = generated_maze["player1_start"]
-    generated_maze[player2] = generated_maze["player2_start"]
+        else:
+            return
 
-    answer = message.Message()
-    answer.info = "accepted_challenge"
-    answer.data = [player1, generated_maze]
+        if client_connection in self.clients:
+            self.clients.remove(client_connection)
 
-    opponent = None
-    for opponent_connection, name in client_to_name.items():
-        if name == player2:
-            opponent = opponent_connection
-            break
+        if client_connection in self.client_to_name:
+            self.client_logout(self.client_to_name[client_connection], client_connection)
+            try:
+                del self.names_to_client[self.client_to_name[client_connection]]
+                del self.client_to_name[client_connection]
+            except KeyError:
+                ...
+
+        close_connection(client_connection)
+
+    def invalidate_challenges(self, name):
+        """
+            Removes all challenges sent or received by the player and notifies
+            only the players who held one of them.
+        """
+        no_longer_valid = message.Message()
+        no_longer_valid.info = "challenge_no_longer_valid"
+        no_longer_valid.data = (name,)
 
-    safe_send_object(answer, opponent)
+        for other in self.challenges.remove_player(name):
+            self.safe_send_object(no_longer_valid, self.names_to_client.get(other))
 
-    challenge_no_longer_valid = message.Message()
-    challenge_no_longer_valid.info = "challenge_no_longer_valid"
-    challenge_no_longer_valid.data = (player1, player2)
+    def create_challenge(self, loaded_message, sender):
+        """
+            Sends info to the player who was challenged by other player.
+            Duplicate challenges and challenges of players who are playing are ignored.
+        """
+
+        player1 = self.client_to_name[sender]
+        player2 = loaded_message.data
+
+        opponent = self.names_to_client.get(player2)
+        if opponent is None or self.find_player_room(player1) or self.find_player_room(player2):
+            return
 
-    answer.data[0] = player2
+        if not self.challenges.add(player1, player2):
+            return
 
-    safe_send_object(answer, sender)
+        answer = message.Message()
+        answer.info = "received_challenge"
+        answer.data = player1
 
-    for client in clients:
+        self.safe_send_object(answer, opponent)
+
+    def delete_challenge(self, loaded_message, sender):
+        """
+            Sends info that the opponent was too scared and changed
+            his mind to play against given player.
+        """
+        player1 = self.client_to_name[sender]
+        player2 = loaded_message.data
+
+        if not self.challenges.remove(player1, player2):
+            return
+
+        answer = message.Message()
+        answer.info = "delete_challenge"
+        answer.data = player1
+
+        self.safe_send_object(answer, self.names_to_client.get(player2))
+
+    def start_room(self, players):
+        """
+            Starts one game of all the players on a maze from the pool. The maze is
+            encoded once and the same frame is sent to every racer of the room.
+            Returns False when one of them is not logged in or is already playing.
+        """
+
+        connections = [self.names_to_client.get(player) for player in players]
+        if None in connections:
+            return False
+
+        for player in players:
+            self.stop_spectating(player)
+
+        generated_maze = self.maze_pool.take()
+        assign_start_positions(generated_maze, players)
+
+        with self.rooms_lock:
+            if any(player in self.player_rooms for player in players):
+                return False
+
+            room_id = next(self.room_ids)
+            self.rooms[room_id] = GameSession(players, generated_maze)
+            for player in players:
+                self.player_rooms[player] = room_id
+
+            self.room_replays[room_id] = self.replay_writer.start_game(
+                players, generated_maze["array"], generated_maze["end_tile"],
+                {player: generated_maze[player] for player in players})
+
+        self.lobby_snapshot.invalidate()
+
+        answer = message.Message()
+        answer.info = "accepted_challenge"
+        answer.data = [tuple(players), generated_maze]
+
+        frame = communication.encode_object(answer)
+        for player, connection in zip(players, connections):
+            self.matchmaker.leave(player)
+            self.safe_send_object(frame, connection, PRIORITY_REALTIME, drops=(GAME_STATE_DELTA,))
+            self.invalidate_challenges(player)
+
+        return True
+
+    def accept_challenge(self, loaded_message, sender):
+        """
+            Inform given player that his challenge was accepted.
+            Other challenges of both players are no longer valid.
+        """
+
+        player1 = self.client_to_name[sender]
+        player2 = loaded_message.data
+
+        if not self.challenges.remove(player2, player1):
+            return
+
+        self.start_room((player1, player2))
+
+    def send_queue_status(self, name, sender):
+        """Sends the player whether he is waiting in the queue and the length of the queue."""
+        answer = message.Message()
+        answer.info = "queue_status"
+        answer.data = (name in self.matchmaker, len(self.matchmaker))
+        self.safe_send_object(answer, sender)
+
+    def join_queue(self, sender):
+        """Adds the player to the matchmaking queue, unless he is already playing."""
+        name = self.client_to_name[sender]
+
+        if self.find_player_room(name) is None:
+            self.matchmaker.join(name, self.scores.get(name, 0))
+
+        self.send_queue_status(name, sender)
+
+    def leave_queue(self, sender):
+        """Removes the player from the matchmaking queue."""
+        name = self.client_to_name[sender]
+        self.matchmaker.leave(name)
+        self.send_queue_status(name, sender)
+
+    def matchmaking_loop(self):
+        """
+            Groups the waiting players into rooms every MATCHMAKING_INTERVAL seconds
+            and starts all their games at once. When a room can not be started,
+            the players who are still available go back to the queue.
+        """
+        while not self.shutdown_event.wait(MATCHMAKING_INTERVAL):
+            for players in self.matchmaker.pair():
+                if self.start_room(players):
+                    continue
+
+                for name in players:
+                    if name in self.names_to_client and self.find_player_room(name) is None:
+                        self.matchmaker.requeue(name)
+
+    def notify_change_position(self, loaded_message, sender):
+        """
+            Queues the path segment sent by the player in the game session of his room.
+            It is applied and sent to the other racers by the next game tick.
+        """
+
+        name = self.client_to_name[sender]
+        room = self.find_player_room(name)
+        if room is None:
+            return
+
+        sequence, packed_path = loaded_message.data
+        room.queue_moves(name, sequence, packed_path)
+        self.tracer.instant("queue moves", player=name, sequence=sequence)
+
+    def tick_game(self, room, spectators=(), replay_id=None):
+        """
+            Applies the queued moves of the room and sends one state delta with the steps
+            and acknowledgements of all racers. The delta is encoded once for the whole room
+            and its spectators, every player skips his own steps and reads his own
+            acknowledgement. Accepted steps are appended to the replay of the game.
+        """
+        started = self.tracer.now()
+        moves, acknowledgements = room.advance(MAX_STEPS_PER_TICK)
+        if not moves and not acknowledgements:
+            return
+
+        if moves and replay_id is not None:
+            self.replay_writer.record_moves(replay_id, room.tick, moves)
+
+        delta = message.Message()
+        delta.info = "game_state_delta"
+        delta.data = (room.tick, moves, acknowledgements)
+
+        frame = communication.encode_object(delta)
+        for player in room.players + tuple(spectators):
+            self.safe_send_object(frame, self.names_to_client.get(player), PRIORITY_REALTIME,
+                                  conflate_key=GAME_STATE_DELTA, merge=merge_state_frames)
+
+        self.tracer.complete("game tick", started, tick=room.tick, players=list(moves),
+                             acknowledgements={player: sequence for player, (sequence, _)
+                                               in acknowledgements.items()})
+
+    def game_tick_loop(self):
+        """
+            Ticks all running games GAME_TICK_RATE times per second, so the number of
+            messages sent to players does not depend on how often they move.
+        """
+        tick_interval = 1 / GAME_TICK_RATE
+        next_tick = time.perf_counter()
+
+        while not self.shutdown_event.is_set():
+            with self.rooms_lock:
+                running = [(room_id, room, tuple(self.room_spectators.get(room_id, ())),
+                            self.room_replays.get(room_id))
+                           for room_id, room in self.rooms.items()]
+
+            for room_id, room, spectators, replay_id in running:
+                self.tick_game(room, spectators, replay_id)
+                if room.winner is not None:
+                    self.award_win(room_id)
+
+            next_tick = max(next_tick + tick_interval, time.perf_counter())
+            self.shutdown_event.wait(next_tick - time.perf_counter())
+
+    def left_game(self, sender):
+        """Removes the player from his room and notifies the other racers."""
+
+        self.leave_room(self.client_to_name[sender])
+
+    def player_has_won_a_game(self, sender):
+        """
+            The win reported by the client is only a claim. The point is given when the
+            session of his room has him on the end tile, which the game tick checks as
+            well, because the claim can come before the tick applied his last steps.
+        """
+
+        player_name = self.client_to_name[sender]
+        self.award_win(self.player_rooms.get(player_name))
+
+    def award_win(self, room_id):
+        """
+            Closes the room if its session has a winner, gives him a point up and informs
+            others about this fact. The room is closed first, so a game gives one point.
+        """
+
+        with self.rooms_lock:
+            room = self.rooms.get(room_id)
+            if room is None or room.winner is None:
+                return
+
+            replay_id = self.room_replays.get(room_id)
+            if replay_id is not None:
+                self.replay_writer.record_win(replay_id, room.winner)
+            self.close_room(room_id)
+
+        self.lobby_snapshot.invalidate()
+
+        with self.presence.lock:
+            score = self.score_store.add(room.winner)
+            if room.winner in self.clients_name:
+                self.scores[room.winner] = score
+                self.broadcast_presence("score_changed", (room.winner, score))
+            else:
+                self.score_store.evict(room.winner)
+
+    def send_leaderboard(self, loaded_object, sender):
+        """
+            Sends the best players as a list of (name, score), the rank of the sender and
+            the number of ranked players. All stored players are ranked, also offline ones.
+        """
+
+        limit = loaded_object.data if isinstance(loaded_object.data, int) else LEADERBOARD_SIZE
+        limit = min(max(limit, 1), MAX_LEADERBOARD_SIZE)
+
+        answer = message.Message()
+        answer.info = "leaderboard"
+        answer.data = (self.score_store.top(limit),
+                       self.score_store.rank(self.client_to_name[sender]), self.score_store.count())
+        self.safe_send_object(answer, sender, PRIORITY_BULK)
+
+    def watch_replay(self, loaded_message, sender):
+        """
+            Streams the recorded game to the client in the same messages which the
+            spectators get, paced by the recorded timestamps, in a separate thread.
+        """
+        name = self.client_to_name[sender]
+        self.stop_spectating(name)
+        self.replay_writer.flush()
+
+        replay_id = find_replay(self.replay_reader, name, loaded_message.data)
+
+        if replay_id is None:
+            answer = message.Message()
+            answer.info = "spectate_refused"
+            answer.data = (loaded_message.data, "no_replay")
+            self.safe_send_object(answer, sender)
+            return
+
+        playback = threading.Event()
+        self.replay_playbacks[name] = playback
+
+        threading.Thread(target=self.play_replay, args=(replay_id, sender, playback),
+                         daemon=True).start()
+
+    def play_replay(self, replay_id, sender, playback):
+        """Sends the snapshot of the replay and its moves until the end or until it is stopped."""
+        header = self.replay_reader.header(replay_id)
+
+        snapshot = message.Message()
+        snapshot.info = "spectate_snapshot"
+        snapshot.data = (0, header["players"], pack_maze(header["array"]),
+                         header["end_tile"], header["positions"])
+        self.safe_send_object(snapshot, sender, PRIORITY_REALTIME, drops=(GAME_STATE_DELTA,))
+
+        started = time.perf_counter()
+        for elapsed, tick, moves in self.replay_reader.moves(replay_id):
+            if playback.wait(max(0, started + elapsed - time.perf_counter())) \
+                    or sender not in self.outboxes:
+                return
+
+            delta = message.Message()
+            delta.info = "game_state_delta"
+            delta.data = (tick, moves, {})
+            self.safe_send_object(delta, sender, PRIORITY_REALTIME)
+
+        ended = message.Message()
+        ended.info = "spectating_ended"
+        self.safe_send_object(ended, sender)
+
+    def send_public_message(self, loaded_object, sender):
+        """Resending message from one client to all others."""
+
+        self.public_messages.append(loaded_object.data)
+        self.lobby_snapshot.invalidate()
+
+        frame = communication.encode_object(loaded_object)
+        for client in list(self.clients):
+            if client != sender:
+                self.safe_send_object(frame, client, PRIORITY_BULK)
+
+    def send_history_page(self, loaded_object, sender):
+        """
+            Sends the page of public messages older than the cursor requested by the client.
+            Requests without integer cursor and limit are ignored, the limit is clamped.
+        """
+
+        cursor, limit = loaded_object.data
+        if not isinstance(cursor, int) or not isinstance(limit, int):
+            return
+
+        answer = message.Message()
+        answer.info = "history_page"
+        answer.data = self.public_messages.before(cursor, min(max(limit, 1),
+                                                              MAX_HISTORY_PAGE_SIZE))
+
+        self.safe_send_object(answer, sender, PRIORITY_BULK)
+
+    def send_private_message(self, loaded_object, sender):
+        """Resending a private message from one player to the other players in his room."""
+
+        player_name = self.client_to_name[sender]
+        room = self.find_player_room(player_name)
+        if room is None:
+            return
+
+        frame = communication.encode_object(loaded_object)
+        for player in room.players:
+            if player != player_name:
+                self.safe_send_object(frame, self.names_to_client.get(player), PRIORITY_BULK)
+
+    def send_heartbeat(self, loaded_object, sender):
+        """
+            Respond to the heartbeat. The answer echoes the timestamp of the client and
+            carries the timestamp of the server, which the client echoes in the next
+            heartbeat, so the round-trip time of the client is measured.
+        """
+
+        self.last_heartbeat[sender] = time.time()
+
+        estimator = self.client_rtt.get(sender)
+        if estimator is None:
+            estimator = self.client_rtt.setdefault(sender, RttEstimator())
+
+        heartbeat_message = message.Message()
+        heartbeat_message.info = "heartbeat"
+        heartbeat_message.data, rtt = answer_heartbeat(loaded_object.data, estimator)
+        self.safe_send_object(heartbeat_message, sender)
+
+        if rtt is not None:
+            self.metrics.observe("heartbeat_rtt_seconds", rtt)
+
+    def monitor_heartbeats(self):
+        """
+            Periodically checks if clients have sent a heartbeat within the timeout.
+            Disconnects clients that exceed the timeout.
+        """
         try:
-            if client_to_name[client] not in (player1, player2):
-                safe_send_object(challenge_no_longer_valid, client)
-        except KeyError:
-            ...
-
-    games[players] = generated_maze
-
-
-def name_to_client(find_name):
-    """Helper function"""
-    for conn, name in client_to_name.items():
-        if name == find_name:
-            return conn
-
-    return None
-
-
-def notify_change_position(loaded_message, sender):
-    """Sends information that opponent has made a move in game."""
-
-    player1, opponent = find_player_games(client_to_name[sender])[0]
-    players = frozenset([player1, opponent])
-
-    answer = message.Message()
-    answer.info = "opponent_changed_position"
-    answer.data = loaded_message.data
-
-    safe_send_object(answer, name_to_client(opponent))
-
-    game_played = games.get(players)
-
-    game_played[player1] = loaded_message.data
-    answer.data = (loaded_message.data, player1)
-    games[players] = game_played
-
-
-def left_game(loaded_message, sender):
-    """Notify all players that layer has left the game."""
-
-    player1 = client_to_name[sender]
-    player2 = loaded_message.data
-
-    players = frozenset([player1, player2])
-
-    answer = message.Message()
-    answer.info = "left_game"
-    answer.data = player1
-
-    opponent = None
-    for opponent_connection, name in client_to_name.items():
-        if name == player2:
-            opponent = opponent_connection
-            break
-
-    safe_send_object(answer, opponent)
-
-    '''
-    answer.data = (player1, player2)
-    for conn, name in client_to_name.items():
-        if name in (player1, player2):
-            continue
-
-        safe_send_object(answer, conn)
-    '''
-
-    games[players] = []
+            while not self.shutdown_event.wait(1):
+                current_time = time.time()
+                for client, last_time in list(self.last_heartbeat.items()):
+                    estimator = self.client_rtt.get(client)
+                    timeout = HEARTBEAT_TIMEOUT + (estimator.rto() if estimator else 0)
+                    if current_time - last_time > timeout:
+                        self.last_heartbeat.pop(client, None)
+                        self.metrics.inc("heartbeat_timeouts_total")
+                        self.stop_client_thread(client)
+                        client.close()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"Exception in monitor_heartbeats: {e}")
+
+    def handle_loaded_object(self, loaded_object, sender):
+        """Each time the server receives a message, this function decides what to do with it."""
+
+        match loaded_object.info:
+            case "login_attempt":
+                self.client_login(loaded_object.data, sender)
+
+            case "disconnect":
+                self.client_logout(loaded_object.data, sender)
+                self.stop_client_thread(sender)
+
+            case "create_challenge":
+                self.create_challenge(loaded_object, sender)
+
+            case "delete_challenge":
+                self.delete_challenge(loaded_object, sender)
+
+            case "accept_challenge":
+                self.accept_challenge(loaded_object, sender)
+
+            case "change_position":
+                self.notify_change_position(loaded_object, sender)
+
+            case "leaving_game":
+                self.left_game(sender)
+
+            case "player_have_won_a_game":
+                self.player_has_won_a_game(sender)
+
+            case "public_message":
+                self.send_public_message(loaded_object, sender)
+
+            case "private_message":
+                self.send_private_message(loaded_object, sender)
+
+            case "fetch_history":
+                self.send_history_page(loaded_object, sender)
+
+            case "join_queue":
+                self.join_queue(sender)
+
+            case "leave_queue":
+                self.leave_queue(sender)
+
+            case "spectate":
+                self.spectate(loaded_object, sender)
+
+            case "fetch_leaderboard":
+                self.send_leaderboard(loaded_object, sender)
+
+            case "watch_replay":
+                self.watch_replay(loaded_object, sender)
+
+            case "stop_spectating":
+                self.stop_spectating(self.client_to_name[sender])
+
+            case "heartbeat":
+                self.send_heartbeat(loaded_object, sender)
+
+            case "presence_snapshot_request":
+                self.send_presence_snapshot(sender)
+
+    def count_sent_frame(self, frame):
+        """Called by the outboxes with every frame written to a client."""
+        info = getattr(frame, "info", None) or "unknown"
+        self.metrics.inc("frames_out_total", info=info)
+        self.metrics.inc("bytes_out_total", len(frame), info=info)
+
+    def report_slow_handler(self, info, client, elapsed, stack):
+        """Called by the watchdog when a handler exceeds HANDLER_BUDGET."""
+        self.metrics.inc("slow_handlers_total", info=info)
+        print(f"Handler of {info} from {client} is running for {elapsed * 1000:.0f} ms, "
+              f"budget is {HANDLER_BUDGET * 1000:.0f} ms:\n{''.join(stack)}", end="")
+
+    def client_latency(self, statistic):
+        """Returns {labels: value} of the statistic of round trips of the logged in players."""
+        latencies = {}
+        for connection, estimator in list(self.client_rtt.items()):
+            name = self.client_to_name.get(connection)
+            stats = estimator.stats()
+            if name is not None and stats["samples"]:
+                latencies[(("client", name),)] = stats[statistic]
+        return latencies
+
+    def register_metrics(self):
+        """Describes the counters and registers the gauges read from the state of the server."""
+        metrics = self.metrics
+        metrics.describe("frames_in_total", "counter", "Frames received from clients.")
+        metrics.describe("bytes_in_total", "counter", "Bytes received from clients.")
+        metrics.describe("frames_out_total", "counter", "Frames sent to clients.")
+        metrics.describe("bytes_out_total", "counter", "Bytes sent to clients.")
+        metrics.describe("handler_seconds", "histogram", "Time spent handling one message.")
+        metrics.describe("heartbeat_timeouts_total", "counter",
+                         "Clients disconnected for missing heartbeats.")
+        metrics.describe("slow_handlers_total", "counter",
+                         "Handlers which exceeded the budget of the watchdog.")
+        metrics.describe("heartbeat_rtt_seconds", "histogram",
+                         "Round-trip times measured by heartbeats.")
+
+        metrics.gauge("clients_connected", "Connected clients.", lambda: len(self.clients))
+        metrics.gauge("players_logged_in", "Logged in players.", lambda: len(self.clients_name))
+        metrics.gauge("games_active", "Running games.", lambda: len(self.rooms))
+        metrics.gauge("spectators", "Players watching a running game.",
+                      lambda: sum(len(watching)
+                                  for watching in list(self.room_spectators.values())))
+        metrics.gauge("matchmaking_queue_length", "Players waiting in the matchmaking queue.",
+                      lambda: len(self.matchmaker))
+        metrics.gauge("matchmaking_longest_wait_seconds",
+                      "Waiting time of the player who waits in the queue the longest.",
+                      lambda: self.matchmaker.stats()["longest_wait"])
+        metrics.gauge("matchmaking_wait_seconds_avg",
+                      "Average time the recently grouped players waited in the queue.",
+                      lambda: self.matchmaker.stats()["wait_avg"])
+        metrics.gauge("matchmaking_wait_seconds_max",
+                      "Longest time a recently grouped player waited in the queue.",
+                      lambda: self.matchmaker.stats()["wait_max"])
+        metrics.gauge("matchmaking_pairings_per_second",
+                      "Rooms formed by the matchmaker per second in the last minute.",
+                      lambda: self.matchmaker.stats()["pairings_per_second"])
+        metrics.gauge("outbox_frames_queued", "Frames waiting in the outboxes of all clients.",
+                      lambda: sum(outbox.depth() for outbox in list(self.outboxes.values())))
+        metrics.gauge("outbox_frames_queued_max", "Frames waiting in the fullest outbox.",
+                      lambda: max((outbox.depth() for outbox in list(self.outboxes.values())),
+                                  default=0))
+        metrics.gauge("client_rtt_seconds", "Smoothed round-trip time of every player.",
+                      lambda: self.client_latency("rtt"))
+        metrics.gauge("client_rtt_variation_seconds", "Variation of the round-trip time.",
+                      lambda: self.client_latency("rttvar"))
+        metrics.gauge("client_jitter_seconds", "Jitter of the round-trip time of every player.",
+                      lambda: self.client_latency("jitter"))
+        metrics.gauge("maze_pool_size", "Generated mazes ready for new games.",
+                      lambda: len(self.maze_pool))
+        metrics.gauge("score_writes_pending", "Changed scores not written to the database yet.",
+                      lambda: len(self.score_store.pending))
+
+    def handle_client(self, client_connection):
+        """Function that communicate with the client."""
+        should_stop = self.client_threads[client_connection]
 
+        try:
 
-def player_has_won_a_game(sender):
-    """Gives a point up for player who has won and informs other about this fact."""
-
-    player_name = client_to_name[sender]
-    scores[player_name] += 1
-
-    answer = message.Message()
-    answer.info = "player_has_won_a_game"
-    answer.data = player_name
-
-    for client in clients:
-        safe_send_object(answer, client)
-
-
-def send_public_message(loaded_object, sender):
-    """Resending message from one client to all others."""
-
-    public_messages.append(loaded_object.data)
-
-    for client in clients:
-        if client != sender:
-            safe_send_object(loaded_object, client)
-
-
-def send_private_message(loaded_object, sender):
-    """Resending a private message from one player to another player."""
-
-    player_name, opponent = find_player_games(client_to_name[sender])[0]
-    safe_send_object(loaded_object, names_to_client[opponent])
-
-
-def send_heartbeat(sender):
-    """
-        Respond to the heartbeat.
-    """
-
-    last_heartbeat[sender] = time.time()
-
-    heartbeat_message = message.Message()
-    heartbeat_message.info = "heartbeat"
-    safe_send_object(heartbeat_message, sender)
-
-
-def monitor_heartbeats():
-    """
-        Periodically checks if clients have sent a heartbeat within the timeout.
-        Disconnects clients that exceed the timeout.
-    """
-    try:
-        while True:
-            current_time = time.time()
-            for client, last_time in list(last_heartbeat.items()):
-                if current_time - last_time > HEARTBEAT_TIMEOUT:
-                    stop_client_thread(client)
-                    client.close()
-            time.sleep(1)
-    except Exception as e:
-        print(f"Exception in monitor_heartbeats: {e}")
-
-
-def handle_loaded_object(loaded_object, sender):
-    """Each time the server receives a message, this function decides what to do with it."""
-
-    match loaded_object.info:
-        case "login_attempt":
-            client_login(loaded_object.data, sender)
-
-        case "disconnect":
-            client_logout(loaded_object.data, sender)
-            stop_client_thread(sender)
-
-        case "create_challenge":
-            create_challenge(loaded_object, sender)
-
-        case "delete_challenge":
-            delete_challenge(loaded_object, sender)
-
-        case "accept_challenge":
-            accept_challenge(loaded_object, sender)
-
-        case "change_position":
-            notify_change_position(loaded_object, sender)
-
-        case "leaving_game":
-            left_game(loaded_object, sender)
-
-        case "player_have_won_a_game":
-            player_has_won_a_game(sender)
-
-        case "public_message":
-            send_public_message(loaded_object, sender)
-
-        case "private_message":
-            send_private_message(loaded_object, sender)
-
-        case "heartbeat":
-            send_heartbeat(sender)
-
-
-def handle_client(client_connection):
-    """Function that communicate with the client."""
-    should_stop = client_threads[client_connection]
-
-    try:
+            while not should_stop.is_set():
+                try:
+                    serialized_data = communication.load_data(client_connection)
+                    received = self.tracer.now()
+                    client_message = communication.decode_data(serialized_data)
+                except CommunicationError:
+
+                    break
+
+                label = message_label(getattr(client_message, "info", None))
+                self.metrics.inc("frames_in_total", info=label)
+                self.metrics.inc("bytes_in_total", len(serialized_data) + 4, info=label)
+                self.tracer.complete("decode", received, info=label,
+                                     bytes=len(serialized_data) + 4)
+
+                if client_message:
+                    client_name = self.client_to_name.get(client_connection, "unknown client")
+                    handler_started = self.tracer.now()
+                    started = time.perf_counter()
+                    self.watchdog.begin(label, client_name)
+                    try:
+                        self.handle_loaded_object(client_message, client_connection)
+                    finally:
+                        self.watchdog.end()
+                    self.metrics.observe("handler_seconds", time.perf_counter() - started,
+                                         info=label)
+                    self.tracer.complete(f"handle {label}", handler_started, client=client_name)
+
+                else:
+                    break
+        finally:
+            with self.clients_lock:
+                self.stop_client_thread(client_connection)
+                if client_connection in self.clients:
+                    self.clients.remove(client_connection)
+
+    def add_client(self, connection, address):
+        """Starts the outbox and the handler thread of the accepted connection."""
+        with self.clients_lock:
+            self.clients.append(connection)
+
+            outbox = Outbox(connection, self.drop_receiver, self.count_sent_frame, self.tracer,
+                            name=f"outbox-{address[0]}:{address[1]}")
+            self.outboxes[connection] = outbox
+            outbox.start()
+
+            stop_event = threading.Event()
+
+            client_thread = threading.Thread(target=self.handle_client, args=(connection,),
+                                             name=f"handler-{address[0]}:{address[1]}",
+                                             daemon=True)
+            self.client_threads[connection] = stop_event
+            client_thread.start()
+
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            self.threads.append(client_thread)
+
+    def accept_clients(self):
+        """Accepts new clients until the server is stopped."""
+        while not self.shutdown_event.is_set():
+            with self.clients_lock:
+                has_space = len(self.clients) < self.max_clients
+
+            if not has_space:
+                print("Max clients reached, waiting for space.")
+                self.shutdown_event.wait(1)
+                continue
 
-        while not should_stop.is_set():
             try:
-                client_message = communication.load_object(client_connection)
-            except CommunicationError:
-
+                connection, address = self.server_socket.accept()
+            except OSError:
                 break
 
-            if client_message:
-                handle_loaded_object(client_message, client_connection)
-
-            else:
+            if self.shutdown_event.is_set():
+                close_connection(connection)
                 break
-    finally:
-        with clients_lock:
-            if client_connection in client_to_name:
-                client_name = client_to_name[client_connection]
-                client_logout(client_name, client_connection)
-                stop_client_thread(client_connection)
-            try:
 
-                clients.remove(client_connection)
-            except ValueError:
-                pass
+            self.add_client(connection, address)
+
+    def start_thread(self, target, name):
+        """Starts a daemon thread of the server, it is joined when the server stops."""
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def start(self):
+        """Starts all threads of the server, returns the server."""
+        self.score_store.start()
+
+        if self.metrics_port is not None:
+            self.metrics_server = serve_metrics(self.metrics, METRICS_HOST, self.metrics_port, {
+                "/profile": self.profile_command,
+                "/memory": lambda _: self.write_memory_diff(),
+                "/trace": lambda _: self.tracer.export_json(),
+            })
+        self.watchdog.start()
+        self.maze_pool.start()
+
+        self.start_thread(self.monitor_heartbeats, "heartbeat-monitor")
+        self.start_thread(self.game_tick_loop, "game-tick")
+        self.start_thread(self.matchmaking_loop, "matchmaking")
+        self.start_thread(self.accept_clients, "accept")
+        return self
+
+    def stop(self):
+        """
+            Stops accepting clients, closes all connections, stops the threads
+            and writes the stored data. Calling it again does nothing.
+        """
+        if self.shutdown_event.is_set():
+            return
+        self.shutdown_event.set()
+
+        close_connection(self.server_socket)
+
+        with self.clients_lock:
+            for connection in list(self.client_threads):
+                self.stop_client_thread(connection)
+            for connection in self.clients:
+                close_connection(connection)
+            self.clients.clear()
+
+        for playback in list(self.replay_playbacks.values()):
+            playback.set()
+
+        current = threading.current_thread()
+        for thread in self.threads:
+            if thread is not current and thread.ident is not None:
+                thread.join(SHUTDOWN_TIMEOUT)
+
+        self.watchdog.close()
+        self.maze_pool.close()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+
+        self.replay_writer.close()
+        self.replay_reader.close()
+        self.score_store.close()
 
 
 def main():
     """Main function to  start the server"""
-    server_utils.register_server()
-    atexit.register(server_utils.unregister_server)
+    server = GameServer(HOST, PORT, metrics_port=METRICS_PORT)
 
-    heartbeat_monitor_thread = threading.Thread(target=monitor_heartbeats, daemon=True)
-    heartbeat_monitor_thread.start()
+    def handler(_, __):
+        """Called when program receives SIGINT"""
+        server.stop()
+        sys.exit(0)
 
-    while not shutdown_event.is_set():
-        with clients_lock:
-            if len(clients) < MAX_CLIENTS:
-                connection, client_address = server_socket.accept()
-                clients.append(connection)
+    def profile_signal_handler(_, __):
+        """Called when program receives SIGUSR1, profiles the handlers in the background."""
+        threading.Thread(target=server.profile_handlers, daemon=True).start()
 
-                stop_event = threading.Event()
+    def memory_signal_handler(_, __):
+        """Called when program receives SIGUSR2, writes the memory diff in the background."""
+        threading.Thread(target=server.write_memory_diff, daemon=True).start()
 
-                client_thread = threading.Thread(target=handle_client,
-                                                 args=(connection,), daemon=True)
-                client_threads[connection] = stop_event
-                client_thread.start()
-            else:
-                print("Max clients reached, waiting for space.")
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profile_signal_handler)
+        signal.signal(signal.SIGUSR2, memory_signal_handler)
+
+    server_utils.register_server()
+    atexit.register(server_utils.unregister_server)
+    atexit.register(server.stop)
+
+    server.start()
+    while not server.shutdown_event.wait(1):
+        ...
 
 
 if __name__ == "__main__":
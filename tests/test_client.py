@@ -0,0 +1,30 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from communication.connect_to_server import server_from_environment, \
+    SERVER_ENVIRONMENT_VARIABLE
+
+
+def test_server_address_from_environment(monkeypatch):
+    """The server is read as host:port, only host or only :port."""
+    monkeypatch.delenv(SERVER_ENVIRONMENT_VARIABLE, raising=False)
+    assert server_from_environment(65432) is None
+
+    for value, address in [("10.0.0.1:1234", ("10.0.0.1", 1234)),
+                           ("example.org", ("example.org", 65432)),
+                           (":65433", ("127.0.0.1", 65433))]:
+        monkeypatch.setenv(SERVER_ENVIRONMENT_VARIABLE, value)
+        assert server_from_environment(65432) == address
+
+
+@pytest.mark.parametrize("value", ["localhost:abc", "localhost:", "localhost:70000"])
+def test_malformed_port_is_reported(monkeypatch, value):
+    """Malformed port fails with the name of the variable instead of a bare int() error."""
+    monkeypatch.setenv(SERVER_ENVIRONMENT_VARIABLE, value)
+
+    with pytest.raises(ValueError, match=SERVER_ENVIRONMENT_VARIABLE):
+        server_from_environment(65432)
@@ -0,0 +1,154 @@
+import sys
+import os
+import random
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from maze.game_session import GameSession
+from maze.maze_generator import bfs_maze, distances_from_end, find_start_positions, \
+    spread_tiles, smallest_gap, assign_start_positions
+from maze.movement import pack_path, unpack_path, pack_maze, unpack_maze
+
+GENERATED_MAZE = {
+    "array": [
+        [0, 0, 0, 0, 0],
+        [0, 1, 1, 1, 0],
+        [0, 1, 0, 1, 0],
+        [0, 1, 1, 1, 0],
+        [0, 0, 0, 0, 0],
+    ],
+    "end_tile": (3, 3),
+    "John": (1, 1),
+    "Mary": (3, 1),
+}
+
+
+def test_moves_are_applied_on_tick():
+    """Queued moves are applied only when the game ticks and are acknowledged once."""
+    session = GameSession(["John", "Mary"], dict(GENERATED_MAZE))
+    session.queue_moves("John", 1, pack_path([(2, 1)]))
+    session.queue_moves("John", 2, pack_path([(3, 1), (3, 2)]))
+    assert session.positions["John"] == (1, 1)
+
+    moves, acknowledgements = session.advance(max_steps=16)
+    assert unpack_path(moves["John"]) == [(2, 1), (3, 1), (3, 2)]
+    assert acknowledgements == {"John": (2, (3, 2))}
+
+    assert session.advance(max_steps=16) == ({}, {})
+
+
+def test_old_sequence_numbers_are_ignored():
+    """Segment with already received sequence number is not applied again."""
+    session = GameSession(["John", "Mary"], dict(GENERATED_MAZE))
+    assert session.queue_moves("John", 1, pack_path([(2, 1)]))
+    assert not session.queue_moves("John", 1, pack_path([(2, 1)]))
+
+
+def test_invalid_step_drops_rest_of_segment():
+    """Steps through walls are not applied and the player stays on the last valid tile."""
+    session = GameSession(["John", "Mary"], dict(GENERATED_MAZE))
+    session.queue_moves("Mary", 1, pack_path([(3, 2), (2, 2), (1, 2)]))
+
+    moves, acknowledgements = session.advance(max_steps=16)
+    assert unpack_path(moves["Mary"]) == [(3, 2)]
+    assert acknowledgements == {"Mary": (1, (3, 2))}
+
+
+def test_steps_per_tick_are_limited():
+    """Only max_steps are applied in one tick, the rest waits for the next one."""
+    session = GameSession(["John", "Mary"], dict(GENERATED_MAZE))
+    session.queue_moves("John", 1, pack_path([(2, 1), (3, 1), (3, 2)]))
+
+    moves, acknowledgements = session.advance(max_steps=2)
+    assert unpack_path(moves["John"]) == [(2, 1), (3, 1)]
+    assert not acknowledgements
+
+    moves, acknowledgements = session.advance(max_steps=2)
+    assert unpack_path(moves["John"]) == [(3, 2)]
+    assert acknowledgements == {"John": (1, (3, 2))}
+
+
+def test_player_who_left_is_not_ticked():
+    """Moves of the player who left the room are not applied."""
+    session = GameSession(["John", "Mary"], dict(GENERATED_MAZE))
+    session.queue_moves("John", 1, pack_path([(2, 1)]))
+    assert session.remove_player("John") == ("Mary",)
+
+    assert session.advance(max_steps=16) == ({}, {})
+
+
+def test_first_player_on_end_tile_wins():
+    """The winner is set by the tick which applies the step on the end tile, not before."""
+    session = GameSession(["John", "Mary"], dict(GENERATED_MAZE))
+    session.queue_moves("Mary", 1, pack_path([(3, 2), (3, 3)]))
+    session.queue_moves("John", 1, pack_path([(1, 2), (1, 3), (2, 3), (3, 3)]))
+    assert session.winner is None
+
+    session.advance(max_steps=1)
+    assert session.winner is None
+
+    session.advance(max_steps=1)
+    assert session.winner == "Mary"
+
+    session.advance(max_steps=16)
+    assert session.winner == "Mary"
+
+
+def test_start_positions_are_equidistant_from_end():
+    """All racers of a room start with the same distance to the end tile."""
+    generated_maze = bfs_maze(25)
+    starts = find_start_positions(generated_maze, 4)
+    distances = distances_from_end(generated_maze["array"], generated_maze["end_tile"])
+
+    assert len(starts) == 4
+    assert len({distances[start] for start in starts}) == 1
+
+
+def test_spread_tiles_picks_the_furthest_tiles():
+    """Every next picked tile is the furthest from the picked ones."""
+    tiles = [(x, 0) for x in range(10)]
+
+    picked = spread_tiles(tiles, 3)
+    assert picked == [(0, 0), (9, 0), (4, 0)]
+    assert smallest_gap(picked) == 4
+
+    assert spread_tiles(tiles[:2], 5) == [(0, 0), (1, 0)]
+    assert smallest_gap([(0, 0)]) == 0
+
+
+def test_assigned_starts_are_equidistant_and_spread_out():
+    """Racers start at the same distance from the end, as far from each other as possible."""
+    random.seed(7)
+    players = ["John", "Mary", "Doe", "Jane"]
+
+    for _ in range(5):
+        generated_maze = bfs_maze(25)
+        assign_start_positions(generated_maze, players)
+        starts = [generated_maze[player] for player in players]
+
+        distances = distances_from_end(generated_maze["array"], generated_maze["end_tile"])
+        assert len({distances[start] for start in starts}) == 1
+        assert len(set(starts)) == len(players) and smallest_gap(starts) > 1
+
+        for other_distance in range(25 * 2 - 12, 25 * 2 + 13):
+            tiles = [tile for tile, other in distances.items() if other == other_distance]
+            if len(tiles) >= len(players):
+                assert smallest_gap(starts) >= smallest_gap(spread_tiles(tiles, len(players)))
+
+
+def test_maze_is_packed_into_bits():
+    """Packed maze has one bit per tile and is unpacked into the same rows."""
+    generated_maze = bfs_maze(25)
+    size, packed_maze = pack_maze(generated_maze["array"])
+
+    assert len(packed_maze) == (25 * 25 + 7) // 8
+    assert unpack_maze(size, packed_maze) == generated_maze["array"]
+
+
+def test_snapshot_matches_ticks():
+    """Snapshot contains the positions after the last tick together with its number."""
+    session = GameSession(["John", "Mary"], dict(GENERATED_MAZE))
+    session.queue_moves("John", 1, pack_path([(2, 1)]))
+    session.advance(max_steps=16)
+
+    assert session.snapshot() == (1, ("John", "Mary"), {"John": (2, 1), "Mary": (3, 1)})
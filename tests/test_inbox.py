@@ -0,0 +1,61 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from communication import message
+from communication.inbox import Inbox, keep_latest, join_data
+
+
+def test_messages_are_dispatched_in_order():
+    """Messages are handled in the same order as they were received."""
+    inbox = Inbox()
+    for number in range(5):
+        inbox.put(message.Message("public_message", number))
+
+    handled = []
+    inbox.dispatch(lambda loaded: handled.append(loaded.data))
+
+    assert handled == [0, 1, 2, 3, 4]
+    assert inbox.depth() == 0
+    assert inbox.stats()["dispatched"] == 5
+
+
+def test_position_updates_are_coalesced():
+    """Only the newest position update within one frame is handled."""
+    inbox = Inbox(coalesce={"opponent_changed_position": keep_latest})
+    inbox.put(message.Message("opponent_changed_position", (1, 1)))
+    inbox.put(message.Message("public_message", "hello"))
+    inbox.put(message.Message("opponent_changed_position", (1, 2)))
+    inbox.put(message.Message("opponent_changed_position", (1, 3)))
+
+    handled = []
+    inbox.dispatch(lambda loaded: handled.append((loaded.info, loaded.data)))
+
+    assert handled == [("public_message", "hello"), ("opponent_changed_position", (1, 3))]
+    assert inbox.stats()["coalesced"] == 2
+
+
+def test_batch_size_is_limited():
+    """One dispatch handles at most max_batch messages, the rest waits for next frame."""
+    inbox = Inbox(max_batch=3)
+    for number in range(5):
+        inbox.put(message.Message("public_message", number))
+
+    handled = []
+    inbox.dispatch(lambda loaded: handled.append(loaded.data))
+    assert handled == [0, 1, 2]
+    assert inbox.depth() == 2
+    assert inbox.stats()["max_depth"] == 5
+
+
+def test_path_segments_are_joined():
+    """Path segments received within one frame are joined, so no step is lost."""
+    inbox = Inbox(coalesce={"opponent_changed_position": join_data})
+    inbox.put(message.Message("opponent_changed_position", b"\x01\x02"))
+    inbox.put(message.Message("opponent_changed_position", b"\x01\x03"))
+
+    handled = []
+    inbox.dispatch(lambda loaded: handled.append(loaded.data))
+
+    assert handled == [b"\x01\x02\x01\x03"]
@@ -0,0 +1,76 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from communication.latency import RttEstimator, HeartbeatLatency, answer_heartbeat
+
+
+def test_estimator_follows_rfc_6298():
+    """First sample sets the RTT and half of it as variation, later ones are smoothed."""
+    estimator = RttEstimator(min_rto=0)
+    assert estimator.rto() == 1
+
+    estimator.update(0.1)
+    assert (estimator.srtt, estimator.rttvar) == (0.1, 0.05)
+    assert abs(estimator.rto() - 0.3) < 1e-9
+
+    estimator.update(0.2)
+    assert abs(estimator.rttvar - (0.75 * 0.05 + 0.25 * 0.1)) < 1e-9
+    assert abs(estimator.srtt - (0.875 * 0.1 + 0.125 * 0.2)) < 1e-9
+    assert abs(estimator.jitter - 0.1 / 16) < 1e-9
+    assert estimator.min_rtt == 0.1
+
+
+def test_timeout_is_clamped():
+    """Timeout never drops below the minimum."""
+    estimator = RttEstimator(min_rto=0.2)
+    for _ in range(50):
+        estimator.update(0.001)
+
+    assert estimator.rto() == 0.2
+
+
+def test_both_sides_measure_round_trip_from_heartbeats():
+    """Client measures the answer, server measures the echo of its own timestamp."""
+    client = HeartbeatLatency()
+    server = RttEstimator()
+
+    data = client.heartbeat_data(now=10)
+    assert data == (10, None, 0)
+
+    answer, rtt = answer_heartbeat(data, server, now=100.02)
+    assert rtt is None
+    assert abs(client.answer_received(answer, now=10.04) - 0.04) < 1e-9
+
+    data = client.heartbeat_data(now=11)
+    _, rtt = answer_heartbeat(data, server, now=101.05)
+    assert abs(rtt - 0.07) < 1e-9
+    assert server.samples == 1
+
+
+def test_old_heartbeats_without_timestamps_are_answered():
+    """Heartbeat without data gets an answer, but no round trip is measured."""
+    estimator = RttEstimator()
+    answer, rtt = answer_heartbeat("", estimator, now=5)
+
+    assert answer == (None, 5)
+    assert rtt is None
+    assert estimator.samples == 0
+
+
+def test_interpolation_delay_and_silence_follow_the_link():
+    """Jittery link draws opponents further in the past and waits longer for the server."""
+    latency = HeartbeatLatency(interval=1, missed_heartbeats=5)
+    assert latency.interpolation_delay(0.05) == 0.1
+
+    for rtt in (0.02, 0.1, 0.02, 0.1):
+        latency.estimator.update(rtt)
+
+    delay = latency.interpolation_delay(0.05)
+    assert 0.05 < delay <= 0.3
+    assert latency.silence_timeout() == 5 + latency.estimator.rto()
+
+    latency.answer_received((None, 1), now=0)
+    assert not latency.server_silent(now=5)
+    assert latency.server_silent(now=5 + latency.estimator.rto() + 0.01)
@@ -0,0 +1,94 @@
+import sys
+import os
+import contextlib
+import socket
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from helpers.latency_proxy import LatencyProxy
+
+
+@contextlib.contextmanager
+def proxied_connection(**conditions):
+    """Yields (client, server, proxy), the client is connected to the server through the proxy."""
+    listener = socket.create_server(("127.0.0.1", 0))
+    proxy = LatencyProxy(listener.getsockname(), **conditions).start()
+
+    client = socket.create_connection(proxy.address)
+    server, _ = listener.accept()
+    for connection in (client, server):
+        connection.settimeout(5)
+
+    try:
+        yield client, server, proxy
+    finally:
+        proxy.stop()
+        for connection in (client, server, listener):
+            connection.close()
+
+
+def receive(connection, size):
+    """Reads exactly size bytes."""
+    received = bytearray()
+    while len(received) < size:
+        chunk = connection.recv(size - len(received))
+        assert chunk, "connection closed"
+        received += chunk
+    return bytes(received)
+
+
+def test_bytes_are_delayed():
+    """Bytes arrive one-way delay later, in both directions."""
+    with proxied_connection(delay=0.1) as (client, server, _):
+        for sender, receiver in ((client, server), (server, client)):
+            sent = time.perf_counter()
+            sender.sendall(b"ping")
+
+            assert receive(receiver, 4) == b"ping"
+            assert 0.1 <= time.perf_counter() - sent < 0.15
+
+
+def test_jitter_keeps_the_order_of_bytes():
+    """Chunks with different delays are still delivered in the order they were sent."""
+    data = b"".join(number.to_bytes(2, "big") for number in range(300))
+
+    with proxied_connection(delay=0.02, jitter=0.02, seed=7) as (client, server, _):
+        for start in range(0, len(data), 20):
+            client.sendall(data[start:start + 20])
+            time.sleep(0.002)
+
+        assert receive(server, len(data)) == data
+
+
+def test_throughput_is_limited_by_bandwidth():
+    """Bytes are not forwarded faster than the bandwidth of the link."""
+    bandwidth = 100_000
+    data = bytes(30_000)
+
+    with proxied_connection(bandwidth=bandwidth) as (client, server, _):
+        sent = time.perf_counter()
+        sender = threading.Thread(target=client.sendall, args=(data,))
+        sender.start()
+
+        assert receive(server, len(data)) == data
+        assert len(data) / (time.perf_counter() - sent) <= bandwidth * 1.05
+
+        sender.join()
+
+
+def test_reset_closes_the_connection():
+    """Connection is reset within the reset interval, the client sees it closed."""
+    with proxied_connection(reset_interval=0.05, seed=1) as (client, server, proxy):
+        try:
+            closed = client.recv(1) == b""
+        except ConnectionResetError:
+            closed = True
+
+        assert closed and proxy.resets == 1
+        server.settimeout(1)
+        try:
+            assert server.recv(1) == b""
+        except ConnectionResetError:
+            ...
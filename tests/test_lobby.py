@@ -0,0 +1,248 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lobby.challenges import ChallengeRegistry
+from lobby.chat_history import ChatHistory
+from lobby.leaderboard import Leaderboard
+from lobby.matchmaking import Matchmaker
+from lobby.score_store import ScoreStore
+from lobby.snapshot import LobbySnapshot
+
+
+def test_snapshot_is_reused_until_invalidated():
+    """Logins reuse the encoded snapshot together with deltas which happened after it."""
+    built = []
+
+    def build():
+        built.append(len(built))
+        return f"snapshot {len(built)}".encode()
+
+    lobby_snapshot = LobbySnapshot(max_catch_up=2)
+    assert lobby_snapshot.frames(build) == [b"snapshot 1"]
+
+    lobby_snapshot.record_delta(b"joined")
+    assert lobby_snapshot.frames(build) == [b"snapshot 1", b"joined"]
+
+    lobby_snapshot.invalidate()
+    assert lobby_snapshot.frames(build) == [b"snapshot 2"]
+    assert lobby_snapshot.builds == 2
+    assert lobby_snapshot.reuses == 1
+
+
+def test_snapshot_is_rebuilt_after_too_many_deltas():
+    """When the catch-up would be longer than max_catch_up, new snapshot is encoded."""
+    lobby_snapshot = LobbySnapshot(max_catch_up=2)
+    lobby_snapshot.frames(lambda: b"old")
+
+    for _ in range(3):
+        lobby_snapshot.record_delta(b"delta")
+
+    assert lobby_snapshot.frames(lambda: b"new") == [b"new"]
+
+
+def test_chat_history_is_paginated_from_newest():
+    """Login gets only the newest page, older pages are fetched with the cursor."""
+    history = ChatHistory()
+    for number in range(45):
+        history.append(f"message {number}")
+
+    messages, cursor = history.latest(20)
+    assert messages[0] == "message 25" and messages[-1] == "message 44"
+
+    messages, cursor = history.before(cursor, 20)
+    assert messages[0] == "message 5" and messages[-1] == "message 24"
+
+    messages, cursor = history.before(cursor, 20)
+    assert messages == [f"message {number}" for number in range(5)]
+    assert cursor is None
+
+
+def test_chat_history_keeps_ids_after_trimming():
+    """Cursors stay valid when the oldest messages are removed from the history."""
+    history = ChatHistory(max_messages=10)
+    for number in range(15):
+        assert history.append(f"message {number}") == number
+
+    messages, cursor = history.before(12, 3)
+    assert messages == ["message 9", "message 10", "message 11"]
+    assert cursor == 9
+
+    messages, cursor = history.before(5, 3)
+    assert not messages and cursor is None
+
+
+def test_duplicate_challenges_are_ignored():
+    """Second challenge to the same player and challenge to oneself are not stored."""
+    registry = ChallengeRegistry()
+    assert registry.add("John", "Mary")
+    assert not registry.add("John", "Mary")
+    assert not registry.add("John", "John")
+    assert registry.add("Mary", "John")
+    assert len(registry) == 2
+
+
+def test_removing_player_returns_only_affected_players():
+    """Only the players holding a challenge of the removed player are returned."""
+    registry = ChallengeRegistry()
+    registry.add("John", "Mary")
+    registry.add("Doe", "John")
+    registry.add("Doe", "Mary")
+
+    assert registry.remove_player("John") == {
+        "Mary": [("John", "Mary")],
+        "Doe": [("Doe", "John")],
+    }
+    assert registry.challenges_of("Doe") == ({"Mary"}, set())
+    assert registry.challenges_of("Mary") == (set(), {"Doe"})
+    assert not registry.remove("John", "Mary")
+
+
+def test_matchmaker_pairs_close_scores():
+    """Neighbours by score are paired, player without close opponent keeps waiting."""
+    matchmaker = Matchmaker(score_band=2, band_growth=1)
+    matchmaker.join("John", 0, now=0)
+    matchmaker.join("Mary", 10, now=0)
+    matchmaker.join("Doe", 1, now=0)
+    assert not matchmaker.join("Doe", 1, now=0)
+
+    assert matchmaker.pair(now=0) == [("John", "Doe")]
+    assert "Mary" in matchmaker and len(matchmaker) == 1
+
+
+def test_matchmaker_band_grows_with_waiting():
+    """Players with distant scores are paired after waiting long enough."""
+    matchmaker = Matchmaker(score_band=2, band_growth=1, rate_window=10)
+    matchmaker.join("John", 0, now=0)
+    matchmaker.join("Mary", 10, now=5)
+
+    assert not matchmaker.pair(now=5)
+    assert matchmaker.pair(now=8) == [("John", "Mary")]
+
+    stats = matchmaker.stats(now=8)
+    assert stats["queue_length"] == 0
+    assert stats["wait_max"] == 8 and stats["wait_avg"] == 5.5
+    assert stats["pairings"] == 1 and stats["pairings_per_second"] == 0.1
+
+
+def test_matchmaker_fills_rooms():
+    """Players with close scores share one room of at most room_size players."""
+    matchmaker = Matchmaker(room_size=3, score_band=2, band_growth=0)
+    for number, name in enumerate(["John", "Mary", "Doe", "Jane", "Bob"]):
+        matchmaker.join(name, number // 2, now=0)
+
+    assert matchmaker.pair(now=0) == [("John", "Mary", "Doe"), ("Jane", "Bob")]
+
+
+def test_requeued_players_keep_their_waiting_time():
+    """Players of a room which could not be started wait with their original joining time."""
+    matchmaker = Matchmaker(score_band=2, band_growth=1)
+    matchmaker.join("John", 0, now=0)
+    matchmaker.join("Mary", 10, now=2)
+    assert matchmaker.pair(now=10) == [("John", "Mary")]
+
+    assert matchmaker.requeue("Mary")
+    assert not matchmaker.requeue("Mary")
+    assert not matchmaker.requeue("Doe")
+    assert matchmaker.stats(now=10)["longest_wait"] == 8
+
+    matchmaker.join("Doe", 20, now=10)
+    assert matchmaker.pair(now=10) == [("Mary", "Doe")]
+
+
+def test_scores_survive_restart(tmp_path):
+    """Scores written by the batches are read back after the store is opened again."""
+    store = ScoreStore(str(tmp_path / "scores.db"), flush_interval=0.01)
+    store.start()
+    assert store.get("John") == 0
+
+    for _ in range(5):
+        store.add("John")
+    store.set("Mary", 3)
+    store.close()
+
+    store = ScoreStore(str(tmp_path / "scores.db"))
+    assert store.get("John") == 5 and store.get("Mary") == 3
+    assert store.get("Doe") == 0
+    store.close()
+
+
+def test_changes_are_written_in_batches(tmp_path):
+    """Several changes of one player before the flush are written as one row."""
+    store = ScoreStore(str(tmp_path / "scores.db"))
+    for score in range(100):
+        store.set("John", score)
+    store.close()
+
+    assert store.flushed_batches == 1 and store.flushed_scores == 1
+
+
+def test_score_in_flight_survives_logout_and_login(tmp_path):
+    """Player evicted while his batch is being written gets his new score, not the stored one."""
+    store = ScoreStore(str(tmp_path / "scores.db"))
+    store.add("John")
+    store.add("Mary")
+
+    batch = store.take_pending()
+    store.evict("John")
+    store.evict("Mary")
+    assert store.get("John") == 1
+
+    store.write_batch(store.reader, batch)
+    assert "John" in store.cache and "Mary" not in store.cache
+    assert store.get("Mary") == 1
+    store.close()
+
+
+def test_best_players_include_uncommitted_scores(tmp_path):
+    """Top players, ranks and the count see the stored scores and the changes not written yet."""
+    store = ScoreStore(str(tmp_path / "scores.db"))
+    for name, score in [("John", 3), ("Mary", 7), ("Doe", 3)]:
+        store.set(name, score)
+    store.write_batch(store.reader, store.take_pending())
+
+    store.set("John", 9)
+    store.get("Jane", register=True)
+    assert store.top(3) == [("John", 9), ("Mary", 7), ("Doe", 3)]
+    assert store.rank("Mary") == 2 and store.rank("Doe") == 3 and store.rank("Jane") == 4
+    assert store.rank("Nobody") is None
+    assert store.count() == 4
+
+    batch = store.take_pending()
+    store.write_batch(store.reader, batch)
+    assert store.top(4) == [("John", 9), ("Mary", 7), ("Doe", 3), ("Jane", 0)]
+    assert store.rank("John") == 1 and store.count() == 4
+    store.close()
+
+
+def test_leaderboard_ranks_and_top():
+    """Players are ordered by score and name, equal scores share the rank."""
+    leaderboard = Leaderboard(max_score=2)
+    for name, score in [("John", 3), ("Mary", 7), ("Doe", 3), ("Jane", 0)]:
+        leaderboard.update(name, score)
+
+    assert leaderboard.top(3) == [("Mary", 7), ("Doe", 3), ("John", 3)]
+    assert leaderboard.rank("Mary") == 1
+    assert leaderboard.rank("John") == leaderboard.rank("Doe") == 2
+    assert leaderboard.rank("Jane") == 4
+
+    leaderboard.update("Jane", 8)
+    leaderboard.remove("Mary")
+    assert leaderboard.ranking() == [("Jane", 8), ("Doe", 3), ("John", 3)]
+    assert leaderboard.rank("Mary") is None
+
+
+def test_ranking_is_rebuilt_only_after_change():
+    """The sorted view is reused until a score changes."""
+    leaderboard = Leaderboard()
+    leaderboard.update("John", 1)
+
+    ranking = leaderboard.ranking()
+    assert leaderboard.ranking() is ranking
+
+    leaderboard.update("John", 1)
+    assert leaderboard.ranking() is ranking
+
+    leaderboard.update("John", 2)
+    assert leaderboard.ranking() == [("John", 2)]
@@ -0,0 +1,104 @@
+import sys
+import os
+import socket
+import threading
+import urllib.request
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from communication import communication, message
+from communication.outbox import Outbox
+from monitoring.metrics import Histogram, Metrics, serve_metrics
+
+
+def test_histogram_counts_values_into_cumulative_buckets():
+    """Every value is counted in its bucket and in all bigger ones."""
+    histogram = Histogram((0.001, 0.01, 0.1))
+    for value in (0.0005, 0.001, 0.005, 0.5):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [(0.001, 2), (0.01, 3), (0.1, 3), (float("inf"), 4)]
+    assert histogram.count == 4
+    assert abs(histogram.sum - 0.5065) < 1e-9
+
+
+def test_metrics_are_rendered_in_prometheus_format():
+    """Counters, histograms and gauges are rendered with their labels."""
+    metrics = Metrics(prefix="test_")
+    metrics.describe("frames_in_total", "counter", "Frames received.")
+    metrics.inc("frames_in_total", info="heartbeat")
+    metrics.inc("frames_in_total", 2, info="heartbeat")
+    metrics.observe("handler_seconds", 0.002, info="login_attempt")
+    metrics.gauge("clients_connected", "Connected clients.", lambda: 3)
+
+    rendered = metrics.render()
+
+    assert "# HELP test_frames_in_total Frames received." in rendered
+    assert "# TYPE test_frames_in_total counter" in rendered
+    assert 'test_frames_in_total{info="heartbeat"} 3' in rendered
+    assert "# TYPE test_handler_seconds histogram" in rendered
+    assert 'test_handler_seconds_bucket{info="login_attempt",le="0.001"} 0' in rendered
+    assert 'test_handler_seconds_bucket{info="login_attempt",le="0.0025"} 1' in rendered
+    assert 'test_handler_seconds_bucket{info="login_attempt",le="+Inf"} 1' in rendered
+    assert 'test_handler_seconds_count{info="login_attempt"} 1' in rendered
+    assert "test_clients_connected 3" in rendered
+    assert metrics.value("frames_in_total", info="heartbeat") == 3
+
+
+def test_label_values_are_escaped():
+    """Quotes and newlines in label values do not break the format."""
+    metrics = Metrics()
+    metrics.inc("frames_in_total", info='a"b\nc')
+
+    assert 'frames_in_total{info="a\\"b\\nc"} 1' in metrics.render()
+
+
+def test_metrics_are_served_over_http():
+    """The endpoint answers /metrics and nothing else."""
+    metrics = Metrics()
+    metrics.inc("frames_in_total", info="heartbeat")
+    http_server = serve_metrics(metrics)
+    host, port = http_server.server_address
+
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+            assert response.status == 200
+            assert 'frames_in_total{info="heartbeat"} 1' in response.read().decode()
+
+        try:
+            urllib.request.urlopen(f"http://{host}:{port}/other", timeout=5)
+            assert False
+        except urllib.error.HTTPError as error:
+            assert error.code == 404
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+
+def test_outbox_reports_sent_frames_with_their_info():
+    """Frames remember the info of the message, so sent bytes can be counted per type."""
+    server_side, client_side = socket.socketpair()
+    client_side.settimeout(5)
+
+    sent = []
+    all_sent = threading.Event()
+
+    def on_sent(frame):
+        sent.append((frame.info, len(frame)))
+        if len(sent) == 2:
+            all_sent.set()
+
+    outbox = Outbox(server_side, on_sent=on_sent)
+    outbox.start()
+    outbox.put(message.Message("heartbeat"))
+    outbox.put(communication.encode_object(message.Message("public_message", "hello")))
+
+    assert communication.load_object(client_side).info == "heartbeat"
+    assert communication.load_object(client_side).info == "public_message"
+    assert all_sent.wait(5)
+    assert [info for info, _ in sent] == ["heartbeat", "public_message"]
+    assert outbox.sent_bytes == sum(size for _, size in sent)
+
+    outbox.close()
+    server_side.close()
+    client_side.close()
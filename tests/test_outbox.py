@@ -0,0 +1,102 @@
+import sys
+import os
+import socket
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from communication import communication, message
+from communication.outbox import Outbox, PRIORITY_REALTIME, PRIORITY_BULK
+
+
+def test_realtime_messages_jump_ahead_and_are_conflated():
+    """Position updates are sent before bulk traffic and only the newest one is sent."""
+    server_side, client_side = socket.socketpair()
+    client_side.settimeout(5)
+    outbox = Outbox(server_side)
+
+    outbox.put(message.Message("login_successful", "snapshot"), PRIORITY_BULK)
+    outbox.put(message.Message("public_message", "hello"), PRIORITY_BULK)
+    outbox.put(message.Message("game_state_delta", 1), PRIORITY_REALTIME,
+               conflate_key="game_state_delta")
+    outbox.put(message.Message("game_state_delta", 2), PRIORITY_REALTIME,
+               conflate_key="game_state_delta")
+    outbox.start()
+
+    received = [communication.load_object(client_side) for _ in range(3)]
+    assert [(loaded.info, loaded.data) for loaded in received] == [
+        ("game_state_delta", 2),
+        ("login_successful", "snapshot"),
+        ("public_message", "hello"),
+    ]
+    assert outbox.conflated_frames == 1
+
+    outbox.close()
+    server_side.close()
+    client_side.close()
+
+
+def test_start_of_another_game_drops_waiting_updates():
+    """Update of the previous game is not sent after the message starting the next one."""
+    server_side, client_side = socket.socketpair()
+    client_side.settimeout(5)
+    outbox = Outbox(server_side)
+
+    outbox.put(message.Message("game_state_delta", "old room"), PRIORITY_REALTIME,
+               conflate_key="game_state_delta")
+    outbox.put(message.Message("accepted_challenge", "new room"), PRIORITY_REALTIME,
+               drops=("game_state_delta",))
+    outbox.put(message.Message("game_state_delta", "new room"), PRIORITY_REALTIME,
+               conflate_key="game_state_delta")
+    outbox.start()
+
+    received = [communication.load_object(client_side) for _ in range(2)]
+    assert [(loaded.info, loaded.data) for loaded in received] == [
+        ("accepted_challenge", "new room"),
+        ("game_state_delta", "new room"),
+    ]
+
+    outbox.close()
+    server_side.close()
+    client_side.close()
+
+
+def test_object_can_be_reused_after_put():
+    """Object is serialized when it is queued, so later changes are not sent."""
+    server_side, client_side = socket.socketpair()
+    client_side.settimeout(5)
+    outbox = Outbox(server_side)
+
+    answer = message.Message("login_successful", "first")
+    outbox.put(answer)
+    answer.info = "user_count_change"
+    outbox.start()
+
+    assert communication.load_object(client_side).info == "login_successful"
+
+    outbox.close()
+    server_side.close()
+    client_side.close()
+
+
+def test_frame_split_inside_the_length_is_received_whole():
+    """The frame is read whole even when its length arrives in two segments."""
+    server_side, client_side = socket.socketpair()
+    client_side.settimeout(5)
+
+    frame = communication.encode_object(message.Message("public_message", "x" * 5000))
+    server_side.sendall(frame[:2])
+
+    def send_rest():
+        time.sleep(0.05)
+        server_side.sendall(frame[2:])
+
+    sender = threading.Thread(target=send_rest)
+    sender.start()
+
+    assert communication.load_object(client_side).data == "x" * 5000
+
+    sender.join()
+    server_side.close()
+    client_side.close()
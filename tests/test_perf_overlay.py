@@ -0,0 +1,53 @@
+import sys
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pygame
+
+from widgets.perf_overlay import PerfOverlay
+
+
+def make_overlay():
+    """Creates the overlay with an initialized font module."""
+    pygame.font.init()
+    return PerfOverlay(history=4)
+
+
+def test_phase_times_are_averaged_over_history():
+    """Only the last frames are kept, FPS comes from the intervals between frames."""
+    overlay = make_overlay()
+    overlay.end_frame(now=0)
+
+    for frame in range(1, 6):
+        overlay.add_time("update", 0.002)
+        overlay.add_time("draw", 0.004 * frame)
+        overlay.end_frame(now=frame * 0.02)
+
+    stats = overlay.stats()
+    assert len(overlay.frames) == 4
+    assert abs(stats["fps"] - 50) < 1e-6
+    assert abs(stats["frame_max"] - 0.02) < 1e-9
+    assert abs(stats["phases"]["update"] - 0.002) < 1e-9
+    assert abs(stats["phases"]["draw"] - 0.004 * 3.5) < 1e-9
+    assert stats["phases"]["display"] == 0
+
+
+def test_visible_overlay_is_drawn_with_graph():
+    """Drawing the visible overlay changes the screen, hidden one does not."""
+    overlay = make_overlay()
+    screen = pygame.Surface((400, 300))
+
+    overlay.add_time("draw", 0.03)
+    overlay.end_frame(now=1)
+    overlay.draw(screen)
+    assert screen.get_at((20, 20)) == (0, 0, 0, 255)
+
+    screen.fill((255, 255, 255))
+    overlay.toggle()
+    overlay.draw(screen)
+
+    graph_bottom = (10 + overlay.graph.get_width() - 1, 5 + overlay.panel.get_height() - 6)
+    assert screen.get_at((10, 10)) != (255, 255, 255, 255)
+    assert screen.get_at(graph_bottom)[:3] == (0, 220, 0)
@@ -0,0 +1,70 @@
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from monitoring.profiler import SamplingProfiler, MemoryTracker
+
+
+def busy_handler(stop):
+    """Handler which keeps the thread busy until it is stopped."""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_contains_only_selected_threads(tmp_path):
+    """Stacks of handler threads are collapsed from the thread name to the innermost call."""
+    stop = threading.Event()
+    handler = threading.Thread(target=busy_handler, args=(stop,), name="handler-test")
+    other = threading.Thread(target=stop.wait, name="other")
+    handler.start()
+    other.start()
+
+    profiler = SamplingProfiler(thread_prefixes=("handler",), interval=0.001)
+    path = tmp_path / "profile.collapsed"
+    try:
+        collapsed = profiler.profile_to_file(0.2, str(path))
+    finally:
+        stop.set()
+        handler.join()
+        other.join()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert collapsed == path.read_text(encoding="utf-8")
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("handler-test;")
+        assert int(count) > 0
+    assert any("busy_handler (test_profiler.py" in line for line in lines)
+
+
+def test_only_one_profile_runs_at_a_time():
+    """A second profile started during a running one is refused."""
+    profiler = SamplingProfiler(interval=0.001)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(profiler.profile(0.3)))
+    thread.start()
+    time.sleep(0.1)
+
+    assert profiler.profile(0.1) is None
+    thread.join()
+    assert results[0] is not None
+
+
+def test_memory_diff_reports_growth_and_container_sizes():
+    """The second snapshot shows the allocations made after the first one."""
+    kept = []
+    tracker = MemoryTracker(sizes=lambda: {"kept": len(kept)})
+
+    first = tracker.diff()
+    assert "First snapshot" in first
+    assert "kept: 0 (+0)" in first
+
+    kept.extend(bytearray(1024) for _ in range(100))
+    second = tracker.diff()
+
+    assert "kept: 100 (+100)" in second
+    assert "test_profiler.py" in second
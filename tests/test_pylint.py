@@ -11,15 +11,36 @@ def test_pylint_score():
         "scenes/login_scene.py",
         "scenes/menu_scene.py",
         "scenes/game_scene.py",
+        "scenes/spectator_scene.py",
         "widgets/button.py",
         "widgets/entry.py",
         "widgets/chatLog.py",
+        "widgets/perf_overlay.py",
         "communication/communication.py",
+        "communication/inbox.py",
+        "communication/outbox.py",
+        "communication/latency.py",
         "communication/message.py",
         "communication/server_utils.py",
         "exceptions/my_exceptions.py",
+        "lobby/challenges.py",
+        "lobby/chat_history.py",
+        "lobby/leaderboard.py",
+        "lobby/matchmaking.py",
+        "lobby/presence.py",
+        "lobby/score_store.py",
+        "lobby/snapshot.py",
         "maze/maze_generator.py",
-        "maze/player_maze.py"
+        "maze/player_maze.py",
+        "maze/game_session.py",
+        "maze/maze_pool.py",
+        "maze/movement.py",
+        "maze/replay.py",
+        "maze/smoothing.py",
+        "monitoring/metrics.py",
+        "monitoring/watchdog.py",
+        "monitoring/profiler.py",
+        "monitoring/tracing.py"
 
     ]
 
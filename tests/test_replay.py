@@ -0,0 +1,85 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from maze.maze_generator import bfs_maze, assign_start_positions
+from maze.movement import pack_path
+from maze.replay import ReplayWriter, ReplayReader
+
+
+def record_game(writer, players):
+    """Records a short game and returns its id together with the generated maze."""
+    generated_maze = bfs_maze(21)
+    assign_start_positions(generated_maze, players)
+
+    game_id = writer.start_game(players, generated_maze["array"], generated_maze["end_tile"],
+                                {player: generated_maze[player] for player in players})
+    writer.record_moves(game_id, 1, {players[0]: pack_path([(1, 1), (1, 2)])})
+    writer.record_moves(game_id, 3, {players[1]: pack_path([(3, 3)]), players[0]: b""})
+    writer.record_win(game_id, players[1])
+    writer.end_game(game_id)
+
+    return game_id, generated_maze
+
+
+def test_replay_is_read_back(tmp_path):
+    """Reader returns the maze, start positions and moves of the recorded game."""
+    writer = ReplayWriter(tmp_path)
+    game_id, generated_maze = record_game(writer, ("John", "Mary"))
+    writer.close()
+
+    reader = ReplayReader(tmp_path)
+    header = reader.header(game_id)
+    assert header["players"] == ("John", "Mary")
+    assert header["array"] == generated_maze["array"]
+    assert header["positions"]["Mary"] == tuple(generated_maze["Mary"])
+
+    moves = [(tick, moves) for _, tick, moves in reader.moves(game_id)]
+    assert moves == [
+        (1, {"John": pack_path([(1, 1), (1, 2)])}),
+        (3, {"Mary": pack_path([(3, 3)]), "John": b""}),
+    ]
+    assert reader.winner(game_id) == "Mary"
+    reader.close()
+
+
+def test_games_are_indexed_across_restarts(tmp_path):
+    """Every game has its own records and ids continue after the log is opened again."""
+    writer = ReplayWriter(tmp_path)
+    first, _ = record_game(writer, ("John", "Mary"))
+    writer.close()
+
+    writer = ReplayWriter(tmp_path)
+    second, _ = record_game(writer, ("Doe", "Jane"))
+    writer.close()
+
+    reader = ReplayReader(tmp_path)
+    assert reader.games() == [first, second] and first != second
+    assert reader.header(second)["players"] == ("Doe", "Jane")
+    assert reader.header(999) is None
+    reader.close()
+
+
+def test_shared_index_sees_flushed_games(tmp_path):
+    """Reader sharing the index of the writer finds games recorded after it was opened."""
+    writer = ReplayWriter(tmp_path, flush_interval=60)
+    reader = ReplayReader(tmp_path, writer.games_index)
+    assert reader.newest_game() is None
+
+    first, _ = record_game(writer, ("John", "Mary"))
+    game_id = writer.start_game(("Doe", "John"), [[1]], (0, 0), {"Doe": (0, 0), "John": (0, 0)})
+    assert reader.newest_game("John") == first and reader.newest_game("Doe") is None
+
+    writer.flush()
+    assert reader.newest_game("John") == game_id and reader.newest_game("Mary") == first
+    assert reader.header(game_id)["players"] == ("Doe", "John")
+    assert reader.winner(first) == "Mary"
+
+    writer.close()
+    reader.close()
+
+    reopened = ReplayReader(tmp_path)
+    assert reopened.games() == [first, game_id]
+    assert reopened.newest_game("Doe") == game_id
+    reopened.close()
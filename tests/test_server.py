@@ -1,70 +1,137 @@
 import sys
 import os
-import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import pytest
+import math
 import socket
-import threading
+import sqlite3
+import time
 
-from server import main as server_main
-from communication import connect_to_server, communication, message
+from server import GameServer
+from communication import communication, message
+from maze.maze_generator import distances_from_end
+from maze.movement import pack_path
+from lobby.score_store import ScoreStore
+from exceptions.my_exceptions import CommunicationError
 
-CLIENT_PORT = 65432
+RESPONSE_TIMEOUT = 5
 
 
-@pytest.fixture(scope="module")
-def start_server():
-    """Fixture to start the server before each test."""
-    server_thread = threading.Thread(target=server_main, daemon=True)
-    server_thread.start()
-    time.sleep(2)
+@pytest.fixture
+def start_server(tmp_path):
+    """Fixture to start an isolated server on a free port for each test."""
+    server = GameServer("127.0.0.1", 0, data_directory=str(tmp_path))
+    server.start()
 
-    SERVER_ADDRESS = connect_to_server.check_server_status()
+    yield server.address
 
-    yield SERVER_ADDRESS
+    server.stop()
 
 
 def create_and_connect_client(server_address, username):
     """Helper function to create a client, connect to the server, and send a login attempt."""
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client.connect((server_address, CLIENT_PORT))
+    client = socket.create_connection(server_address)
+    client.settimeout(RESPONSE_TIMEOUT)
 
     login_message = message.Message()
     login_message.info = "login_attempt"
     login_message.data = username
 
-    time.sleep(1)
-
     communication.send_object(login_message, client)
 
-    time.sleep(1)
-
     return client
 
 
-def get_response(client):
-    """Helper function to get the response from the server."""
-    return communication.load_object(client)
+def get_response(client, username=None):
+    """
+        Helper function to get the response from the server.
+        After successful login, the snapshot is followed by presence deltas
+        up to the login of the client, they are read as well.
+    """
+    response = communication.load_object(client)
+
+    if response.info == "login_successful" and username is not None:
+        while True:
+            delta = communication.load_object(client)
+            _, kind, payload = delta.data
+            if kind == "joined" and payload[0] == username:
+                break
+
+    return response
 
 
 def send_logout(client, username):
-    """Helper function to send a logout message."""
+    """Helper function to send a logout message, waits until the server closes the connection."""
     logout_message = message.Message()
     logout_message.info = "disconnect"
     logout_message.data = username
 
     communication.send_object(logout_message, client)
 
-    time.sleep(1)
+    with pytest.raises(CommunicationError):
+        while True:
+            communication.load_object(client)
+
+
+def send_message(client, info, data):
+    """Helper function to send one message."""
+    sent_message = message.Message()
+    sent_message.info = info
+    sent_message.data = data
+
+    communication.send_object(sent_message, client)
+
+
+def login_clients(server_address, *usernames):
+    """
+        Logs the clients in one after another and reads the presence deltas
+        announcing the later ones from the earlier ones.
+    """
+    clients = []
+    for username in usernames:
+        client = create_and_connect_client(server_address, username)
+        assert get_response(client, username).info == "login_successful"
+
+        for other in clients:
+            listened = communication.load_object(other)
+            assert listened.info == "presence_delta"
+            assert listened.data[2][0] == username
+
+        clients.append(client)
+
+    return clients
+
+
+def read_until(client, info, kind=None):
+    """Reads messages of the client until the one with the given info (and kind of delta)."""
+    while True:
+        received = communication.load_object(client)
+        if received.info == info and (kind is None or received.data[1] == kind):
+            return received
+
+
+def path_to_end(generated_maze, start):
+    """Returns the shortest path from the start to the end tile of the maze."""
+    distances = distances_from_end(generated_maze["array"], tuple(generated_maze["end_tile"]))
+    position = tuple(start)
+    path = []
+
+    while distances[position] > 0:
+        x, y = position
+        position = min(((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)),
+                       key=lambda tile: distances.get(tile, math.inf))
+        path.append(position)
+
+    return path
 
 
 def test_client_connection(start_server):
     """Test that the client connects to the server successfully."""
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        client.connect((start_server, CLIENT_PORT))
+        client.connect(start_server)
         client.close()
     except Exception as e:
         pytest.fail(f"Client failed to connect to the server: {e}")
@@ -74,7 +141,7 @@ def test_client_login(start_server):
     """Test if the client can log in with a valid username."""
 
     client = create_and_connect_client(start_server, "John")
-    response = get_response(client)
+    response = get_response(client, "John")
     assert response.info == "login_successful"
 
     send_logout(client, "John")
@@ -85,12 +152,11 @@ def test_login_with_duplicate_names(start_server):
     """Test that client cannot have the same username as someone already logged in."""
 
     client1 = create_and_connect_client(start_server, "test")
-    response1 = get_response(client1)
+    response1 = get_response(client1, "test")
     assert response1.info == "login_successful"
 
-    time.sleep(0.1)
     client2 = create_and_connect_client(start_server, "test")
-    response2 = get_response(client2)
+    response2 = get_response(client2, "test")
     assert response2.info == "wrong_login_name"
 
     send_logout(client1, "test")
@@ -102,15 +168,13 @@ def test_login_with_non_duplicate_names(start_server):
     """Test that two clients can log in with different usernames."""
 
     client1 = create_and_connect_client(start_server, "test")
-    response1 = get_response(client1)
+    response1 = get_response(client1, "test")
     assert response1.info == "login_successful"
 
-    time.sleep(0.1)
     client2 = create_and_connect_client(start_server, "test2")
-    response2 = get_response(client2)
+    response2 = get_response(client2, "test2")
     assert response2.info == "login_successful"
 
-    time.sleep(0.1)
     send_logout(client1, "test")
     client1.close()
 
@@ -118,36 +182,16 @@ def test_login_with_non_duplicate_names(start_server):
     client2.close()
 
 
-def test_user_count_change_delivery(start_server):
-    client1 = create_and_connect_client(start_server, "John")
-    response1 = get_response(client1)
-    assert response1.info == "login_successful"
-
-    time.sleep(0.1)
-    client2 = create_and_connect_client(start_server, "Mary")
-    response2 = get_response(client2)
-    assert response2.info == "login_successful"
-
-    time.sleep(0.1)
-    listened1 = communication.load_object(client1)
-    assert listened1.info == "user_count_change"
-
-    time.sleep(0.1)
-    client3 = create_and_connect_client(start_server, "Doe")
-    response3 = get_response(client3)
-    assert response3.info == "login_successful"
-
-    time.sleep(0.1)
-    listened1 = communication.load_object(client1)
-    assert listened1.info == "user_count_change"
-
-    time.sleep(0.1)
-    listened2 = communication.load_object(client2)
-    assert listened2.info == "user_count_change"
+def test_presence_delta_delivery(start_server):
+    client1, client2, client3 = login_clients(start_server, "John", "Mary", "Doe")
 
     send_logout(client1, "John")
     client1.close()
 
+    listened2 = communication.load_object(client2)
+    assert listened2.info == "presence_delta"
+    assert listened2.data[1:] == ("left", "John")
+
     send_logout(client2, "Mary")
     client2.close()
 
@@ -156,44 +200,13 @@ def test_user_count_change_delivery(start_server):
 
 
 def test_public_message_delivery(start_server):
-    client1 = create_and_connect_client(start_server, "John")
-    response1 = get_response(client1)
-    assert response1.info == "login_successful"
-
-    time.sleep(0.1)
-    client2 = create_and_connect_client(start_server, "Mary")
-    response2 = get_response(client2)
-    assert response2.info == "login_successful"
-
-    time.sleep(0.1)
-    listened1 = communication.load_object(client1)
-    assert listened1.info == "user_count_change"
+    client1, client2, client3 = login_clients(start_server, "John", "Mary", "Doe")
 
-    time.sleep(0.1)
-    client3 = create_and_connect_client(start_server, "Doe")
-    response3 = get_response(client3)
-    assert response3.info == "login_successful"
+    send_message(client1, "public_message", "Hello everybody")
 
-    time.sleep(0.1)
-    listened1 = communication.load_object(client1)
-    assert listened1.info == "user_count_change"
-
-    time.sleep(0.1)
-    listened2 = communication.load_object(client2)
-    assert listened2.info == "user_count_change"
-
-    public_message = message.Message()
-    public_message.info = "public_message"
-    public_message.data = "Hello everybody"
-
-    time.sleep(0.1)
-    communication.send_object(public_message, client1)
-
-    time.sleep(0.1)
     listened2 = communication.load_object(client2)
     assert listened2.data == "Hello everybody"
 
-    time.sleep(0.1)
     listened3 = communication.load_object(client3)
     assert listened3.data == "Hello everybody"
 
@@ -208,39 +221,16 @@ def test_public_message_delivery(start_server):
 
 
 def test_challenge_delivery(start_server):
-    time.sleep(3)
-    client1 = create_and_connect_client(start_server, "John")
-    response1 = get_response(client1)
-    assert response1.info == "login_successful"
-
-    time.sleep(0.1)
-    client2 = create_and_connect_client(start_server, "Mary")
-    response2 = get_response(client2)
-    assert response2.info == "login_successful"
-
-    time.sleep(0.1)
-    listened1 = communication.load_object(client1)
-    assert listened1.info == "user_count_change"
+    client1, client2 = login_clients(start_server, "John", "Mary")
 
-    challenge_message = message.Message()
-    time.sleep(0.1)
-    challenge_message.info = "create_challenge"
-    time.sleep(0.1)
-    challenge_message.data = "Mary"
+    send_message(client1, "create_challenge", "Mary")
 
-    time.sleep(0.1)
-    communication.send_object(challenge_message, client1)
-
-    time.sleep(0.1)
     listened2 = communication.load_object(client2)
     assert listened2.info == "received_challenge"
     assert listened2.data == "John"
 
-    time.sleep(0.1)
-    challenge_message.info = "delete_challenge"
-    communication.send_object(challenge_message, client1)
+    send_message(client1, "delete_challenge", "Mary")
 
-    time.sleep(0.1)
     listened2 = communication.load_object(client2)
     assert listened2.info == "delete_challenge"
     assert listened2.data == "John"
@@ -253,65 +243,26 @@ def test_challenge_delivery(start_server):
 
 
 def test_challenge_is_not_valid_after_opponent_started_another_game(start_server):
-    client1 = create_and_connect_client(start_server, "John")
-    response1 = get_response(client1)
-    assert response1.info == "login_successful"
-
-    time.sleep(0.1)
-    client2 = create_and_connect_client(start_server, "Mary")
-    response2 = get_response(client2)
-    assert response2.info == "login_successful"
-
-    time.sleep(0.1)
-    listened1 = communication.load_object(client1)
-    assert listened1.info == "user_count_change"
+    client1, client2, client3 = login_clients(start_server, "John", "Mary", "Doe")
 
-    time.sleep(0.1)
-    client3 = create_and_connect_client(start_server, "Doe")
-    response3 = get_response(client3)
-    assert response3.info == "login_successful"
+    send_message(client1, "create_challenge", "Mary")
 
-    time.sleep(0.1)
-    listened1 = communication.load_object(client1)
-    assert listened1.info == "user_count_change"
-
-    time.sleep(0.1)
-    listened2 = communication.load_object(client2)
-    assert listened2.info == "user_count_change"
-
-    challenge_message = message.Message()
-    challenge_message.info = "create_challenge"
-    challenge_message.data = "Mary"
-
-    time.sleep(0.1)
-    communication.send_object(challenge_message, client1)
-
-    time.sleep(0.1)
     listened2 = communication.load_object(client2)
     assert listened2.info == "received_challenge"
     assert listened2.data == "John"
 
-    time.sleep(0.1)
-    challenge_message.data = "Doe"
-    communication.send_object(challenge_message, client2)
+    send_message(client2, "create_challenge", "Doe")
 
-    time.sleep(0.1)
     listened3 = communication.load_object(client3)
     assert listened3.info == "received_challenge"
     assert listened3.data == "Mary"
 
-    time.sleep(0.1)
-    challenge_message.info = "accept_challenge"
-    challenge_message.data = "John"
-    communication.send_object(challenge_message, client2)
+    send_message(client2, "accept_challenge", "John")
 
-    time.sleep(0.1)
     listened1 = communication.load_object(client1)
     assert listened1.info == "accepted_challenge"
 
-    time.sleep(0.1)
     listened3 = communication.load_object(client3)
-
     assert listened3.info == "challenge_no_longer_valid"
 
     send_logout(client1, "John")
@@ -322,3 +273,149 @@ def test_challenge_is_not_valid_after_opponent_started_another_game(start_server
 
     send_logout(client3, "Doe")
     client3.close()
+
+
+def test_servers_are_isolated(tmp_path):
+    """Two servers in one process have their own ports and their own players."""
+    with GameServer("127.0.0.1", 0, data_directory=str(tmp_path / "first")) as first, \
+            GameServer("127.0.0.1", 0, data_directory=str(tmp_path / "second")) as second:
+        assert first.address != second.address
+
+        client1 = create_and_connect_client(first.address, "John")
+        assert get_response(client1, "John").info == "login_successful"
+
+        client2 = create_and_connect_client(second.address, "John")
+        assert get_response(client2, "John").info == "login_successful"
+
+        assert first.clients_name == second.clients_name == {"John"}
+
+        client1.close()
+        client2.close()
+
+
+def test_stop_closes_connections(tmp_path):
+    """Stopping the server disconnects the clients and frees the port in a moment."""
+    server = GameServer("127.0.0.1", 0, data_directory=str(tmp_path)).start()
+
+    client = create_and_connect_client(server.address, "John")
+    assert get_response(client, "John").info == "login_successful"
+
+    started = time.perf_counter()
+    server.stop()
+    assert time.perf_counter() - started < 1
+
+    with pytest.raises(CommunicationError):
+        communication.load_object(client)
+    client.close()
+
+    assert not server.outboxes
+    assert not server.client_threads
+
+
+def test_win_is_counted_once_at_the_end_tile(tmp_path):
+    """The claim of a win gives a point only when the player is at the end, and only once."""
+    with GameServer("127.0.0.1", 0, data_directory=str(tmp_path)) as server:
+        client1, client2 = login_clients(server.address, "John", "Mary")
+
+        send_message(client1, "create_challenge", "Mary")
+        read_until(client2, "received_challenge")
+        send_message(client2, "accept_challenge", "John")
+        _, generated_maze = read_until(client1, "accepted_challenge").data
+
+        send_message(client1, "player_have_won_a_game", "John")
+        send_message(client1, "public_message", "before")
+        read_until(client2, "public_message")
+        assert server.score_store.get("John") == 0
+
+        send_message(client1, "change_position",
+                     (1, pack_path(path_to_end(generated_maze, generated_maze["John"]))))
+        send_message(client1, "player_have_won_a_game", "John")
+        assert read_until(client2, "presence_delta", "score_changed").data[2] == ("John", 1)
+        assert server.find_player_room("John") is None
+
+        send_message(client1, "player_have_won_a_game", "John")
+        send_message(client1, "public_message", "after")
+        read_until(client2, "public_message")
+        assert server.score_store.get("John") == 1
+
+        client1.close()
+        client2.close()
+
+
+def test_history_request_is_validated(start_server):
+    """Requests with a cursor which is not an integer are ignored and the limit is clamped."""
+    client1, client2 = login_clients(start_server, "John", "Mary")
+
+    for number in range(3):
+        send_message(client1, "public_message", f"message {number}")
+        read_until(client2, "public_message")
+
+    send_message(client2, "fetch_history", ("newest", 10))
+    send_message(client2, "fetch_history", (10 ** 9, -5))
+
+    messages, cursor = read_until(client2, "history_page").data
+    assert messages == ["message 2"] and cursor is not None
+
+    client1.close()
+    client2.close()
+
+
+def test_spectating_is_refused_with_reason(start_server):
+    """The client learns why it can not watch the game or the replay."""
+    client1, client2 = login_clients(start_server, "John", "Mary")
+
+    send_message(client1, "spectate", "Mary")
+    assert read_until(client1, "spectate_refused").data == ("Mary", "not_playing")
+
+    send_message(client1, "watch_replay", None)
+    assert read_until(client1, "spectate_refused").data == (None, "no_replay")
+
+    client1.close()
+    client2.close()
+
+
+def test_leaderboard_ranks_offline_players(tmp_path):
+    """Stored scores are ranked from the start and players stay ranked after logout."""
+    store = ScoreStore(str(tmp_path / "scores.db"))
+    store.set("Doe", 7)
+    store.close()
+
+    with GameServer("127.0.0.1", 0, data_directory=str(tmp_path)) as server:
+        client1, = login_clients(server.address, "John")
+        send_logout(client1, "John")
+        client1.close()
+
+        client2, = login_clients(server.address, "Mary")
+        send_message(client2, "fetch_leaderboard", "all")
+        best, rank, total = read_until(client2, "leaderboard").data
+
+        assert best == [("Doe", 7), ("John", 0), ("Mary", 0)]
+        assert rank == 2 and total == 3
+
+        client2.close()
+
+
+def test_startup_does_not_load_stored_scores(tmp_path):
+    """Server with a million stored players starts within a second and ranks them."""
+    path = str(tmp_path / "scores.db")
+    ScoreStore(path).close()
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            "WITH RECURSIVE ids(id) AS (SELECT 0 UNION ALL SELECT id + 1 FROM ids"
+            " WHERE id + 1 < 1000000)"
+            " INSERT INTO scores SELECT printf('player%07d', id), id % 1000 FROM ids")
+    connection.close()
+
+    start = time.perf_counter()
+    with GameServer("127.0.0.1", 0, data_directory=str(tmp_path)) as server:
+        assert time.perf_counter() - start < 1
+
+        client, = login_clients(server.address, "John")
+        send_message(client, "fetch_leaderboard", 2)
+        best, rank, total = read_until(client, "leaderboard").data
+
+        assert best == [("player0000999", 999), ("player0001999", 999)]
+        assert rank == 999001 and total == 1000001
+
+        client.close()
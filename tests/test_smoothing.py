@@ -0,0 +1,88 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from maze.maze_generator import is_valid_step
+from maze.movement import pack_path, unpack_path, OutgoingMoves
+from maze.smoothing import OpponentInterpolator, MovePredictor
+
+ARRAY = [
+    [0, 0, 0, 0, 0],
+    [0, 1, 1, 1, 0],
+    [0, 1, 0, 1, 0],
+    [0, 1, 1, 1, 0],
+    [0, 0, 0, 0, 0],
+]
+
+
+def test_opponent_is_interpolated_between_positions():
+    """Opponent is drawn between two received positions, delayed by the interpolation delay."""
+    interpolator = OpponentInterpolator((1, 1), timestamp=0.0, delay=0.1)
+    interpolator.push((2, 1), timestamp=1.0)
+
+    assert interpolator.position(0.6) == (1.5, 1.0)
+    assert interpolator.position(1.1) == (2.0, 1.0)
+
+
+def test_opponent_is_not_interpolated_through_walls():
+    """Jump to a tile which is not a neighbour is drawn immediately."""
+    interpolator = OpponentInterpolator((1, 1), timestamp=0.0, delay=0.1)
+    interpolator.push((3, 3), timestamp=1.0)
+
+    assert interpolator.position(1.0) == (3.0, 3.0)
+
+
+def test_extrapolation_stops_in_front_of_wall():
+    """Last step is continued only when the next tile is walkable."""
+    interpolator = OpponentInterpolator((1, 1), timestamp=0.0, delay=0.0)
+    interpolator.push((2, 1), timestamp=1.0)
+
+    def walkable(x, y):
+        return ARRAY[y][x] == 1
+
+    assert interpolator.position(1.05, walkable) == (2.05, 1.0)
+
+    interpolator.push((3, 1), timestamp=2.0)
+    assert interpolator.position(2.05, walkable) == (3.0, 1.0)
+
+
+def test_predicted_moves_are_replayed_after_correction():
+    """When the server corrects a move, pending moves are replayed from the corrected position."""
+    predictor = MovePredictor()
+    predictor.predict([(2, 1)])
+    predictor.predict([(3, 1), (3, 2)])
+    predictor.predict([(3, 3)])
+
+    def valid(old, new):
+        return is_valid_step(ARRAY, old, new)
+
+    assert predictor.reconcile(1, (2, 1), valid) is None
+    assert predictor.reconcile(2, (3, 1), valid) == (3, 1)
+    assert not predictor.pending_moves
+
+
+def test_path_is_spread_over_time():
+    """Steps received in one message are drawn one after another."""
+    interpolator = OpponentInterpolator((1, 1), timestamp=0.0, delay=0.0)
+    interpolator.push_path([(2, 1), (3, 1)], timestamp=10.0, step_interval=1.0)
+
+    assert interpolator.position(7.5) == (1.0, 1.0)
+    assert interpolator.position(8.5) == (1.5, 1.0)
+    assert interpolator.position(9.0) == (2.0, 1.0)
+    assert interpolator.position(9.5) == (2.5, 1.0)
+
+
+def test_steps_within_tick_are_sent_together():
+    """Steps made within one network tick are packed into one path segment."""
+    outgoing_moves = OutgoingMoves(tick_rate=10)
+    outgoing_moves.add((1, 2))
+    outgoing_moves.add((1, 3))
+
+    assert not outgoing_moves.tick(0.05)
+    assert outgoing_moves.tick(0.05)
+
+    packed_path = pack_path(outgoing_moves.take())
+    assert len(packed_path) == 4
+    assert unpack_path(packed_path) == [(1, 2), (1, 3)]
+    assert not outgoing_moves.tick(0.1)
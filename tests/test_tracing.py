@@ -0,0 +1,73 @@
+import sys
+import os
+import json
+import socket
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from communication import communication, message
+from communication.outbox import Outbox
+from monitoring.tracing import Tracer
+
+
+def test_events_are_exported_in_chrome_trace_format(tmp_path):
+    """Spans become complete events, instants keep their arguments and threads are named."""
+    tracer = Tracer("server")
+    with tracer.span("handle change_position", client="alice"):
+        tracer.instant("queue moves", sequence=3)
+
+    path = tmp_path / "trace.json"
+    tracer.write(str(path))
+    events = json.loads(path.read_text(encoding="utf-8"))["traceEvents"]
+
+    metadata = [event for event in events if event["ph"] == "M"]
+    assert {"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0,
+            "args": {"name": "server"}} in metadata
+    assert any(event["args"]["name"] == threading.current_thread().name for event in metadata)
+
+    instant, complete = [event for event in events if event["ph"] != "M"]
+    assert (instant["name"], instant["args"]) == ("queue moves", {"sequence": 3})
+    assert (complete["name"], complete["args"]) == ("handle change_position", {"client": "alice"})
+    assert complete["ts"] <= instant["ts"] <= complete["ts"] + complete["dur"]
+
+
+def test_ring_buffer_keeps_newest_events():
+    """Oldest events are dropped when the buffer is full."""
+    tracer = Tracer("client", capacity=3)
+    for index in range(5):
+        tracer.instant("step", index=index)
+
+    assert [event[5]["index"] for event in tracer.events] == [2, 3, 4]
+
+
+def test_disabled_tracer_records_nothing():
+    """Disabled tracer ignores all events."""
+    tracer = Tracer("client", enabled=False)
+    tracer.instant("step")
+    with tracer.span("draw"):
+        ...
+
+    assert not tracer.events
+
+
+def test_outbox_records_every_send():
+    """Every frame written by the outbox is recorded with its type and size."""
+    server_side, client_side = socket.socketpair()
+    client_side.settimeout(5)
+    tracer = Tracer("server")
+    sent = threading.Event()
+
+    outbox = Outbox(server_side, on_sent=lambda _: sent.set(), tracer=tracer)
+    outbox.start()
+    outbox.put(message.Message("game_state_delta", (1, {}, {})))
+
+    assert communication.load_object(client_side).info == "game_state_delta"
+    assert sent.wait(5)
+    name, phase, _, _, _, args = tracer.events[0]
+    assert (name, phase) == ("send game_state_delta", "X")
+    assert args["bytes"] == outbox.sent_bytes
+
+    outbox.close()
+    server_side.close()
+    client_side.close()
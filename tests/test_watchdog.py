@@ -0,0 +1,59 @@
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from monitoring.watchdog import HandlerWatchdog
+
+
+def blocking_handler(watchdog, release):
+    """Handler which blocks until it is released."""
+    watchdog.begin("accept_challenge", "alice")
+    try:
+        release.wait(5)
+    finally:
+        watchdog.end()
+
+
+def test_slow_handler_is_reported_once_with_its_stack():
+    """The stack of the blocked thread points to the blocking handler."""
+    reports = []
+    reported = threading.Event()
+
+    def on_slow(info, client, elapsed, stack):
+        reports.append((info, client, elapsed, stack))
+        reported.set()
+
+    watchdog = HandlerWatchdog(budget=0.05, on_slow=on_slow)
+    watchdog.start()
+
+    release = threading.Event()
+    thread = threading.Thread(target=blocking_handler, args=(watchdog, release))
+    thread.start()
+
+    assert reported.wait(5)
+    time.sleep(0.1)
+    release.set()
+    thread.join()
+    watchdog.close()
+
+    assert len(reports) == 1
+    info, client, elapsed, stack = reports[0]
+    assert (info, client) == ("accept_challenge", "alice")
+    assert elapsed > 0.05
+    assert any("blocking_handler" in line for line in stack)
+
+
+def test_fast_handlers_are_not_reported():
+    """Handlers which end within the budget are forgotten."""
+    reports = []
+    watchdog = HandlerWatchdog(budget=1, on_slow=lambda *report: reports.append(report))
+
+    watchdog.begin("heartbeat", "bob")
+    watchdog.end()
+    watchdog.check(time.perf_counter() + 10)
+
+    assert not reports
+    assert watchdog.slow_handlers == 0
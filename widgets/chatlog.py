@@ -1,3 +1,5 @@
+import time
+
 import pygame
 
 from communication import communication, message
@@ -31,17 +33,76 @@ class Chatlog:
 
         self.max_number_messages = int(self.height * (8 / 10) / (23 + 5))
         self.messages = []
+        self.max_loaded_lines = 1000
+
+        self.scroll_offset = 0
+        self.history_cursor = None
+        self.history_requested_at = None
+        self.history_page_size = 20
 
         self.private_messages = []
 
         self.set_messages(config.public_messages)
 
-    def set_messages(self, mess):
+    def set_messages(self, mess, history_cursor=None):
+        """
+        Sets the messages for the chatlog. history_cursor points to older messages,
+        which are fetched from the server when the user scrolls to the top.
+        """
+        self.messages = [line for text in mess for line in self.wrap_text(text)]
+        self.history_cursor = history_cursor
+        self.history_requested_at = None
+        self.scroll_offset = 0
+
+    def prepend_history(self, page):
+        """
+        Adds the page of older messages received from the server above the loaded messages.
+        A page which was not requested, e.g. the second answer to a repeated request, is ignored.
+        """
+        if self.history_requested_at is None:
+            return
+
+        older_messages, self.history_cursor = page
+        self.history_requested_at = None
+
+        lines = [line for text in older_messages for line in self.wrap_text(text)]
+        self.messages = lines + self.messages
+
+    def max_scroll_offset(self):
+        """
+        Returns how many lines can the chatlog be scrolled up.
+        """
+        return max(0, len(self.messages) - self.max_number_messages)
+
+    def scroll(self, lines):
         """
-        Sets the messages for the chatlog, limiting the number of messages to max_number_messages.
+        Scrolls the chatlog, positive number of lines scrolls to older messages.
+        When the top is reached, older messages are requested from the server.
         """
-        self.messages = mess[-self.max_number_messages:] if self.max_number_messages <= len(
-            config.public_messages) else mess
+        self.scroll_offset = min(max(0, self.scroll_offset + lines), self.max_scroll_offset())
+
+        if lines > 0 and self.scroll_offset == self.max_scroll_offset():
+            self.fetch_history()
+
+    def fetch_history(self):
+        """
+        Requests the page of messages older than the oldest loaded one. The request
+        is repeated when the page has not arrived within HISTORY_REQUEST_TIMEOUT.
+        """
+        if self.history_cursor is None or len(self.messages) >= self.max_loaded_lines:
+            return
+
+        if self.history_requested_at is not None and \
+                time.monotonic() - self.history_requested_at < config.HISTORY_REQUEST_TIMEOUT:
+            return
+
+        self.history_requested_at = time.monotonic()
+
+        request = message.Message()
+        request.info = "fetch_history"
+        request.data = (self.history_cursor, self.history_page_size)
+
+        communication.send_object(request, config.client)
 
     def draw(self, screen):
         """
@@ -55,7 +116,8 @@ class Chatlog:
                                                      self.start_x, self.end_y - self.start_y),
                              width=3)
 
-        messages_to_draw = self.messages
+        end = len(self.messages) - self.scroll_offset
+        messages_to_draw = self.messages[max(0, end - self.max_number_messages):end]
         if self.is_independent:
             messages_to_draw = self.private_messages
             title_text = self.title_font.render("Chat", True, (0, 0, 0))
@@ -74,9 +136,23 @@ class Chatlog:
     def handle_event(self, event):
         """
         Handles events such as mouse clicks and key presses for the chatlog and entry.
+        Mouse wheel over the public chatlog scrolls through the history.
         """
         self.entry.handle_event(event)
 
+        if self.is_independent or event.type != pygame.MOUSEBUTTONDOWN:
+            return
+
+        mouse_x, mouse_y = event.pos
+        if not (self.start_x <= mouse_x <= self.end_x and self.start_y <= mouse_y <= self.end_y):
+            return
+
+        if event.button == 4:
+            self.scroll(3)
+
+        elif event.button == 5:
+            self.scroll(-3)
+
     def add_message(self, received_message, private=False):
         """
         Adds a received message to the chatlog, either as a public or private message.
@@ -95,8 +171,13 @@ class Chatlog:
             for line in wrapped_message:
                 self.messages.append(line)
 
-            while len(self.messages) > self.max_number_messages:
-                self.messages.pop(0)
+            if self.scroll_offset > 0:
+                self.scroll_offset += len(wrapped_message)
+
+            if len(self.messages) > self.max_loaded_lines:
+                del self.messages[:len(self.messages) - self.max_loaded_lines]
+                self.history_cursor = None
+                self.scroll_offset = min(self.scroll_offset, self.max_scroll_offset())
 
     def send_message(self):
         """
@@ -0,0 +1,186 @@
+"""
+    This module draws the performance overlay of the client.
+    The scene manager adds the time spent in every phase of the frame, the overlay
+    keeps the last frames and shows FPS, the times of the phases, inbound messages
+    and the link quality together with a graph of the frame times.
+"""
+
+import collections
+import time
+
+import pygame
+
+import config
+
+PHASES = ("handle_event", "dispatch", "update", "draw", "display")
+PHASE_COLORS = {
+    "handle_event": (255, 140, 0),
+    "dispatch": (200, 0, 200),
+    "update": (0, 200, 255),
+    "draw": (0, 220, 0),
+    "display": (255, 255, 0),
+}
+TARGET_FRAME_TIME = 1 / 60
+
+
+class PerfOverlay:
+    """Toggleable panel with frame timings, drawn over the current scene."""
+
+    def __init__(self, history=120, refresh_interval=0.25, bar_width=2, graph_height=60,
+                 graph_range=2 * TARGET_FRAME_TIME):
+        """
+        Initializes the hidden overlay which keeps the phase times of the last history frames.
+        The text is rendered again every refresh_interval seconds, the graph shows
+        frame times up to graph_range seconds.
+        """
+        self.visible = False
+        self.refresh_interval = refresh_interval
+        self.bar_width = bar_width
+        self.graph_range = graph_range
+
+        self.frames = collections.deque(maxlen=history)
+        self.current = dict.fromkeys(PHASES, 0)
+        self.last_frame_end = None
+
+        self.received_at_refresh = (time.perf_counter(), 0)
+        self.inbound_rate = 0
+        self.last_refresh = 0
+
+        self.font = pygame.font.Font(None, 20)
+        self.lines = []
+        self.graph = pygame.Surface((history * bar_width, graph_height))
+        self.panel = None
+
+    def toggle(self):
+        """
+        Shows or hides the overlay.
+        """
+        self.visible = not self.visible
+        if self.visible:
+            self.last_refresh = 0
+            self.rebuild_graph()
+
+    def add_time(self, phase, seconds):
+        """
+        Adds the time spent in the phase to the current frame.
+        """
+        self.current[phase] += seconds
+
+    def end_frame(self, now=None):
+        """
+        Stores the phase times of the finished frame and starts the next one.
+        """
+        now = time.perf_counter() if now is None else now
+        interval = now - self.last_frame_end if self.last_frame_end is not None else 0
+        self.last_frame_end = now
+
+        frame = (interval, tuple(self.current[phase] for phase in PHASES))
+        self.frames.append(frame)
+        self.current = dict.fromkeys(PHASES, 0)
+
+        if self.visible:
+            self.graph.scroll(dx=-self.bar_width)
+            self.draw_bar(self.graph.get_width() - self.bar_width, frame[1])
+
+            if now - self.last_refresh >= self.refresh_interval:
+                self.refresh(now)
+
+    def stats(self):
+        """
+        Returns FPS, average and maximal frame time and average time of every phase
+        over the stored frames, in seconds.
+        """
+        intervals = [interval for interval, _ in self.frames if interval > 0]
+        phase_times = [sum(times[index] for _, times in self.frames) / len(self.frames)
+                       if self.frames else 0 for index in range(len(PHASES))]
+
+        return {
+            "fps": len(intervals) / sum(intervals) if intervals else 0,
+            "frame_avg": sum(intervals) / len(intervals) if intervals else 0,
+            "frame_max": max(intervals, default=0),
+            "phases": dict(zip(PHASES, phase_times)),
+        }
+
+    def measure_inbound_rate(self, now):
+        """
+        Computes the number of messages received per second since the previous refresh.
+        """
+        received = config.inbox.received if config.inbox is not None else 0
+        last_time, last_received = self.received_at_refresh
+        if now > last_time:
+            self.inbound_rate = (received - last_received) / (now - last_time)
+        self.received_at_refresh = (now, received)
+
+    def refresh(self, now):
+        """
+        Renders the lines of text with the current statistics.
+        """
+        self.last_refresh = now
+        self.measure_inbound_rate(now)
+
+        stats = self.stats()
+        link = config.latency.estimator.stats()
+        depth = config.inbox.depth() if config.inbox is not None else 0
+        max_depth = config.inbox.max_depth if config.inbox is not None else 0
+
+        texts = [
+            (f"FPS {stats['fps']:.1f}  frame {stats['frame_avg'] * 1000:.1f} ms "
+             f"(max {stats['frame_max'] * 1000:.1f})", config.WHITE),
+            *((f"{phase} {seconds * 1000:.2f} ms", PHASE_COLORS[phase])
+              for phase, seconds in stats["phases"].items()),
+            (f"in {self.inbound_rate:.1f} msg/s  inbox {depth} (max {max_depth})", config.WHITE),
+            (f"RTT {link['rtt'] * 1000:.1f} ms  jitter {link['jitter'] * 1000:.1f} ms",
+             config.WHITE),
+        ]
+        self.lines = [self.font.render(text, True, color) for text, color in texts]
+
+        height = sum(line.get_height() for line in self.lines) + self.graph.get_height() + 15
+        self.panel = pygame.Surface((self.graph.get_width() + 10, height), pygame.SRCALPHA)
+
+    def draw_bar(self, x, times):
+        """
+        Draws one frame into the graph as a bar stacked from the times of phases.
+        """
+        height = self.graph.get_height()
+        self.graph.fill((0, 0, 0), (x, 0, self.bar_width, height))
+
+        bottom = height
+        for phase, seconds in zip(PHASES, times):
+            bar_height = int(seconds / self.graph_range * height)
+            if bar_height <= 0:
+                continue
+            bar_height = min(bar_height, bottom)
+            bottom -= bar_height
+            self.graph.fill(PHASE_COLORS[phase], (x, bottom, self.bar_width, bar_height))
+
+        target_y = height - int(TARGET_FRAME_TIME / self.graph_range * height)
+        self.graph.fill(config.RED, (x, target_y, self.bar_width, 1))
+
+    def rebuild_graph(self):
+        """
+        Draws the whole graph from the stored frames.
+        """
+        self.graph.fill((0, 0, 0))
+        offset = self.graph.get_width() - len(self.frames) * self.bar_width
+        for index, (_, times) in enumerate(self.frames):
+            self.draw_bar(offset + index * self.bar_width, times)
+
+    def draw(self, screen):
+        """
+        Draws the overlay in the top left corner when it is visible.
+        """
+        if not self.visible:
+            return
+
+        if self.panel is None:
+            self.refresh(time.perf_counter())
+
+        self.panel.fill((0, 0, 0, 180))
+        screen.blit(self.panel, (5, 5))
+
+        y = 10
+        for line in self.lines:
+            screen.blit(line, (10, y))
+            y += line.get_height()
+
+        screen.blit(self.graph, (10, y + 5))